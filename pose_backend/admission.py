@@ -0,0 +1,199 @@
+"""
+admission.py
+
+准入控制與降載：免費方案主機（512MB、共享 CPU）遇到突發流量時，不再接受所有新的 session_id 與 /api/pose 上傳，
+而是依記憶體與 CPU 預算拒絕新的工作、讓既有 session 降級，避免所有人一起逾時。
+
+預算
+- 記憶體：程序 RSS 超過 memory_budget_mb → 拒絕新 session 與 /api/pose；
+  超過「啟動基準 + degrade_headroom_mb」→ 降級。基準在啟動時（模型與 Pose 載入後）由 calibrate() 量測，
+  所以閒置時 RSS 本來就接近預算的部署不會一直處於降級；校正前只以 memory_budget_mb 判斷
+- CPU：沿用 backpressure.py 的 pressure（排隊數 / concurrency、處理時間 / 目標時間）；
+  ≥ degrade_pressure 降級，≥ shed_pressure 拒絕新 session
+- 數量：活躍 session（idle_seconds 內有送幀）最多 max_sessions 個；排隊 + 處理中的 /api/pose 最多 max_pending_pose 個
+
+狀態（GET /api/metrics 的 admission.state）
+    normal    全部正常處理
+    degraded  既有 session 略過 ML、只做圓背偵測（回應 path = "degraded"，ML 欄位沿用上一次結果）
+    shedding  另外以 503 + Retry-After 拒絕新 session 與 /api/pose；既有 session 仍降級處理
+session 數達上限時只拒絕新 session，不影響既有 session。
+
+閒置超過 idle_seconds 的 session 會從活躍名單移除，並呼叫 on_expire 釋放它在程序內的狀態。
+"""
+import os
+import math
+import time
+import resource
+from collections import OrderedDict
+
+ADMISSION = {
+    "enabled": os.environ.get("ADMISSION", "1") != "0",
+    "memory_budget_mb": float(os.environ.get("ADMISSION_MEMORY_MB", 450)),   # Render free：512MB
+    "degrade_headroom_mb": float(os.environ.get("ADMISSION_DEGRADE_HEADROOM_MB", 64)),  # 啟動基準之上可用的記憶體
+    "degrade_pressure": float(os.environ.get("ADMISSION_DEGRADE_PRESSURE", 2.0)),
+    "shed_pressure": float(os.environ.get("ADMISSION_SHED_PRESSURE", 4.0)),
+    "max_sessions": int(os.environ.get("ADMISSION_MAX_SESSIONS", 100)),
+    "max_pending_pose": int(os.environ.get("ADMISSION_MAX_POSE", 2 * (os.cpu_count() or 1))),
+    "idle_seconds": float(os.environ.get("ADMISSION_IDLE_SECONDS", 120)),
+    "retry_after_seconds": 5,
+    "max_retry_after_seconds": 60,
+    "rss_interval": 0.5,                  # RSS 讀取快取秒數
+}
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_mb():
+    """目前程序的常駐記憶體（MB）；非 Linux 退回最高使用量"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Admission:
+    """除 degraded() 外都在事件迴圈上呼叫（單一執行緒），不需要鎖"""
+
+    def __init__(self, monitor, config=ADMISSION, on_expire=None):
+        self.monitor = monitor
+        self.config = config
+        self.on_expire = on_expire
+        self.sessions = OrderedDict()          # session_id → 最後送幀時間，最舊的在前
+        self.pending_pose = 0
+        self.counters = {"refused_sessions": 0, "refused_pose": 0, "degraded_frames": 0, "expired_sessions": 0}
+        self._rss = 0.0
+        self._rss_at = 0.0
+        self.baseline_mb = None
+
+    def calibrate(self):
+        """記錄啟動基準 RSS（模型與 Pose 載入後呼叫）；基準已超過預算時提醒"""
+        self.baseline_mb = rss_mb()
+        if self.baseline_mb >= self.config["memory_budget_mb"]:
+            print(f"⚠️ Admission: baseline RSS {self.baseline_mb:.0f}MB already exceeds "
+                  f"ADMISSION_MEMORY_MB={self.config['memory_budget_mb']:.0f}; new sessions will be refused")
+        return self.baseline_mb
+
+    def degrade_memory_mb(self):
+        budget = self.config["memory_budget_mb"]
+        if self.baseline_mb is None:
+            return budget
+        return min(self.baseline_mb + self.config["degrade_headroom_mb"], budget)
+
+    def memory_mb(self):
+        now = time.monotonic()
+        if now - self._rss_at >= self.config["rss_interval"]:
+            self._rss, self._rss_at = rss_mb(), now
+        return self._rss
+
+    def state(self):
+        if not self.config["enabled"]:
+            return "normal"
+        config = self.config
+        memory = self.memory_mb()
+        pressure = self.monitor.pressure()
+        if memory >= config["memory_budget_mb"] or pressure >= config["shed_pressure"]:
+            return "shedding"
+        if memory >= self.degrade_memory_mb() or pressure >= config["degrade_pressure"]:
+            return "degraded"
+        return "normal"
+
+    def degraded(self):
+        """既有 session 是否略過 ML（在 threadpool 中呼叫；計數器只供觀察，不需精確）"""
+        if self.state() == "normal":
+            return False
+        self.counters["degraded_frames"] += 1
+        return True
+
+    def retry_after(self):
+        """依壓力放大建議的重試秒數"""
+        load = max(1.0, self.monitor.pressure() / self.config["shed_pressure"])
+        return min(int(math.ceil(self.config["retry_after_seconds"] * load)), self.config["max_retry_after_seconds"])
+
+    # ---------- session ----------
+    def _expire(self, now):
+        cutoff = now - self.config["idle_seconds"]
+        while self.sessions:
+            session, last_seen = next(iter(self.sessions.items()))
+            if last_seen >= cutoff:
+                break
+            del self.sessions[session]
+            self.counters["expired_sessions"] += 1
+            if self.on_expire is not None:
+                self.on_expire(session)
+
+    def admit_session(self, session_id):
+        """已在活躍名單內的 session 一律放行；新 session 在超出預算時拒絕。回傳是否放行"""
+        now = time.monotonic()
+        self._expire(now)
+        if session_id in self.sessions:
+            self.sessions[session_id] = now
+            self.sessions.move_to_end(session_id)
+            return True
+        if self.config["enabled"] and (len(self.sessions) >= self.config["max_sessions"]
+                                       or self.state() == "shedding"):
+            self.counters["refused_sessions"] += 1
+            return False
+        self.sessions[session_id] = now
+        return True
+
+    # ---------- /api/pose ----------
+    def admit_pose(self):
+        if self.config["enabled"] and (self.pending_pose >= self.config["max_pending_pose"]
+                                       or self.state() == "shedding"):
+            self.counters["refused_pose"] += 1
+            return False
+        return True
+
+    def snapshot(self):
+        config = self.config
+        return {
+            "enabled": config["enabled"],
+            "state": self.state(),
+            "active_sessions": len(self.sessions),
+            "max_sessions": config["max_sessions"],
+            "pending_pose": self.pending_pose,
+            "max_pending_pose": config["max_pending_pose"],
+            "memory_mb": round(self.memory_mb(), 1),
+            "memory_budget_mb": config["memory_budget_mb"],
+            "baseline_memory_mb": None if self.baseline_mb is None else round(self.baseline_mb, 1),
+            "degrade_memory_mb": round(self.degrade_memory_mb(), 1),
+            "pressure": round(self.monitor.pressure(), 2),
+            "degrade_pressure": config["degrade_pressure"],
+            "shed_pressure": config["shed_pressure"],
+            "retry_after": self.retry_after(),
+            **self.counters,
+        }
+
+
+async def _refuse(send, retry_after, error):
+    body = ('{"success":false,"error":"%s","retry_after":%d}' % (error, retry_after)).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [(b"content-type", b"application/json"), (b"retry-after", str(retry_after).encode()),
+                    (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class PoseAdmissionMiddleware:
+    """純 ASGI middleware：/api/pose 在讀取上傳內容前就判斷是否放行，並計算排隊 + 處理中的數量"""
+
+    def __init__(self, app, admission, paths=("/api/pose",)):
+        self.app = app
+        self.admission = admission
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        if not self.admission.admit_pose():
+            await _refuse(send, self.admission.retry_after(), "server busy")
+            return
+        self.admission.pending_pose += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.admission.pending_pose -= 1
@@ -1,3 +1,4 @@
+import thread_budget  # 須在 numpy / sklearn 之前 import，BLAS 執行緒數的環境變數才會生效
 from fastapi import FastAPI
 from fastapi.requests import Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -9,18 +10,62 @@ from io import BytesIO
 from PIL import Image
 import mediapipe as mp
 import os
-from collections import deque
+import time
+from collections import deque, namedtuple
 import math
+import json
+import asyncio
+from rep_segmenter import new_rep_state, update_rep, rep_summary, finish_rep
+from frame_gate import FRAME_GATING, new_gate_state, gate_frame, remember_response
+import session_recorder
+from backpressure import BACKPRESSURE, load_monitor, InflightMiddleware
+from session_lock import session_locks
+from session_store import SESSION_STORE, create_store
+from admission import ADMISSION, Admission, PoseAdmissionMiddleware
+from delta_response import new_delta_state, encode as encode_delta
+from session_analytics import new_session_stats, update_session_stats, session_summary
+from feature_history import FEATURE_HISTORY, TIER_COLUMNS, FeatureHistory
+from deadlift_model import DeadliftFeatureExtractor, load_ml_model
+from starlette.concurrency import run_in_threadpool
 
 app = FastAPI(title="Pose Detection API (Back Angle with Spine Offset + ML Prediction)")
 
+# orjson 為選用：有安裝時 /predict 與 /api/pose 的回應改用 orjson 序列化
+try:
+    import orjson  # type: ignore
+    HAVE_ORJSON = True
+except Exception:
+    HAVE_ORJSON = False
+
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    """直接序列化回應 dict（略過 FastAPI 的 jsonable_encoder）；orjson 不可用時退回緊湊格式的標準 json"""
+    def render(self, content) -> bytes:
+        if HAVE_ORJSON:
+            return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+# 准入控制（見 admission.py）：/api/pose 超出預算時回 503；加在 CORS 內層，拒絕的回應也帶 CORS 標頭
+admission = Admission(load_monitor)
+app.add_middleware(PoseAdmissionMiddleware, admission=admission)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
+# 計算排隊中的 /predict 數，供送幀間隔建議使用（見 backpressure.py）
+app.add_middleware(InflightMiddleware, monitor=load_monitor)
 
 # =====================================
 # 🏥 運動醫學級圓背偵測閾值
@@ -46,6 +91,28 @@ DEADLIFT_DETECTION = {
 # 用戶圓背偵測狀態（每個 session 獨立）
 user_spine_state = {}
 
+# ML 推論模式：
+#   "window" — 30 幀滑動視窗，視窗滿後每幀推論（預設；與模型的訓練資料一致）
+#   "rep"    — 依髖角切分每一下硬舉，完成一下才推論一次（見 rep_segmenter.py）；
+#              模型以 30 幀視窗訓練，整下的聚合特徵尚未驗證準確率，需明確開啟
+ML_INFERENCE_MODE = os.environ.get("ML_INFERENCE_MODE", "window")
+
+# 用戶 rep 切分狀態（每個 session 獨立）
+user_rep_state = {}
+
+# 靜止 / 低可見度閘門（見 frame_gate.py）；FRAME_GATING=0 關閉
+FRAME_GATING["enabled"] = os.environ.get("FRAME_GATING", "1") != "0"
+user_gate_state = {}
+
+# 差異回應的 seq 與最近幾幀回應（只存在程序內）
+user_delta_state = {}
+
+# 訓練摘要的串流累加器（見 session_analytics.py）
+user_analytics = {}
+
+# 每秒 / 每下 / 每組的特徵歷史（見 feature_history.py，只存在程序內）
+user_history = {}
+
 mp_pose = mp.solutions.pose
 # lazy initialize MediaPipe Pose to avoid loading binary resources at import time
 pose = None
@@ -58,33 +125,19 @@ mlb = None
 ML_MODEL_LOADED = False
 
 def init_ml_model():
-    """延遲載入 ML 模型"""
+    """延遲載入 ML 模型（模型檔搜尋順序與載入見 deadlift_model.py）"""
     global clf, mlb, ML_MODEL_LOADED
     if ML_MODEL_LOADED:
         return True
     
     try:
-        import joblib
-        # 嘗試多個可能的路徑
-        possible_paths = [
-            "deadlift_rf_model.pkl",  # 同目錄
-            "../video_analysis/deadlift_rf_model.pkl",  # 相對路徑
-            "/app/video_analysis/deadlift_rf_model.pkl",  # Docker 路徑
-            os.path.join(os.path.dirname(__file__), "deadlift_rf_model.pkl"),
-        ]
-        
-        model_path = None
-        for path in possible_paths:
-            if os.path.exists(path):
-                model_path = path
-                break
-        
-        if model_path is None:
+        loaded = load_ml_model()
+        if loaded is None:
             print("⚠️ ML model not found, /predict will be unavailable")
             return False
-        
-        clf = joblib.load(model_path)
-        mlb = joblib.load(model_path.replace("deadlift_rf_model.pkl", "label_binarizer.pkl"))
+        model, binarizer, model_path = loaded
+        clf = thread_budget.configure_model(model)
+        mlb = binarizer
         ML_MODEL_LOADED = True
         print(f"✅ ML model loaded from {model_path}")
         return True
@@ -95,6 +148,36 @@ def init_ml_model():
 # 每位使用者的 frame window
 user_windows = {}
 
+# session 狀態後端（見 session_store.py）：memory 時 user_* dict 本身就是狀態；
+# sqlite 時每幀從共用儲存載入、處理完寫回，多個 worker 程序可接續同一個 session
+session_store = create_store()
+
+
+def _drop_session(session):
+    """
+    閒置 session 的程序內狀態（由 admission 在 session 過期時於事件迴圈上呼叫）
+
+    與 /predict 一樣先在事件迴圈上取號，排在該 session 已到達的幀之後；清除在 threadpool 中持有順序鎖時進行，
+    不會和處理中的 _predict_session 同時改寫，也不會阻塞事件迴圈
+    """
+    ticket = session_locks.ticket(session)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _drop_session_locked(session, ticket)
+        return
+    loop.run_in_executor(None, _drop_session_locked, session, ticket)
+
+
+def _drop_session_locked(session, ticket):
+    with session_locks.hold(ticket):
+        for state in (user_spine_state, user_windows, user_rep_state, user_gate_state, user_delta_state,
+                      user_analytics, user_history):
+            state.pop(session, None)
+
+
+admission.on_expire = _drop_session
+
 # =====================================
 # 輸入格式（前端 Mediapipe 33 個 landmarks）
 # =====================================
@@ -106,53 +189,41 @@ class Landmark(BaseModel):
 
 class FrameData(BaseModel):
     session_id: str
-    landmarks: List[Landmark]
+    landmarks: Optional[List[Landmark]] = None
+    timestamp: Optional[float] = None  # 客戶端時間戳（秒），用於 rep 時長；未提供時使用伺服器時間
+    # 精簡格式：points = [x, y, z, visibility, x, y, ...] 扁平陣列；
+    # indices 為每組四個值對應的 landmark 編號（省略時視為 0..32 依序）
+    points: Optional[List[float]] = None
+    indices: Optional[List[int]] = None
+    # 差異回應（見 delta_response.py）：delta=true 時只回傳與 ack（最後套用的 seq）相比有變動的欄位
+    delta: bool = False
+    ack: Optional[int] = None
+
+
+# /predict 實際用到的 landmarks（圓背偵測 + ML 特徵 + 閘門），客戶端可只送這些（見 GET /predict/schema）
+PREDICT_LANDMARKS = [0, 7, 11, 12, 15, 16, 23, 24, 25, 26, 27, 28]
+
+CompactLandmark = namedtuple("CompactLandmark", ["x", "y", "z", "visibility"])
+MISSING_LANDMARK = CompactLandmark(0.0, 0.0, 0.0, 0.0)
 
-# =====================================
-# ML 特徵萃取器
-# =====================================
-class DeadliftFeatureExtractor:
-    def dist(self, a, b):
-        return np.sqrt((a[0] - b[0])**2 + (a[1] - b[1])**2)
-
-    def calculate_angle(self, a, b, c):
-        a, b, c = np.array(a), np.array(b), np.array(c)
-        ba, bc = a - b, c - b
-        cos_angle = np.dot(ba, bc) / ((np.linalg.norm(ba)*np.linalg.norm(bc)) + 1e-7)
-        return np.degrees(np.arccos(np.clip(cos_angle, -1.0, 1.0)))
-
-    def extract_frame_features(self, lm):
-        shoulder_c = np.mean([lm['left_shoulder'], lm['right_shoulder']], axis=0)
-        hip_c = np.mean([lm['left_hip'], lm['right_hip']], axis=0)
-        knee_c = np.mean([lm['left_knee'], lm['right_knee']], axis=0)
-        ankle_c = np.mean([lm['left_ankle'], lm['right_ankle']], axis=0)
-        wrist_c = np.mean([lm['left_wrist'], lm['right_wrist']], axis=0)
-
-        torso_len = self.dist(shoulder_c, hip_c)
-        if torso_len == 0: torso_len = 1.0
-
-        spine_angle = self.calculate_angle(lm['left_ear'], shoulder_c, hip_c)
-        hip_angle = self.calculate_angle(shoulder_c, hip_c, knee_c)
-        knee_angle = self.calculate_angle(hip_c, knee_c, ankle_c)
-        torso_angle = self.calculate_angle([hip_c[0], hip_c[1]-0.5], hip_c, shoulder_c)
-
-        head_shoulder_ratio = self.dist(lm['left_ear'], shoulder_c) / torso_len
-
-        vec_sh_hip = (shoulder_c - hip_c) / torso_len
-        vec_hip_knee = (hip_c - knee_c) / torso_len
-        vec_ear_sh = (lm['left_ear'] - shoulder_c) / torso_len
-        vec_wrist_ankle = (wrist_c - ankle_c) / torso_len
-
-        return [
-            spine_angle, hip_angle, knee_angle, torso_angle,
-            head_shoulder_ratio,
-            0.0,
-            vec_sh_hip[0], vec_sh_hip[1],
-            vec_hip_knee[0], vec_hip_knee[1],
-            vec_ear_sh[0], vec_ear_sh[1],
-            vec_wrist_ankle[0], vec_wrist_ankle[1]
-        ]
 
+def frame_landmarks(data: FrameData):
+    """
+    兩種請求格式 → 33 個可用 .x / .y / .z / .visibility 存取的點
+    精簡格式未送的 landmark 以 visibility 0 補位；格式錯誤回傳 None
+    """
+    if data.points is None:
+        return data.landmarks
+    points = data.points
+    indices = data.indices if data.indices is not None else range(len(points) // 4)
+    if len(points) != 4 * len(indices) or any(not 0 <= i < 33 for i in indices):
+        return None
+    landmarks = [MISSING_LANDMARK] * 33
+    for k, i in enumerate(indices):
+        landmarks[i] = CompactLandmark(points[4 * k], points[4 * k + 1], points[4 * k + 2], points[4 * k + 3])
+    return landmarks
+
+# ML 特徵萃取器（見 deadlift_model.py，與 /jobs 的分析 worker 共用）
 extractor = DeadliftFeatureExtractor()
 
 
@@ -343,6 +414,119 @@ def ping():
     return {"ok": True}
 
 
+@app.get("/api/metrics")
+def metrics():
+    """負載與降載狀態：admission.state 為 normal / degraded / shedding"""
+    recorder = session_recorder.get_recorder()
+    return {
+        "admission": admission.snapshot(),
+        "load": {
+            "inflight": load_monitor.inflight,
+            "service_ms": round(load_monitor.service_ms, 2),
+            "pressure": round(load_monitor.pressure(), 2),
+        },
+        "sessions_in_memory": len(user_spine_state),
+        "session_store": SESSION_STORE["backend"],
+        "recorder": recorder.stats() if recorder is not None else None,
+        "threads": thread_budget.report(clf),
+    }
+
+
+async def _in_session_order(session_id, func, *args):
+    """
+    與 /predict 相同：在事件迴圈上依到達順序取號，再到 threadpool 執行 func(ticket, *args)（func 內持有順序鎖）；
+    排隊中的請求不會先佔住 threadpool 的執行緒才開始取號
+    """
+    ticket = session_locks.ticket(session_id)
+    try:
+        return await run_in_threadpool(func, ticket, *args)
+    except BaseException:
+        session_locks.abandon(ticket)
+        raise
+
+
+@app.get("/session/{session_id}/summary")
+async def get_session_summary(session_id: str):
+    """訓練摘要：次數、各脊椎狀態的時間、最大曲率、每一下的 ML 標籤次數"""
+    return await _in_session_order(session_id, _session_summary, session_id)
+
+
+def _session_summary(ticket, session_id):
+    with session_locks.hold(ticket):
+        if session_store.shared:
+            state, _ = session_store.load(session_id)
+            stats = state.get("analytics") if state else None
+        else:
+            stats = user_analytics.get(session_id)
+        summary = session_summary(stats) if stats is not None else None
+    if summary is None:
+        return JSONResponse({"success": False, "error": "session not found"}, status_code=404)
+    return FastJSONResponse({"success": True, "session_id": session_id, **summary})
+
+
+def _history_unavailable():
+    """特徵歷史只存在程序內、不進 SESSION_STORE；共用狀態後端下各 worker 只看得到部分的幀，不提供"""
+    if session_store.shared:
+        return JSONResponse({"success": False, "error": "feature history is not available with SESSION_STORE="
+                             f"{SESSION_STORE['backend']}; use the memory store with router.py session affinity"},
+                            status_code=501)
+    return None
+
+
+@app.get("/session/{session_id}/history")
+async def get_session_history(session_id: str, tier: str = "rep", last: Optional[int] = None):
+    """特徵歷史的原始列：tier = second / rep / set，last 為最近幾列"""
+    unavailable = _history_unavailable()
+    if unavailable is not None:
+        return unavailable
+    if tier not in TIER_COLUMNS:
+        return JSONResponse({"success": False, "error": f"tier must be one of {list(TIER_COLUMNS)}"}, status_code=400)
+    return await _in_session_order(session_id, _session_history, session_id, tier, last)
+
+
+def _session_history(ticket, session_id, tier, last):
+    with session_locks.hold(ticket):
+        history = user_history.get(session_id)
+        if history is not None:
+            rows = history.rows(tier, last)
+            current_set = history.current_set()
+    if history is None:
+        return JSONResponse({"success": False, "error": "session not found"}, status_code=404)
+    return FastJSONResponse({"success": True, "session_id": session_id, "tier": tier,
+                             "columns": TIER_COLUMNS[tier], "rows": rows, "current_set": current_set})
+
+
+@app.get("/session/{session_id}/trends")
+async def get_session_trends(session_id: str, tier: str = "rep", last: Optional[int] = None):
+    """各特徵對時間 / 次數 / 組數的斜率；rep 層 peak_curvature 斜率 > 0 表示越做越彎"""
+    unavailable = _history_unavailable()
+    if unavailable is not None:
+        return unavailable
+    if tier not in TIER_COLUMNS:
+        return JSONResponse({"success": False, "error": f"tier must be one of {list(TIER_COLUMNS)}"}, status_code=400)
+    return await _in_session_order(session_id, _session_trends, session_id, tier, last)
+
+
+def _session_trends(ticket, session_id, tier, last):
+    with session_locks.hold(ticket):
+        history = user_history.get(session_id)
+        trends = history.trends(tier, last) if history is not None else None
+    if trends is None:
+        return JSONResponse({"success": False, "error": "session not found"}, status_code=404)
+    return FastJSONResponse({"success": True, "session_id": session_id, **trends})
+
+
+@app.get("/predict/schema")
+def predict_schema():
+    """精簡請求格式說明：客戶端可只送 required_indices 內的 landmarks"""
+    return {
+        "required_indices": PREDICT_LANDMARKS,
+        "fields": ["x", "y", "z", "visibility"],
+        "formats": ["landmarks", "points"],
+        "orjson": HAVE_ORJSON,
+    }
+
+
 try:
     import multipart  # type: ignore
     HAVE_MULTIPART = True
@@ -354,7 +538,7 @@ def _build_error_response(msg: str):
     return JSONResponse({"success": False, "error": msg})
 
 
-def _process_frame_and_respond(frame: np.ndarray, w: int, h: int):
+def _process_frame_and_respond(frame: np.ndarray, w: int, h: int, compact: bool = False):
     results = pose.process(frame)
     if not results.pose_landmarks:
         return JSONResponse({"success": False, "message": "No person detected"})
@@ -397,28 +581,38 @@ def _process_frame_and_respond(frame: np.ndarray, w: int, h: int):
     back_s = int(round(ema("back", back)))
 
     fb_text, fb_level = feedback_rule(knee_s, hip_s, back_s)
-    keypoints = [xy01(i) for i in range(len(lm))]
-
     # === 新增控制點 ===
-    keypoints.extend([
-        {"id": 101, "x": shoulder_center[0] / w, "y": shoulder_center[1] / h, "score": 1.0},
-        {"id": 102, "x": spine_center[0] / w, "y": spine_center[1] / h, "score": 1.0},
-        {"id": 103, "x": hip_center[0] / w, "y": hip_center[1] / h, "score": 1.0},
-    ])
+    control_points = [
+        (101, shoulder_center[0] / w, shoulder_center[1] / h),
+        (102, spine_center[0] / w, spine_center[1] / h),
+        (103, hip_center[0] / w, hip_center[1] / h),
+    ]
 
-    return {
+    response = {
         "success": True,
         "angles": {"knee": knee_s, "hip": hip_s, "back": back_s},
-        "keypoints": keypoints,
         "feedback": {"text": fb_text, "level": fb_level}
     }
+    if compact:
+        # 精簡格式：keypoints 為 [x, y, score] 陣列，id 另列於 keypoint_ids
+        response["keypoint_ids"] = list(range(len(lm))) + [cid for cid, _, _ in control_points]
+        response["keypoints"] = (
+            [[round(lm[i].x, 4), round(lm[i].y, 4), round(lm[i].visibility, 3)] for i in range(len(lm))]
+            + [[round(x, 4), round(y, 4), 1.0] for _, x, y in control_points]
+        )
+    else:
+        response["keypoints"] = [xy01(i) for i in range(len(lm))] + [
+            {"id": cid, "x": x, "y": y, "score": 1.0} for cid, x, y in control_points
+        ]
+    return FastJSONResponse(response)
 
 
 if HAVE_MULTIPART:
     from fastapi import UploadFile
 
     @app.post("/api/pose")
-    async def detect_pose(file: UploadFile):
+    async def detect_pose(file: UploadFile, format: Optional[str] = None):
+        """format=compact 時 keypoints 以 [x, y, score] 陣列回傳"""
         try:
             img = Image.open(BytesIO(await file.read())).convert("RGB")
             frame = np.array(img)
@@ -429,7 +623,7 @@ if HAVE_MULTIPART:
             except RuntimeError as e:
                 return JSONResponse({"success": False, "error": str(e)})
 
-            return _process_frame_and_respond(frame, w, h)
+            return _process_frame_and_respond(frame, w, h, compact=format == "compact")
         except Exception as e:
             return JSONResponse({"success": False, "error": str(e)})
 else:
@@ -442,7 +636,7 @@ else:
 # 🤖 ML 預測端點：30 幀滑動窗口 + Random Forest 分類 + 圓背偵測
 # ================================================================
 @app.post("/predict")
-def predict(data: FrameData):
+async def predict(data: FrameData):
     """
     接收前端 MediaPipe 33 landmarks，進行即時圓背偵測 + ML 推論
     回傳格式：
@@ -450,15 +644,127 @@ def predict(data: FrameData):
     - D: 是否成功
     - E: 錯誤訊息（如有）
     - spine: 圓背偵測結果（即時）
+    - rep: rep 切分狀態（ML_INFERENCE_MODE = "rep" 時）
+    - path: 這一幀的處理路徑 full / static（靜止，沿用上一次結果）/ low_visibility（關鍵點不可見）
+            / degraded（過載，只做圓背偵測，ML 欄位沿用上一次結果）
+    - hint: 伺服器建議的下一幀送出間隔 {"interval_ms", "pressure"}
+    超出准入預算時新 session 收到 503 + Retry-After（E = "ServerBusy"），既有 session 不受影響
+    請求帶 delta=true 時回應改為 seq + 完整快照或差異（見 delta_response.py）
     """
+    if not admission.admit_session(data.session_id):
+        retry_after = admission.retry_after()
+        return FastJSONResponse({"A": [], "D": False, "E": "ServerBusy", "retry_after": retry_after},
+                                status_code=503, headers={"Retry-After": str(retry_after)})
+
+    # 在事件迴圈上依到達順序取號：同一 session 的幀依序處理，不同 session 在 threadpool 中平行
+    ticket = session_locks.ticket(data.session_id)
+    try:
+        return await run_in_threadpool(predict_frame, data, ticket)
+    except BaseException:
+        session_locks.abandon(ticket)
+        raise
+
+
+def predict_frame(data: FrameData, ticket=None):
+    """/predict 的同步本體；持有該 session 的順序鎖時才讀寫 user_* 狀態"""
+    if ticket is None:
+        ticket = session_locks.ticket(data.session_id)
+    with session_locks.hold(ticket):
+        started = time.perf_counter()
+        landmarks = frame_landmarks(data)
+        if landmarks is None:
+            return FastJSONResponse({"A": [], "D": False, "E": "InvalidLandmarks"}, status_code=422)
+        if session_store.shared:
+            response = _predict_shared(data, landmarks)
+        else:
+            response = _track_frame(data, _predict_session(data, landmarks))
+        # 差異回應的 seq 依處理順序遞增，收尾也在鎖內
+        return _finish_frame(data, landmarks, response, started)
+
+
+def _export_session(session):
+    """把一個 session 的 user_* 狀態取出成可 pickle 的精簡 dict（同時從本程序移除）"""
+    window = user_windows.pop(session, None)
+    return {
+        "spine": user_spine_state.pop(session, None),
+        "window": np.array(window) if window else None,
+        "rep": user_rep_state.pop(session, None),
+        "gate": user_gate_state.pop(session, None),
+        "analytics": user_analytics.pop(session, None),
+    }
+
+
+def _restore_session(session, state):
+    for target, key in ((user_spine_state, "spine"), (user_rep_state, "rep"), (user_gate_state, "gate"),
+                        (user_analytics, "analytics")):
+        target.pop(session, None)
+        if state and state.get(key) is not None:
+            target[session] = state[key]
+    user_windows.pop(session, None)
+    if state and state["window"] is not None:
+        user_windows[session] = deque(state["window"], maxlen=30)
+
+
+def _predict_shared(data, landmarks):
+    """共用狀態後端：載入 → 處理 → 寫回；其他程序先寫入時以最新狀態重算這一幀"""
     session = data.session_id
+    for attempt in range(SESSION_STORE["max_retries"]):
+        state, version = session_store.load(session)
+        _restore_session(session, state)
+        response = _track_frame(data, _predict_session(data, landmarks))
+        if session_store.save(session, _export_session(session), version):
+            return response
+    print(f"⚠️ Session state for {session} kept changing, dropped this frame's update")
+    return response
+
+
+# Mediapipe 33 landmark → ML 特徵所需 index
+FEATURE_LANDMARKS = {
+    "left_ear": 7,
+    "left_shoulder": 11, "right_shoulder": 12,
+    "left_hip": 23, "right_hip": 24,
+    "left_knee": 25, "right_knee": 26,
+    "left_ankle": 27, "right_ankle": 28,
+    "left_wrist": 15, "right_wrist": 16
+}
+
+
+def _frame_features(landmarks):
+    lm = {
+        key: np.array([
+            landmarks[idx].x,
+            landmarks[idx].y,
+        ])
+        for key, idx in FEATURE_LANDMARKS.items()
+    }
+    return extractor.extract_frame_features(lm)
+
+
+def _track_frame(data, response):
+    """把這一幀的結果累加進訓練摘要（常數時間）"""
+    stats = user_analytics.setdefault(data.session_id, new_session_stats())
+    update_session_stats(stats, response, data.timestamp)
+    return response
+
+
+def _predict_session(data, landmarks):
+    """閘門 → 圓背偵測 → ML，回傳回應 dict（呼叫端須持有該 session 的鎖）"""
+    session = data.session_id
+    
+    # ========================
+    # 🚦 閘門：靜止或關鍵點不可見時略過整個計算
+    # ========================
+    gate = user_gate_state.setdefault(session, new_gate_state())
+    path = gate_frame(gate, landmarks)
+    if path != "full":
+        return _gated_response(gate, path)
     
     # ========================
     # 🏥 即時圓背偵測（每幀都執行）
     # ========================
     spine_result = None
     try:
-        spine_result = detect_rounded_back(data.landmarks, session)
+        spine_result = detect_rounded_back(landmarks, session)
     except Exception as e:
         print(f"⚠️ Spine detection error: {e}")
         spine_result = {
@@ -473,75 +779,60 @@ def predict(data: FrameData):
             "danger_frames": 0
         }
     
+    # 這一幀的時間：客戶端 timestamp，未提供時用牆上時間（rep 切分、特徵歷史、訓練摘要共用同一個時鐘）
+    ts = data.timestamp if data.timestamp is not None else time.time()
+
+    # 抽取單一 frame 特徵（ML 與特徵歷史共用）
+    feats = None
+    try:
+        feats = _frame_features(landmarks)
+    except Exception as e:
+        print(f"⚠️ Feature extraction error: {e}")
+    # 共用狀態後端時不記錄：樂觀鎖衝突重算這一幀會重複累加，且歷史不在 SESSION_STORE 中
+    if feats is not None and FEATURE_HISTORY["enabled"] and not session_store.shared:
+        history = user_history.get(session)
+        if history is None:
+            history = user_history[session] = FeatureHistory(ts)
+        history.update(ts, feats, spine_result["spine_curvature"], spine_result["is_lifting"])
+    
+    # 過載降級：略過 ML，只回報這一幀的圓背偵測
+    if admission.degraded():
+        return _degraded_response(gate, spine_result)
+    
     # ========================
     # 🤖 ML 模型預測（需累積 30 幀）
     # ========================
     ml_labels = []
     ml_ready = False
+    rep_info = None
+    frame_count = 0
+
+    # rep 切分每種模式都執行（回報次數與每一下的邊界）；ML_INFERENCE_MODE 只決定分類器的輸入
+    rep_state = completed = None
+    if feats is not None:
+        rep_state = user_rep_state.setdefault(session, new_rep_state())
+        completed = update_rep(rep_state, spine_result["hip_angle"], feats, ts)
     
     # 嘗試載入 ML 模型
-    if init_ml_model():
-        # 初始化 window
-        if session not in user_windows:
-            user_windows[session] = deque(maxlen=30)
-
-        # Mediapipe 33 landmark → 取出所需 index
-        required_idx = {
-            "left_ear": 7,
-            "left_shoulder": 11, "right_shoulder": 12,
-            "left_hip": 23, "right_hip": 24,
-            "left_knee": 25, "right_knee": 26,
-            "left_ankle": 27, "right_ankle": 28,
-            "left_wrist": 15, "right_wrist": 16
-        }
-
+    if feats is not None and init_ml_model():
         try:
-            lm = {
-                key: np.array([
-                    data.landmarks[idx].x,
-                    data.landmarks[idx].y,
-                ])
-                for key, idx in required_idx.items()
-            }
-            
-            # 抽取單一 frame 特徵
-            feats = extractor.extract_frame_features(lm)
-            user_windows[session].append(feats)
-
-            # 如果滿 30 幀 → 進行 ML 預測
-            if len(user_windows[session]) >= 30:
-                ml_ready = True
-                window = np.array(user_windows[session])
-                input_vec = np.concatenate([
-                    np.mean(window, axis=0),
-                    np.max(window, axis=0),
-                    np.min(window, axis=0),
-                    np.std(window, axis=0)
-                ]).reshape(1, -1)
-
-                # 模型推論
-                pred = clf.predict(input_vec)
-                ml_labels = list(mlb.inverse_transform(pred)[0])
-                
-                # 🆕 取得預測機率（如果模型支援）
-                try:
-                    proba = clf.predict_proba(input_vec)[0]
-                    # 找出最高機率的標籤
-                    max_proba_idx = np.argmax(proba)
-                    max_proba = float(proba[max_proba_idx])
-                    print(f"🤖 ML Prediction: {ml_labels}, max_proba: {max_proba:.2%}")
-                except Exception as e:
-                    max_proba = None
+            if ML_INFERENCE_MODE == "rep":
+                ml_labels, ml_ready, frame_count = _predict_rep(rep_state, completed)
+            else:
+                ml_labels, ml_ready, frame_count = _predict_window(session, feats)
                     
         except Exception as e:
             print(f"⚠️ ML prediction error: {e}")
+
+    if rep_state is not None:
+        if ML_INFERENCE_MODE != "rep":
+            _label_rep_from_window(rep_state, completed, ml_labels)
+        rep_info = rep_summary(rep_state, completed)
     
     # ========================
     # 回傳結果
     # ========================
-    frame_count = len(user_windows.get(session, [])) if session in user_windows else 0
-    
-    return {
+    response = {
         "A": ml_labels,                    # ML 偵測到的問題
         "D": True,
         "E": None if ml_ready else "InsufficientFrames",
@@ -549,3 +840,183 @@ def predict(data: FrameData):
         "ml_ready": ml_ready,              # 🆕 ML 模型是否準備好
         "ml_frame_count": frame_count      # 🆕 實際已收集的幀數
     }
+    if rep_info is not None:
+        response["rep"] = rep_info
+    response["path"] = "full"
+    remember_response(gate, response)
+    return response
+
+
+def _finish_frame(data, landmarks, response, started):
+    """
+    每幀共同的收尾：加上送幀間隔建議、SESSION_RECORDING 開啟時丟給背景寫入器（見 session_recorder.py），
+    並序列化回應（請求 delta=true 時改為差異回應）
+    """
+    if BACKPRESSURE["enabled"]:
+        load_monitor.observe((time.perf_counter() - started) * 1000)
+        response["hint"] = load_monitor.suggest(response["spine"].get("is_lifting", False), response["path"])
+    recorder = session_recorder.get_recorder()
+    if recorder is not None:
+        try:
+            recorder.record(data.session_id, landmarks, data.timestamp, response["spine"],
+                            response["A"], response["ml_ready"], response["path"])
+        except Exception as e:
+            print(f"⚠️ Session recording error: {e}")
+    if data.delta:
+        state = user_delta_state.setdefault(data.session_id, new_delta_state())
+        return FastJSONResponse(encode_delta(state, response, data.ack))
+    return FastJSONResponse(response)
+
+
+def _gated_response(gate, path):
+    """略過的幀：沿用上一次完整處理的回應；還沒有任何結果時回傳中性結果"""
+    previous = gate["response"]
+    if previous is not None:
+        response = dict(previous, path=path)
+        if "rep" in previous:
+            # 完成事件只回報一次
+            response["rep"] = dict(previous["rep"], completed=False)
+        return response
+    return {
+        "A": [],
+        "D": True,
+        "E": "LowVisibility",
+        "spine": {
+            "spine_curvature": 0,
+            "raw_angle": 0,
+            "status": "safe",
+            "confirmed_status": "safe",
+            "message": "請讓頭、肩、髖、膝完整入鏡",
+            "is_rounded": False,
+            "is_lifting": False,
+            "hip_angle": 180,
+            "warning_frames": 0,
+            "danger_frames": 0
+        },
+        "ml_ready": False,
+        "ml_frame_count": 0,
+        "path": path
+    }
+
+
+def _degraded_response(gate, spine_result):
+    """降級的幀：圓背偵測照常，ML 欄位沿用上一次完整處理的結果（不更新快取）"""
+    previous = gate["response"] or {}
+    response = {
+        "A": list(previous.get("A", [])),
+        "D": True,
+        "E": "Degraded",
+        "spine": spine_result,
+        "ml_ready": previous.get("ml_ready", False),
+        "ml_frame_count": previous.get("ml_frame_count", 0),
+        "path": "degraded",
+    }
+    if "rep" in previous:
+        response["rep"] = dict(previous["rep"], completed=False)
+    return response
+
+
+def _predict_window(session, feats):
+    """30 幀滑動視窗：視窗滿後每幀推論"""
+    if session not in user_windows:
+        user_windows[session] = deque(maxlen=30)
+    user_windows[session].append(feats)
+    ml_labels = []
+    ml_ready = False
+
+    # 如果滿 30 幀 → 進行 ML 預測
+    if len(user_windows[session]) >= 30:
+        ml_ready = True
+        window = np.array(user_windows[session])
+        input_vec = np.concatenate([
+            np.mean(window, axis=0),
+            np.max(window, axis=0),
+            np.min(window, axis=0),
+            np.std(window, axis=0)
+        ]).reshape(1, -1)
+
+        # 模型推論
+        pred = clf.predict(input_vec)
+        ml_labels = list(mlb.inverse_transform(pred)[0])
+        
+        # 🆕 取得預測機率（如果模型支援）
+        try:
+            proba = clf.predict_proba(input_vec)[0]
+            # 找出最高機率的標籤
+            max_proba_idx = np.argmax(proba)
+            max_proba = float(proba[max_proba_idx])
+            print(f"🤖 ML Prediction: {ml_labels}, max_proba: {max_proba:.2%}")
+        except Exception as e:
+            max_proba = None
+
+    return ml_labels, ml_ready, len(user_windows[session])
+
+
+def _label_rep_from_window(state, completed, labels):
+    """window 模式：一下的標籤為這一下期間視窗標籤的聯集，完成時記入 rep.last"""
+    seen = state.setdefault("window_labels", set())
+    if state["current"] is not None or completed is not None:
+        seen.update(labels)
+    if completed is not None:
+        finish_rep(state, completed, sorted(seen))
+    if state["current"] is None:
+        seen.clear()
+
+
+def _predict_rep(state, completed):
+    """rep 模式：每幀只累加特徵（update_rep），完成一下硬舉才推論一次；標籤沿用到下一下完成"""
+    if completed is not None:
+        vectors = [completed["vector"]]
+        if completed["phase_vectors"]:
+            vectors += [completed["phase_vectors"]["descent"], completed["phase_vectors"]["ascent"]]
+        labels = [list(l) for l in mlb.inverse_transform(clf.predict(np.array(vectors)))]
+        phase_labels = {"descent": labels[1], "ascent": labels[2]} if len(labels) == 3 else None
+        finish_rep(state, completed, labels[0], phase_labels)
+        print(f"🤖 Rep {completed['index']}: {labels[0]} ({completed['duration']:.1f}s, {completed['frames']} frames)")
+
+    ml_ready = state["last_labels"] is not None
+    ml_labels = list(state["last_labels"] or [])
+    # 實際幀數：進行中這一下已累加的幀數；站立時為目前標籤所依據的那一下的幀數
+    if state["current"]:
+        frame_count = state["current"]["frames"]
+    else:
+        frame_count = state["last_rep"]["frames"] if state["last_rep"] else 0
+    return ml_labels, ml_ready, frame_count
+
+
+# ================================================================
+# 🎬 整部影片離線分析工作（獨立程序池，不影響 /predict 延遲）
+# ================================================================
+import video_jobs
+
+app.include_router(video_jobs.router)
+
+
+@app.on_event("startup")
+async def apply_thread_budget():
+    """各元件的執行緒數與 CPU affinity（見 thread_budget.py）"""
+    thread_budget.apply()
+    thread_budget.apply_threadpool()
+    print(f"🧵 Thread budget: {thread_budget.report(clf)}")
+
+
+@app.on_event("startup")
+def calibrate_admission():
+    """先載入模型與 Pose，再量測准入控制的記憶體基準（降級門檻 = 基準 + ADMISSION_DEGRADE_HEADROOM_MB）"""
+    if not ADMISSION["enabled"]:
+        return
+    init_ml_model()
+    init_pose()
+    baseline = admission.calibrate()
+    print(f"📏 Admission: baseline RSS {baseline:.0f}MB, degrade at {admission.degrade_memory_mb():.0f}MB, "
+          f"shed at {ADMISSION['memory_budget_mb']:.0f}MB")
+
+
+@app.on_event("shutdown")
+def shutdown_video_jobs():
+    video_jobs.shutdown()
+
+
+@app.on_event("shutdown")
+def shutdown_session_recorder():
+    session_recorder.shutdown()
@@ -0,0 +1,85 @@
+"""
+backpressure.py
+
+伺服器端建議的送幀間隔：每個 /predict 回應帶 hint.interval_ms，前端依此調整呼叫頻率，
+取代寫死的 100ms。
+
+    pressure = max(排隊中的 /predict 數 / concurrency, 近期處理時間 EMA / target_service_ms)
+
+- 正在做硬舉：lifting_interval_ms × max(1, pressure)        只有過載時才放慢
+- 站著 / 靜止：idle_interval_ms × max(1, pressure)²           平常就較慢，過載時放慢得更多
+- 關鍵點不可見：low_visibility_interval_ms × max(1, pressure)²
+結果限制在 [min_interval_ms, max_interval_ms]，把容量留給正在動作的使用者。
+
+排隊數由 InflightMiddleware 在事件迴圈上計算（請求進入 threadpool 前就已計入）。
+"""
+import os
+import threading
+
+BACKPRESSURE = {
+    "enabled": os.environ.get("BACKPRESSURE", "1") != "0",
+    "lifting_interval_ms": 100,          # 與前端原本的固定間隔相同
+    "idle_interval_ms": 250,
+    "low_visibility_interval_ms": 500,
+    "min_interval_ms": 50,
+    "max_interval_ms": 1000,
+    "concurrency": int(os.environ.get("PREDICT_CONCURRENCY", os.cpu_count() or 1)),  # 不排隊可同時處理的請求數
+    "target_service_ms": 20.0,           # 單幀處理時間超過此值視為過載
+    "service_smoothing": 0.1,            # 處理時間 EMA 係數
+    "service_cap": 4.0,                  # 單次樣本上限 = target_service_ms × 此值（避免模型首次載入等離群值）
+}
+
+
+class LoadMonitor:
+    def __init__(self, config=BACKPRESSURE):
+        self.config = config
+        self.inflight = 0
+        self.service_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed_ms):
+        """記錄一次 /predict 處理時間（在 threadpool 執行緒中呼叫）"""
+        alpha = self.config["service_smoothing"]
+        elapsed_ms = min(elapsed_ms, self.config["target_service_ms"] * self.config["service_cap"])
+        with self._lock:
+            self.service_ms = alpha * elapsed_ms + (1 - alpha) * self.service_ms
+
+    def pressure(self):
+        return max(self.inflight / max(self.config["concurrency"], 1),
+                   self.service_ms / self.config["target_service_ms"])
+
+    def suggest(self, is_lifting, path="full"):
+        """回傳 hint dict：interval_ms 為建議的下一幀送出間隔"""
+        config = self.config
+        pressure = self.pressure()
+        load = max(1.0, pressure)
+        if path == "low_visibility":
+            interval = config["low_visibility_interval_ms"] * load * load
+        elif is_lifting:
+            interval = config["lifting_interval_ms"] * load
+        else:
+            interval = config["idle_interval_ms"] * load * load
+        interval = min(max(interval, config["min_interval_ms"]), config["max_interval_ms"])
+        return {"interval_ms": int(round(interval)), "pressure": round(pressure, 2)}
+
+
+class InflightMiddleware:
+    """純 ASGI middleware：計算指定路徑正在排隊 / 處理中的請求數"""
+
+    def __init__(self, app, monitor, paths=("/predict",)):
+        self.app = app
+        self.monitor = monitor
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        self.monitor.inflight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.monitor.inflight -= 1
+
+
+load_monitor = LoadMonitor()
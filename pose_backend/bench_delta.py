@@ -0,0 +1,86 @@
+"""
+bench_delta.py
+
+差異回應（delta_response.py）與完整回應的比較：
+
+- 每幀回應大小（bytes）與客戶端解析 + 套用時間（json.loads + apply，作為前端 JSON 工作的近似）
+- 正確性：客戶端依 seq / base 套用差異後，必須與伺服器這一幀的完整回應完全相同
+- --drop：隨機丟掉部分回應（客戶端沒收到、ack 停在舊的 seq），檢查仍能以舊基準或完整快照接續
+
+用法：
+    uv run python bench_delta.py --sessions 8 --frames 600 --drop 0.05
+"""
+import json
+import time
+import random
+import argparse
+
+import app
+from delta_response import apply
+from replay_eval import synthetic_session
+
+
+def run(sessions, frames, drop, seed=0):
+    """回傳 (完整 bytes, 差異 bytes, 完整解析秒數, 差異解析 + 套用秒數, 快照數, 不一致幀數, 丟棄幀數)"""
+    rng = random.Random(seed)
+    full_bytes = delta_bytes = snapshots = mismatched = dropped = 0
+    full_parse = delta_parse = 0.0
+    for k in range(sessions):
+        session = f"delta-{k}"
+        client = None                        # (seq, 完整回應)
+        for i, p in enumerate(synthetic_session(frames, seed=k)):
+            data = app.FrameData(session_id=session, points=p.ravel().tolist(), timestamp=i / 10,
+                                 delta=True, ack=client[0] if client else None)
+            body = app.predict_frame(data).body
+            seq = json.loads(body)["seq"]
+            truth = json.dumps(app.user_delta_state[session]["history"][seq], ensure_ascii=False,
+                               separators=(",", ":"), default=app._json_default).encode("utf-8")
+
+            t0 = time.perf_counter()
+            json.loads(truth)
+            full_parse += time.perf_counter() - t0
+            full_bytes += len(truth)
+            delta_bytes += len(body)
+
+            if rng.random() < drop:
+                dropped += 1
+                continue
+            t0 = time.perf_counter()
+            msg = json.loads(body)
+            if msg["full"]:
+                state = {k: v for k, v in msg.items() if k not in ("seq", "full")}
+                snapshots += 1
+            elif client and client[0] == msg["base"]:
+                state = apply(client[1], msg["changes"], msg.get("removed", ()))
+            else:
+                client = None
+                continue
+            delta_parse += time.perf_counter() - t0
+            client = (msg["seq"], state)
+            mismatched += state != json.loads(truth)
+    return full_bytes, delta_bytes, full_parse, delta_parse, snapshots, mismatched, dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="差異回應大小與正確性")
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--drop", type=float, default=0.0, help="隨機丟掉的回應比例")
+    parser.add_argument("--mode", choices=["rep", "window"], default=app.ML_INFERENCE_MODE)
+    args = parser.parse_args()
+
+    app.ML_INFERENCE_MODE = args.mode
+    app.init_ml_model()
+    full_bytes, delta_bytes, full_parse, delta_parse, snapshots, mismatched, dropped = \
+        run(args.sessions, args.frames, args.drop)
+    n = args.sessions * args.frames
+    print(f"🏋️ {args.sessions} sessions × {args.frames} 幀，模式 {args.mode}，丟棄 {dropped} 個回應\n")
+    print(f"每幀回應   完整 {full_bytes / n:7.0f} bytes   差異 {delta_bytes / n:7.0f} bytes"
+          f"（{delta_bytes / full_bytes:.1%}）")
+    print(f"客戶端解析 完整 {full_parse / n * 1e6:7.1f} µs      差異 + 套用 {delta_parse / (n - dropped) * 1e6:7.1f} µs")
+    print(f"以每秒 10 幀計：每位使用者每分鐘 {full_bytes / n * 600 / 1024:.0f}KB → {delta_bytes / n * 600 / 1024:.0f}KB")
+    print(f"完整快照 {snapshots} 次；套用後與完整回應一致：{'✅' if mismatched == 0 else f'❌ {mismatched} 幀不同'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+bench_feature_history.py
+
+多解析度特徵歷史（feature_history.py）：
+
+1. 疲勞漂移偵測：合成 --sets 組、每組 --reps-per-set 下，組間休息；每一下的頭頸前屈增加 --drift 度，
+   以 predict_frame 跑完後查詢 rep / set 層的趨勢，與沒有漂移的對照組比較 peak_curvature 斜率
+2. 固定記憶體：直接餵 FeatureHistory 10 分鐘與 2 小時的特徵，比較每幀更新耗時、緩衝區大小與趨勢查詢耗時
+
+用法：
+    uv run python bench_feature_history.py --sets 4 --reps-per-set 8 --drift 2 --minutes 10 120
+"""
+import time
+import pickle
+import argparse
+
+import numpy as np
+
+import app
+from feature_history import FeatureHistory
+from replay_eval import synthetic_session, frame_features_batch
+
+FPS = 10
+
+
+def workout(sets, reps_per_set, drift, rest_seconds, seed=0):
+    """每組 reps_per_set 下（約 4 秒 / 下），組間站著休息 rest_seconds 秒"""
+    parts = []
+    for k in range(sets):
+        lifting = synthetic_session(int(reps_per_set * 4.0 * FPS), seed=seed + k, fps=FPS, drift=drift)
+        rest = np.repeat(lifting[:1], int(rest_seconds * FPS), axis=0)
+        rest[:, :, :2] += np.random.default_rng(k).normal(0, 0.001, rest[:, :, :2].shape)
+        parts += [lifting, rest]
+    return np.concatenate(parts)
+
+
+def run_workout(points, session):
+    for i, p in enumerate(points):
+        app.predict_frame(app.FrameData(session_id=session, points=p.ravel().tolist(), timestamp=i / FPS))
+    return app.user_history[session]
+
+
+def drift_report(args):
+    print(f"🏋️ {args.sets} 組 × 約 {args.reps_per_set} 下，組間休息 {args.rest:.0f}s\n")
+    print(f"{'漂移 °/下':>9} {'每下':>5} {'組':>3} {'組內 peak 斜率':>14} {'組間 peak 斜率':>14} {'首 → 末組最大曲率':>18}")
+    for drift in (0.0, args.drift):
+        history = run_workout(workout(args.sets, args.reps_per_set, drift, args.rest), f"history-{drift}")
+        # 組內：最後一組的每一下
+        in_set = history.trends("rep", last=int(history.rows("set", 1)[0, 3]) if history.tiers["set"].count else None)
+        across = history.trends("set")
+        print(f"{drift:>9.1f} {history.reps:>5} {history.sets:>3} {in_set['slope'].get('peak_curvature', 0):>14.2f} "
+              f"{across['slope'].get('rep_peak_mean', 0):>14.2f} "
+              f"{across['first'].get('rep_peak_max', 0):>8.1f} → {across['last'].get('rep_peak_max', 0):<8.1f}")
+
+
+def cost_report(args):
+    sample = synthetic_session(6000, seed=1, fps=FPS)
+    feats = frame_features_batch(sample)
+    curvature = feats[:, 0]
+    lifting = feats[:, 1] < 160
+    print(f"\n{'分鐘':>6} {'幀數':>8} {'每幀更新 µs':>12} {'緩衝區 bytes':>12} {'pickle bytes':>12} {'趨勢查詢 µs':>12}")
+    for minutes in args.minutes:
+        frames = int(minutes * 60 * FPS)
+        history = FeatureHistory(0.0)
+        t0 = time.perf_counter()
+        for i in range(frames):
+            k = i % len(feats)
+            history.update(i / FPS, feats[k], curvature[k], lifting[k])
+        per_frame = (time.perf_counter() - t0) / frames
+        t0 = time.perf_counter()
+        for _ in range(100):
+            history.trends("rep")
+            history.trends("second")
+        query = (time.perf_counter() - t0) / 200
+        print(f"{minutes:>6.0f} {frames:>8} {per_frame * 1e6:>12.1f} {history.nbytes():>12} "
+              f"{len(pickle.dumps(history)):>12} {query * 1e6:>12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多解析度特徵歷史")
+    parser.add_argument("--sets", type=int, default=4)
+    parser.add_argument("--reps-per-set", type=int, default=8)
+    parser.add_argument("--drift", type=float, default=2.0, help="每一下增加的頭頸前屈（度）")
+    parser.add_argument("--rest", type=float, default=60.0, help="組間休息秒數")
+    parser.add_argument("--minutes", nargs="+", type=float, default=[10, 120])
+    args = parser.parse_args()
+
+    app.init_ml_model()
+    drift_report(args)
+    cost_report(args)
+
+
+if __name__ == "__main__":
+    main()
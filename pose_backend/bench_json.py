@@ -0,0 +1,106 @@
+"""
+bench_json.py
+
+/predict 與 /api/pose 的 JSON 成本基準測試（每幀 bytes 與解析 / 序列化時間）：
+
+請求（/predict）
+    landmarks  — 33 個 {x, y, z, visibility} 物件（舊格式）
+    points     — 33 × 4 扁平陣列
+    sparse     — 只送 PREDICT_LANDMARKS 的扁平陣列 + indices
+回應
+    /predict   — FastAPI 預設（jsonable_encoder + json） vs FastJSONResponse（orjson 或緊湊 json）
+    /api/pose  — 36 個 keypoint 物件 vs [x, y, score] 陣列
+
+用法：
+    uv run python bench_json.py --frames 20000
+"""
+import json
+import time
+import random
+import argparse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app import FrameData, FastJSONResponse, frame_landmarks, PREDICT_LANDMARKS, HAVE_ORJSON
+
+
+def sample_landmarks():
+    return [(random.random(), random.random(), random.uniform(-1, 1), random.random()) for _ in range(33)]
+
+
+def request_bodies(points):
+    legacy = {"session_id": "bench", "landmarks": [{"x": x, "y": y, "z": z, "visibility": v} for x, y, z, v in points]}
+    flat = {"session_id": "bench", "points": [c for p in points for c in p]}
+    sparse = {"session_id": "bench", "points": [c for i in PREDICT_LANDMARKS for c in points[i]],
+              "indices": PREDICT_LANDMARKS}
+    return {name: json.dumps(body, separators=(",", ":")).encode("utf-8")
+            for name, body in (("landmarks", legacy), ("points", flat), ("sparse", sparse))}
+
+
+def parse(raw):
+    if hasattr(FrameData, "model_validate_json"):
+        data = FrameData.model_validate_json(raw)
+    else:
+        data = FrameData.parse_raw(raw)
+    return frame_landmarks(data)
+
+
+def predict_response():
+    return {
+        "A": ["背部彎曲"], "D": True, "E": None,
+        "spine": {"spine_curvature": 23.4, "raw_angle": 25.1, "status": "warning", "confirmed_status": "warning",
+                  "message": "⚠️ 注意：脊椎輕微彎曲 23°", "is_rounded": False, "is_lifting": True,
+                  "hip_angle": 121.3, "warning_frames": 12, "danger_frames": 0},
+        "ml_ready": True, "ml_frame_count": 30, "path": "full",
+    }
+
+
+def pose_responses(points):
+    extra = [(101, 0.5, 0.3), (102, 0.5, 0.4), (103, 0.5, 0.55)]
+    base = {"success": True, "angles": {"knee": 150, "hip": 120, "back": 170},
+            "feedback": {"text": "✅ 姿勢良好", "level": "ok"}}
+    full = dict(base, keypoints=[{"id": i, "x": x, "y": y, "score": v} for i, (x, y, _, v) in enumerate(points)]
+                + [{"id": cid, "x": x, "y": y, "score": 1.0} for cid, x, y in extra])
+    compact = dict(base, keypoint_ids=list(range(33)) + [cid for cid, _, _ in extra],
+                   keypoints=[[round(x, 4), round(y, 4), round(v, 3)] for x, y, _, v in points]
+                   + [[x, y, 1.0] for _, x, y in extra])
+    return full, compact
+
+
+def timed(fn, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/predict JSON 格式成本基準測試")
+    parser.add_argument("--frames", type=int, default=20000)
+    args = parser.parse_args()
+    n = args.frames
+    points = sample_landmarks()
+
+    print(f"orjson: {'✅' if HAVE_ORJSON else '❌（使用標準 json）'}\n")
+    print(f"{'/predict 請求':<16} {'bytes':>7} {'解析 µs':>10}")
+    for name, raw in request_bodies(points).items():
+        assert len(parse(raw)) == 33
+        print(f"{name:<16} {len(raw):>7} {timed(lambda: parse(raw), n):>10.1f}")
+
+    response = predict_response()
+    default = lambda: JSONResponse(jsonable_encoder(response)).body
+    fast = lambda: FastJSONResponse(response).body
+    print(f"\n{'/predict 回應':<16} {'bytes':>7} {'序列化 µs':>10}")
+    print(f"{'default':<16} {len(default()):>7} {timed(default, n):>10.1f}")
+    print(f"{'fast':<16} {len(fast()):>7} {timed(fast, n):>10.1f}")
+
+    full, compact = pose_responses(points)
+    print(f"\n{'/api/pose 回應':<16} {'bytes':>7} {'序列化 µs':>10} {'客戶端解析 µs':>14}")
+    for name, body, render in (("keypoints 物件", full, lambda: JSONResponse(jsonable_encoder(full)).body),
+                               ("compact", compact, lambda: FastJSONResponse(compact).body)):
+        raw = render()
+        print(f"{name:<16} {len(raw):>7} {timed(render, n):>10.1f} {timed(lambda: json.loads(raw), n):>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
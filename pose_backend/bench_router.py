@@ -0,0 +1,160 @@
+"""
+bench_router.py
+
+router.py 一致性雜湊的負載平衡與重新分配測試：
+
+離線（預設）
+    - 平衡：S 個 session 分到 N 個實例，最多 / 最少實例相對平均的偏差，是否在 --tolerance 內
+    - 加入：新增一個實例時換實例的 session 比例（理想值 1/(N+1)），且只會移到新實例
+    - 移除：拿掉一個實例時只有它的 session 移動
+--live N
+    啟動 N 個本機 uvicorn pose_backend 與一個 router，以多個 session 送 /predict：
+    - 每個 session 是否始終落在同一個實例（回應標頭 X-Backend）
+    - 各實例實際請求數的平衡程度
+    - 停掉一個實例後，只有它的 session 換實例，其餘不受影響
+
+用法：
+    uv run python bench_router.py --sessions 10000 --nodes 2 4 8
+    uv run python bench_router.py --live 3 --sessions 300
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import subprocess
+from collections import Counter
+
+from router import HashRing, ROUTER
+
+
+def owners(ring, keys):
+    return {k: ring.get(k) for k in keys}
+
+
+def balance(assignment, nodes):
+    counts = Counter(assignment.values())
+    mean = len(assignment) / len(nodes)
+    return max(counts[n] for n in nodes) / mean - 1, 1 - min(counts[n] for n in nodes) / mean
+
+
+def offline(args):
+    keys = [f"user-{random.getrandbits(64):016x}" for _ in range(args.sessions)]
+    print(f"{'nodes':>5} {'最多':>7} {'最少':>7} {'容許':>6} {'加入移動':>9} {'理想':>6} {'只移到新實例':>12} {'移除只動該實例':>14}")
+    ok = True
+    for n in args.nodes:
+        nodes = [f"http://10.0.0.{i}:8000" for i in range(n)]
+        ring = HashRing(nodes, args.vnodes)
+        before = owners(ring, keys)
+        over, under = balance(before, nodes)
+        within = over <= args.tolerance and under <= args.tolerance
+        ok &= within
+
+        ring.add("http://10.0.0.99:8000")
+        after = owners(ring, keys)
+        moved = [k for k in keys if before[k] != after[k]]
+        only_new = all(after[k] == "http://10.0.0.99:8000" for k in moved)
+
+        ring.remove(nodes[0])
+        removed = owners(ring, keys)
+        only_removed = all(removed[k] == after[k] for k in keys if after[k] != nodes[0])
+        print(f"{n:>5} {over:>+7.1%} {-under:>+7.1%} {'✅' if within else '❌':>6} {len(moved) / len(keys):>9.1%} "
+              f"{1 / (n + 1):>6.1%} {'✅' if only_new else '❌':>12} {'✅' if only_removed else '❌':>14}")
+    print(f"\n容許偏差 ±{args.tolerance:.0%}（{args.vnodes} 個虛擬節點 / 實例，{args.sessions:,} 個 session）："
+          f"{'全部符合 ✅' if ok else '有超出 ❌'}")
+
+
+# ---------- live ----------
+def wait_ready(url, timeout=60):
+    import httpx
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            time.sleep(0.3)
+    return False
+
+
+def frame(session):
+    points = []
+    for i in range(33):
+        points += [0.5 + random.uniform(-0.05, 0.05), 0.3 + i * 0.01, 0.0, 0.9]
+    return {"session_id": session, "points": points}
+
+
+def live(args):
+    import httpx
+    here = os.path.dirname(os.path.abspath(__file__))
+    base_port = args.port
+    procs = []
+    backends = [f"http://127.0.0.1:{base_port + 1 + i}" for i in range(args.live)]
+    try:
+        for i, url in enumerate(backends):
+            procs.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app:app", "--port", str(base_port + 1 + i), "--log-level", "warning"],
+                cwd=here))
+        env = dict(os.environ, ROUTER_BACKENDS=",".join(backends), ROUTER_HEALTH_INTERVAL="0.5")
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "router:app", "--port", str(base_port), "--log-level", "warning"],
+            cwd=here, env=env))
+        router_url = f"http://127.0.0.1:{base_port}"
+        if not all(wait_ready(b + "/api/ping") for b in backends) or not wait_ready(router_url + "/router/status"):
+            print("❌ 實例啟動失敗")
+            return
+
+        sessions = [f"live-{i}" for i in range(args.sessions)]
+        with httpx.Client(base_url=router_url, timeout=30) as client:
+            def send_round():
+                seen = {}
+                for s in sessions:
+                    r = client.post("/predict", json=frame(s))
+                    seen[s] = r.headers.get("x-backend")
+                return seen
+
+            first = send_round()
+            later = [send_round() for _ in range(args.rounds - 1)]
+            sticky = all(seen[s] == first[s] for seen in later for s in sessions)
+            counts = Counter(first.values())
+            mean = len(sessions) / len(backends)
+            print(f"🔀 {len(backends)} 個實例，{len(sessions)} 個 session × {args.rounds} 輪")
+            print(f"固定落在同一實例：{'✅' if sticky else '❌'}")
+            for b in backends:
+                print(f"   {b}  {counts[b]:>5} sessions（{counts[b] / mean - 1:+.1%}）")
+
+            victim = backends[0]
+            procs[0].terminate()
+            procs[0].wait()
+            after = send_round()
+            moved_ok = all(after[s] == first[s] for s in sessions if first[s] != victim)
+            rerouted = all(after[s] != victim and after[s] for s in sessions if first[s] == victim)
+            print(f"停掉 {victim} 後：其他 session 不受影響 {'✅' if moved_ok else '❌'}，"
+                  f"它的 {counts[victim]} 個 session 改送其他實例 {'✅' if rerouted else '❌'}")
+            print("router 統計：", client.get("/router/status").json()["stats"])
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="session 親和路由平衡測試")
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--nodes", nargs="+", type=int, default=[2, 3, 4, 8, 16])
+    parser.add_argument("--vnodes", type=int, default=ROUTER["vnodes"])
+    parser.add_argument("--tolerance", type=float, default=0.20, help="各實例 session 數相對平均的容許偏差")
+    parser.add_argument("--live", type=int, default=0, help="啟動幾個本機 uvicorn 實例做實測")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--port", type=int, default=18000)
+    args = parser.parse_args()
+    random.seed(0)
+    if args.live:
+        live(args)
+    else:
+        offline(args)
+
+
+if __name__ == "__main__":
+    main()
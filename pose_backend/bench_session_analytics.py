@@ -0,0 +1,80 @@
+"""
+bench_session_analytics.py
+
+訓練摘要（session_analytics.py）的成本不隨 session 長度成長：
+
+- 以 predict_frame 跑一段合成 session（每秒 10 幀），收集回應
+- 把回應重複餵給累加器，模擬 --minutes 指定的各種長度，比較
+  每幀更新耗時、累加器狀態大小（pickle bytes）、產生摘要的耗時
+- 對照：rep 模式的次數與 rep_segmenter 的 rep_count 相同，各狀態時間加總等於 duration
+
+用法：
+    uv run python bench_session_analytics.py --minutes 10 120
+"""
+import time
+import pickle
+import argparse
+
+import app
+from session_analytics import new_session_stats, update_session_stats, session_summary
+from replay_eval import synthetic_session
+
+FPS = 10
+
+
+def collect(frames):
+    """以 predict_frame 跑一段合成 session，攔下每一幀交給累加器的回應；回傳 (回應列表, session)"""
+    session = "analytics-bench"
+    responses = []
+    track = app._track_frame
+
+    def capture(data, response):
+        responses.append(response)
+        return track(data, response)
+
+    app._track_frame = capture
+    try:
+        for i, p in enumerate(synthetic_session(frames, seed=0, fps=FPS)):
+            app.predict_frame(app.FrameData(session_id=session, points=p.ravel().tolist(), timestamp=i / FPS))
+    finally:
+        app._track_frame = track
+    return responses, session
+
+
+def main():
+    parser = argparse.ArgumentParser(description="訓練摘要的成本與 session 長度無關")
+    parser.add_argument("--minutes", nargs="+", type=float, default=[10, 120])
+    parser.add_argument("--sample", type=int, default=3000, help="實際跑 predict_frame 的幀數，之後重複使用")
+    parser.add_argument("--mode", choices=["rep", "window"], default=app.ML_INFERENCE_MODE)
+    args = parser.parse_args()
+
+    app.ML_INFERENCE_MODE = args.mode
+    app.init_ml_model()
+
+    responses, session = collect(args.sample)
+    stats = app.user_analytics[session]
+    summary = session_summary(stats)
+    status_total = sum(stats["status_time"].values())
+    rep_count = app.user_rep_state[session]["rep_count"]
+    reps = f"次數 {summary['reps']} / rep_segmenter {rep_count} {'✅' if summary['reps'] == rep_count else '❌'}"
+    print(f"🏋️ 樣本 {args.sample} 幀（{args.sample / FPS / 60:.1f} 分鐘），模式 {args.mode}")
+    print(f"對照：{reps}，狀態時間加總 {status_total:.1f}s / duration {stats['duration']:.1f}s "
+          f"{'✅' if abs(status_total - stats['duration']) < 1e-6 else '❌'}\n")
+
+    print(f"{'分鐘':>6} {'幀數':>8} {'每幀更新 µs':>12} {'狀態 bytes':>10} {'摘要 µs':>8} {'次數':>6}")
+    for minutes in args.minutes:
+        frames = int(minutes * 60 * FPS)
+        stats = new_session_stats()
+        t0 = time.perf_counter()
+        for i in range(frames):
+            update_session_stats(stats, responses[i % len(responses)], i / FPS)
+        per_frame = (time.perf_counter() - t0) / frames
+        t0 = time.perf_counter()
+        for _ in range(1000):
+            summary = session_summary(stats)
+        print(f"{minutes:>6.0f} {frames:>8} {per_frame * 1e6:>12.2f} {len(pickle.dumps(stats)):>10} "
+              f"{(time.perf_counter() - t0) * 1e3:>8.1f} {summary['reps']:>6}")
+
+
+if __name__ == "__main__":
+    main()
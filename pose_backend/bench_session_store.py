@@ -0,0 +1,143 @@
+"""
+bench_session_store.py
+
+session 狀態後端的成本與正確性：
+
+1. 每幀成本：同一批幀分別以 memory / sqlite 後端跑 predict_frame，比較每幀耗時，算出共用狀態的額外成本
+2. 單次 load + save 的延遲與每個 session 的狀態大小
+3. 跨程序接續：同一個 session 的幀輪流送到兩個 worker 程序（像負載平衡器把連續幀分到不同 worker），
+   與單一程序的結果逐幀比對；memory 後端會斷掉視窗與計數，sqlite 後端應完全一致
+
+用法：
+    uv run python bench_session_store.py --sessions 16 --frames 300
+"""
+import os
+import json
+import time
+import pickle
+import tempfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+
+import app
+from session_store import InProcessStore, SqliteSessionStore
+from replay_eval import synthetic_session
+
+
+def make_frames(sessions, frames):
+    return {
+        f"store-{k}": [app.FrameData(session_id=f"store-{k}", points=p.ravel().tolist(), timestamp=i / 10)
+                       for i, p in enumerate(synthetic_session(frames, seed=k))]
+        for k in range(sessions)
+    }
+
+
+def reset_state():
+    for state in (app.user_spine_state, app.user_windows, app.user_rep_state, app.user_gate_state):
+        state.clear()
+
+
+def summarize(response):
+    body = json.loads(response.body)
+    return body["spine"]["spine_curvature"], body["spine"]["status"], body["A"], body["ml_frame_count"]
+
+
+def run_frames(frames, store):
+    """依序處理（每輪每個 session 一幀），回傳 ({session: [摘要]}, 每幀秒數)"""
+    reset_state()
+    app.session_store = store
+    out = {s: [] for s in frames}
+    n = max(len(seq) for seq in frames.values())
+    t0 = time.perf_counter()
+    for i in range(n):
+        for s, seq in frames.items():
+            out[s].append(summarize(app.predict_frame(seq[i])))
+    return out, (time.perf_counter() - t0) / (n * len(frames))
+
+
+# ---------- 跨程序 ----------
+def _worker_init(backend, path, mode):
+    app.ML_INFERENCE_MODE = mode
+    app.FRAME_GATING["enabled"] = False
+    app.init_ml_model()
+    app.session_store = SqliteSessionStore(path) if backend == "sqlite" else InProcessStore()
+
+
+def _worker_frame(data):
+    return summarize(app.predict_frame(data))
+
+
+def run_two_processes(frames, backend, path, mode):
+    ctx = mp.get_context("spawn")
+    pools = [ProcessPoolExecutor(1, mp_context=ctx, initializer=_worker_init, initargs=(backend, path, mode))
+             for _ in range(2)]
+    try:
+        out = {s: [] for s in frames}
+        n = max(len(seq) for seq in frames.values())
+        for i in range(n):
+            # 每個 session 同一時間只有一幀在途（與前端相同），但連續幀交替落在兩個程序
+            futures = {s: pools[(i + k) % 2].submit(_worker_frame, seq[i])
+                       for k, (s, seq) in enumerate(frames.items())}
+            for s, f in futures.items():
+                out[s].append(f.result())
+        return out
+    finally:
+        for pool in pools:
+            pool.shutdown()
+
+
+def mismatches(a, b):
+    return sum(x != y for s in a for x, y in zip(a[s], b[s]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="session 狀態後端成本與跨程序正確性")
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--mode", choices=["rep", "window"], default=app.ML_INFERENCE_MODE)
+    parser.add_argument("--skip-processes", action="store_true", help="略過跨程序測試")
+    args = parser.parse_args()
+
+    app.ML_INFERENCE_MODE = args.mode
+    app.FRAME_GATING["enabled"] = False
+    app.init_ml_model()
+    frames = make_frames(args.sessions, args.frames)
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "session_state.sqlite3")
+    print(f"🏋️ {args.sessions} sessions × {args.frames} 幀，模式 {args.mode}\n")
+
+    reference, per_frame_memory = run_frames(frames, InProcessStore())
+    store = SqliteSessionStore(path)
+    shared, per_frame_sqlite = run_frames(frames, store)
+    overhead = per_frame_sqlite - per_frame_memory
+    print(f"每幀耗時  memory {per_frame_memory * 1e3:.3f}ms   sqlite {per_frame_sqlite * 1e3:.3f}ms   "
+          f"額外 {overhead * 1e6:.0f}µs（{overhead / per_frame_memory:.1%}）")
+    print(f"結果一致：{'✅' if mismatches(reference, shared) == 0 else '⚠️'}（{mismatches(reference, shared)} 幀不同）")
+
+    session = next(iter(frames))
+    state, version = store.load(session)
+    blob_size = len(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+    n = 2000
+    t0 = time.perf_counter()
+    for _ in range(n):
+        state, version = store.load(session)
+        store.save(session, state, version)
+    print(f"load + save {((time.perf_counter() - t0) / n) * 1e6:.0f}µs，每個 session 狀態 {blob_size:,} bytes")
+
+    # 額外成本 / 每幀成本 = 每個 worker 損失的比例；k 個 worker 的總吞吐量約為單程序的 k / (1 + 比例)
+    ratio = max(overhead / per_frame_memory, 0.0)
+    print(f"換算：k 個 worker 的吞吐量 ≈ 單程序 × k / {1 + ratio:.2f}；k ≥ 2 時即可抵銷共用狀態的成本"
+          if ratio < 1 else f"⚠️ 共用狀態成本高於每幀運算（{ratio:.1f}×），擴充 worker 前請先改善儲存延遲")
+
+    if not args.skip_processes:
+        cross_path = os.path.join(tmp, "cross_process.sqlite3")
+        SqliteSessionStore(cross_path)
+        for backend in ("memory", "sqlite"):
+            out = run_two_processes(frames, backend, cross_path, args.mode)
+            bad = mismatches(reference, out)
+            print(f"兩個程序輪流處理（{backend}）：{'✅ 與單一程序一致' if bad == 0 else f'❌ {bad} 幀與單一程序不同'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+bench_threads.py
+
+不同執行緒預算（thread_budget.py）下，/predict 與 /api/pose 混合負載的尾端延遲：
+
+每組預算啟動一個 uvicorn（環境變數 THREAD_BUDGET_*），同時
+- --predict-clients 個 session 以每秒 10 幀送 /predict（window 模式，每幀跑一次分類器）
+- --pose-clients 個用戶端連續上傳影像到 /api/pose
+持續 --seconds 秒，回報兩個端點的 p50 / p99 延遲、吞吐量，以及 /api/metrics 的實際執行緒數。
+准入控制關閉（ADMISSION=0），只比較執行緒設定。
+
+預算格式：default（THREAD_BUDGET=0，各函式庫自行決定）或 "blas=1,sklearn=1,opencv=1,threadpool=4"
+（自動加上 THREAD_BUDGET=1；未列出的 threadpool 維持 anyio 預設）
+
+用法：
+    uv run python bench_threads.py --budgets default "blas=1,sklearn=1,opencv=1" "blas=1,sklearn=1,opencv=1,threadpool=8"
+"""
+import io
+import os
+import sys
+import time
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+import numpy as np
+from PIL import Image
+
+from replay_eval import synthetic_session
+
+FPS = 10
+
+
+def budget_env(spec):
+    env = dict(os.environ, ADMISSION="0", PYTHONUNBUFFERED="1")
+    if spec == "default":
+        env["THREAD_BUDGET"] = "0"
+        return env
+    env["THREAD_BUDGET"] = "1"
+    for item in spec.split(","):
+        key, value = item.split("=")
+        env[f"THREAD_BUDGET_{key.strip().upper()}"] = value.strip()
+    return env
+
+
+def test_image(width=640, height=480):
+    rng = np.random.default_rng(0)
+    img = Image.fromarray(rng.integers(0, 255, (height, width, 3), dtype=np.uint8))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=80)
+    return buf.getvalue()
+
+
+async def predict_client(client, session, frames, deadline, out):
+    i = 0
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        p = frames[i % len(frames)]
+        r = await client.post("/predict", json={"session_id": session, "points": p.ravel().tolist(),
+                                                "timestamp": i / FPS})
+        latency = time.perf_counter() - t0
+        if r.status_code == 200:
+            out.append(latency)
+        i += 1
+        await asyncio.sleep(max(1 / FPS - latency, 0))
+
+
+async def pose_client(client, image, deadline, out):
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        r = await client.post("/api/pose", files={"file": ("frame.jpg", image, "image/jpeg")})
+        if r.status_code == 200:
+            out.append(time.perf_counter() - t0)
+
+
+async def mixed_load(url, args):
+    image = test_image()
+    frames = [synthetic_session(600, seed=k, fps=FPS) for k in range(args.predict_clients)]
+    predict, pose = [], []
+    limits = httpx.Limits(max_connections=args.predict_clients + args.pose_clients + 4)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        # 暖身：載入模型與 Pose
+        await client.post("/api/pose", files={"file": ("frame.jpg", image, "image/jpeg")})
+        await client.post("/predict", json={"session_id": "warmup", "points": frames[0][0].ravel().tolist()})
+        deadline = time.perf_counter() + args.seconds
+        await asyncio.gather(
+            *(predict_client(client, f"threads-{k}", frames[k], deadline, predict) for k in range(args.predict_clients)),
+            *(pose_client(client, image, deadline, pose) for _ in range(args.pose_clients)),
+        )
+        threads = (await client.get("/api/metrics")).json()["threads"]
+    return np.array(predict), np.array(pose), threads
+
+
+def wait_ready(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url + "/api/ping", timeout=1).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            time.sleep(0.3)
+    return False
+
+
+def pct(values, q):
+    return np.percentile(values, q) * 1000 if len(values) else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="執行緒預算與混合負載的尾端延遲")
+    parser.add_argument("--budgets", nargs="+", default=["default", "blas=1,sklearn=1,opencv=1"])
+    parser.add_argument("--predict-clients", type=int, default=16)
+    parser.add_argument("--pose-clients", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--mode", choices=["rep", "window"], default="window")
+    parser.add_argument("--port", type=int, default=18100)
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    print(f"🏋️ {args.predict_clients} 個 /predict session（{FPS} fps）+ {args.pose_clients} 個 /api/pose 用戶端，"
+          f"{args.seconds:.0f} 秒，模式 {args.mode}，CPU {os.cpu_count()}\n")
+    print(f"{'預算':<40} {'predict p50':>11} {'p99':>7} {'幀/秒':>6} {'pose p50':>9} {'p99':>7} {'張/秒':>6} {'執行緒':>6}")
+    for spec in args.budgets:
+        env = budget_env(spec)
+        env["ML_INFERENCE_MODE"] = args.mode
+        proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(args.port),
+                                 "--log-level", "warning"], cwd=here, env=env, stdout=subprocess.DEVNULL)
+        try:
+            url = f"http://127.0.0.1:{args.port}"
+            if not wait_ready(url):
+                print(f"{spec:<40} ❌ 啟動失敗")
+                continue
+            predict, pose, threads = asyncio.run(mixed_load(url, args))
+            print(f"{spec:<40} {pct(predict, 50):>11.1f} {pct(predict, 99):>7.1f} {len(predict) / args.seconds:>6.0f} "
+                  f"{pct(pose, 50):>9.1f} {pct(pose, 99):>7.1f} {len(pose) / args.seconds:>6.1f} "
+                  f"{threads['process_threads']:>6}")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+compact_model.py
+
+蒸餾後的精簡模型（video_analysis/distill_model.py 產生的 deadlift_compact_model.pkl）。
+
+檔案內容是純 numpy 陣列組成的 dict，不含自訂類別，後端不需要 import 訓練程式碼；
+這裡包成與 RandomForestClassifier 相容的 predict / predict_proba 介面，
+/predict 可以直接把它當成 clf 使用。
+"""
+import numpy as np
+
+COMPACT_FORMAT = "deadlift-compact-v1"
+
+
+def is_compact_artifact(obj):
+    return isinstance(obj, dict) and obj.get("format") == COMPACT_FORMAT
+
+
+class CompactDeadliftModel:
+    def __init__(self, artifact, classes=None):
+        """classes：label_binarizer 的 classes_，給定時必須與 artifact 的標籤順序完全一致"""
+        if not is_compact_artifact(artifact):
+            raise ValueError("not a deadlift compact model artifact")
+        self.kind = artifact["kind"]
+        self.classes = list(artifact["classes"])
+        if classes is not None and self.classes != list(classes):
+            raise ValueError(f"compact model classes {self.classes} do not match label binarizer {list(classes)}")
+        self.threshold = float(artifact.get("threshold", 0.5))
+        self.n_features = int(artifact["n_features"])
+        self._a = artifact
+
+    def label_proba(self, X):
+        """回傳 (n, 標籤數) 的正類機率"""
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.n_features)
+        a = self._a
+        if self.kind == "linear":
+            z = ((X - a["mean"]) / a["scale"]) @ a["coef"] + a["intercept"]
+            return 1.0 / (1.0 + np.exp(-z))
+
+        # kind == "tree"：單棵多輸出迴歸樹，逐層向量化走訪
+        left, right = a["children_left"], a["children_right"]
+        feature, split_threshold = a["feature"], a["split_threshold"]
+        rows = np.arange(len(X))
+        node = np.zeros(len(X), dtype=np.int64)
+        for _ in range(int(a["max_depth"])):
+            is_leaf = left[node] < 0
+            if is_leaf.all():
+                break
+            go_left = X[rows, np.maximum(feature[node], 0)] <= split_threshold[node]
+            node = np.where(is_leaf, node, np.where(go_left, left[node], right[node]))
+        return np.clip(a["value"][node], 0.0, 1.0)
+
+    def predict(self, X):
+        return (self.label_proba(X) >= self.threshold).astype(int)
+
+    def predict_proba(self, X):
+        """與 sklearn 多輸出分類器相同：每個標籤一個 (n, 2) 陣列"""
+        p = self.label_proba(X)
+        return [np.column_stack([1.0 - p[:, k], p[:, k]]) for k in range(p.shape[1])]
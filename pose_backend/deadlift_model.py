@@ -0,0 +1,98 @@
+"""
+deadlift_model.py
+
+ML 特徵萃取器與模型載入（app.py 的 /predict 與 video_jobs.py 的分析 worker 共用）。
+
+不 import FastAPI / MediaPipe，也沒有 app.py 的 session 狀態與啟動設定；
+worker 程序只 import 這裡就能載入與 /predict 相同的模型與特徵。
+"""
+import os
+import numpy as np
+from compact_model import CompactDeadliftModel, is_compact_artifact
+
+# 模型檔優先順序：蒸餾後的精簡模型 > Random Forest（可用 ML_MODEL_FILE 指定）
+MODEL_FILENAMES = ["deadlift_compact_model.pkl", "deadlift_rf_model.pkl"]
+if os.environ.get("ML_MODEL_FILE"):
+    MODEL_FILENAMES = [os.environ["ML_MODEL_FILE"]]
+
+# 嘗試多個可能的路徑
+MODEL_DIRS = [
+    "",  # 同目錄
+    "../video_analysis",  # 相對路徑
+    "/app/video_analysis",  # Docker 路徑
+    os.path.dirname(__file__),
+]
+
+
+# =====================================
+# ML 特徵萃取器
+# =====================================
+class DeadliftFeatureExtractor:
+    def dist(self, a, b):
+        return np.sqrt((a[0] - b[0])**2 + (a[1] - b[1])**2)
+
+    def calculate_angle(self, a, b, c):
+        a, b, c = np.array(a), np.array(b), np.array(c)
+        ba, bc = a - b, c - b
+        cos_angle = np.dot(ba, bc) / ((np.linalg.norm(ba)*np.linalg.norm(bc)) + 1e-7)
+        return np.degrees(np.arccos(np.clip(cos_angle, -1.0, 1.0)))
+
+    def extract_frame_features(self, lm):
+        shoulder_c = np.mean([lm['left_shoulder'], lm['right_shoulder']], axis=0)
+        hip_c = np.mean([lm['left_hip'], lm['right_hip']], axis=0)
+        knee_c = np.mean([lm['left_knee'], lm['right_knee']], axis=0)
+        ankle_c = np.mean([lm['left_ankle'], lm['right_ankle']], axis=0)
+        wrist_c = np.mean([lm['left_wrist'], lm['right_wrist']], axis=0)
+
+        torso_len = self.dist(shoulder_c, hip_c)
+        if torso_len == 0: torso_len = 1.0
+
+        spine_angle = self.calculate_angle(lm['left_ear'], shoulder_c, hip_c)
+        hip_angle = self.calculate_angle(shoulder_c, hip_c, knee_c)
+        knee_angle = self.calculate_angle(hip_c, knee_c, ankle_c)
+        torso_angle = self.calculate_angle([hip_c[0], hip_c[1]-0.5], hip_c, shoulder_c)
+
+        head_shoulder_ratio = self.dist(lm['left_ear'], shoulder_c) / torso_len
+
+        vec_sh_hip = (shoulder_c - hip_c) / torso_len
+        vec_hip_knee = (hip_c - knee_c) / torso_len
+        vec_ear_sh = (lm['left_ear'] - shoulder_c) / torso_len
+        vec_wrist_ankle = (wrist_c - ankle_c) / torso_len
+
+        return [
+            spine_angle, hip_angle, knee_angle, torso_angle,
+            head_shoulder_ratio,
+            0.0,
+            vec_sh_hip[0], vec_sh_hip[1],
+            vec_hip_knee[0], vec_hip_knee[1],
+            vec_ear_sh[0], vec_ear_sh[1],
+            vec_wrist_ankle[0], vec_wrist_ankle[1]
+        ]
+
+
+# =====================================
+# 🤖 模型載入
+# =====================================
+def find_model_path():
+    for filename in MODEL_FILENAMES:
+        for directory in MODEL_DIRS:
+            path = os.path.join(directory, filename)
+            if os.path.exists(path):
+                return path
+    return None
+
+
+def load_ml_model():
+    """
+    回傳 (clf, mlb, model_path)；找不到模型檔回傳 None
+    精簡模型的標籤順序與 label_binarizer.pkl 不一致時拋出 ValueError，避免 inverse_transform 對錯標籤
+    """
+    import joblib
+    model_path = find_model_path()
+    if model_path is None:
+        return None
+    mlb = joblib.load(os.path.join(os.path.dirname(model_path), "label_binarizer.pkl"))
+    clf = joblib.load(model_path)
+    if is_compact_artifact(clf):
+        clf = CompactDeadliftModel(clf, classes=mlb.classes_)
+    return clf, mlb, model_path
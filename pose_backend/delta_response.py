@@ -0,0 +1,86 @@
+"""
+delta_response.py
+
+/predict 的差異回應（選用，請求帶 "delta": true）：只回傳與客戶端最後確認（ack）的那一幀相比有變動的欄位。
+
+每幀的 spine 訊息、狀態、標籤列表在一下硬舉中只變幾次，完整回應卻每幀重複；以每秒 10 幀計，
+差異回應可大幅減少行動網路上的回應大小與前端解析 JSON 的工作。
+
+協定
+- 回應都帶 seq（該 session 遞增）；客戶端下一次請求以 "ack" 回報最後套用的 seq
+- 完整快照：{"seq", "full": true, ...與一般回應相同的欄位}
+  在第一幀、ack 缺少或已不在伺服器的歷史中（例如換了 worker）、以及每 snapshot_every 幀時送出，供客戶端重新同步
+- 差異：{"seq", "base": ack, "full": false, "changes": {...}, "removed": [...]}
+  changes 的頂層值直接取代；值為 dict 且基準也是 dict（spine、rep、hint）時只含變動的子欄位，套用時淺層合併；
+  removed 列出被移除的欄位（"rep" 或 "rep.phase_labels"）
+- 客戶端的狀態 seq 不等於 base 時應丟棄這個回應，並在下一次請求省略 ack 取得完整快照
+
+歷史只留最近 history 幀、只存在處理該 session 的程序內（不進 SESSION_STORE）。
+"""
+
+DELTA_RESPONSES = {
+    "snapshot_every": 50,   # 每幾幀強制送一次完整快照
+    "history": 4,           # 保留最近幾幀可當作 ack 基準（前端同時只有一個請求在途）
+}
+
+_MISSING = object()
+
+
+def new_delta_state():
+    return {"seq": 0, "history": {}, "since_snapshot": 0}
+
+
+def diff(base, current):
+    """回傳 (changes, removed)；dict 欄位往下比一層"""
+    changes = {}
+    removed = [key for key in base if key not in current]
+    for key, value in current.items():
+        previous = base.get(key, _MISSING)
+        if previous is _MISSING:
+            changes[key] = value
+        elif isinstance(value, dict) and isinstance(previous, dict):
+            sub = {k: v for k, v in value.items() if previous.get(k, _MISSING) != v}
+            if sub:
+                changes[key] = sub
+            removed += [f"{key}.{k}" for k in previous if k not in value]
+        elif previous != value:
+            changes[key] = value
+    return changes, removed
+
+
+def apply(base, changes, removed=()):
+    """客戶端的套用方式（bench_delta.py 與前端相同邏輯），回傳新的完整回應"""
+    out = dict(base)
+    for path in removed:
+        key, _, sub = path.partition(".")
+        if sub:
+            out[key] = {k: v for k, v in out[key].items() if k != sub}
+        else:
+            out.pop(key, None)
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(out.get(key), dict):
+            out[key] = {**out[key], **value}
+        else:
+            out[key] = value
+    return out
+
+
+def encode(state, response, ack, config=DELTA_RESPONSES):
+    """記錄這一幀並回傳要送出的 dict（呼叫端須持有該 session 的鎖）"""
+    state["seq"] += 1
+    seq = state["seq"]
+    history = state["history"]
+    base = history.get(ack) if ack is not None else None
+    history[seq] = dict(response)
+    for old in [s for s in history if s <= seq - config["history"]]:
+        del history[old]
+
+    state["since_snapshot"] += 1
+    if base is None or state["since_snapshot"] >= config["snapshot_every"]:
+        state["since_snapshot"] = 0
+        return {"seq": seq, "full": True, **response}
+    changes, removed = diff(base, response)
+    out = {"seq": seq, "base": ack, "full": False, "changes": changes}
+    if removed:
+        out["removed"] = removed
+    return out
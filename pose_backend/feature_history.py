@@ -0,0 +1,186 @@
+"""
+feature_history.py
+
+每個 session 的多解析度特徵歷史：30 幀視窗之外，以固定記憶體保留整場訓練的降採樣資料，
+用來看一組之內、整場之間的疲勞漂移（例如每一下的脊椎曲率逐漸變大）。
+
+三層環形緩衝區（float32，寫滿後覆蓋最舊的列），每列都是 14 個逐幀特徵 + spine_curvature 的平均：
+    second   每秒一列，保留最近 seconds 秒                [t, 幀數, mean × 15]
+    rep      每一下一列，保留最近 reps 下                  [編號, 開始, 結束, 幀數, mean × 15, std × 15, 最大曲率]
+    set      每一組一列，保留最近 sets 組                  [編號, 開始, 結束, 次數, 幀數, mean × 15, 每下最大曲率的平均, 最大]
+時間為相對 session 第一幀的秒數。
+
+- 一下：is_lifting 由假轉真開始、由真轉假結束（與 ML 模式無關，降級時也照常記錄）；少於 min_rep_frames 幀的視為雜訊
+- 一組：距離上一下結束超過 set_gap_seconds 沒有新的一下，該組結束
+- 記憶體：預設每個 session 約 80KB，與 session 長度無關；逐幀更新約 20µs
+
+歷史只存在處理該 session 的程序內（不進 SESSION_STORE）；多個實例時搭配 router.py 的 session 親和路由。
+SESSION_STORE=sqlite 時不記錄（衝突重算會重複累加，各 worker 也只看得到部分的幀），查詢端點回 501。
+"""
+import os
+
+import numpy as np
+
+from rep_segmenter import RunningAggregate
+
+FEATURE_HISTORY = {
+    "enabled": os.environ.get("FEATURE_HISTORY", "1") != "0",
+    "seconds": 600,             # 每秒層：最近 10 分鐘
+    "reps": 256,
+    "sets": 32,
+    "set_gap_seconds": 30.0,    # 休息超過此秒數 → 下一下屬於新的一組
+    "min_rep_frames": 5,
+}
+
+# DeadliftFeatureExtractor.extract_frame_features 的 14 個特徵（index 5 固定為 0）
+FEATURE_NAMES = [
+    "spine_angle", "hip_angle", "knee_angle", "torso_angle", "head_shoulder_ratio", "reserved",
+    "sh_hip_x", "sh_hip_y", "hip_knee_x", "hip_knee_y", "ear_sh_x", "ear_sh_y", "wrist_ankle_x", "wrist_ankle_y",
+]
+COLUMNS = FEATURE_NAMES + ["spine_curvature"]
+WIDTH = len(COLUMNS)
+
+TIER_COLUMNS = {
+    "second": ["t", "frames"] + COLUMNS,
+    "rep": ["rep", "start", "end", "frames"] + COLUMNS + [f"{c}_std" for c in COLUMNS] + ["peak_curvature"],
+    "set": ["set", "start", "end", "reps", "frames"] + COLUMNS + ["rep_peak_mean", "rep_peak_max"],
+}
+# 趨勢的 x 軸：每秒層用時間，其餘用編號
+TIER_X = {"second": "t", "rep": "rep", "set": "set"}
+
+
+class Ring:
+    """固定容量的 float32 環形緩衝區，寫滿後覆蓋最舊的列"""
+
+    def __init__(self, capacity, width):
+        self.data = np.zeros((capacity, width), dtype=np.float32)
+        self.head = 0
+        self.count = 0
+
+    def append(self, row):
+        self.data[self.head] = row
+        self.head = (self.head + 1) % len(self.data)
+        self.count = min(self.count + 1, len(self.data))
+
+    def rows(self, last=None):
+        """依時間先後回傳最近 last 列（複本）"""
+        n = self.count if last is None else max(min(last, self.count), 0)
+        return self.data[(self.head - n + np.arange(n)) % len(self.data)]
+
+
+class FeatureHistory:
+    def __init__(self, t0, config=FEATURE_HISTORY):
+        self.config = config
+        self.t0 = t0
+        self.tiers = {
+            "second": Ring(config["seconds"], len(TIER_COLUMNS["second"])),
+            "rep": Ring(config["reps"], len(TIER_COLUMNS["rep"])),
+            "set": Ring(config["sets"], len(TIER_COLUMNS["set"])),
+        }
+        self._second = None                  # 進行中的秒
+        self._second_agg = RunningAggregate(WIDTH)
+        self._rep = None                     # 進行中這一下的累加器
+        self._rep_start = 0.0
+        self._last_rep_end = None
+        self._set = None                     # 進行中這一組：{"start", "reps", "frames", "sum", "peak_sum", "peak_max"}
+        self.reps = 0
+        self.sets = 0
+
+    def update(self, ts, feats, curvature, lifting):
+        """一幀完整處理的特徵（呼叫端須持有該 session 的鎖）"""
+        t = ts - self.t0
+        row = np.empty(WIDTH)
+        row[:-1] = feats
+        row[-1] = curvature
+
+        second = int(t)
+        if self._second is not None and second != self._second:
+            self._flush_second()
+        self._second = second
+        self._second_agg.add(row)
+
+        if lifting:
+            if self._rep is None:
+                self._rep = RunningAggregate(WIDTH)
+                self._rep_start = t
+            self._rep.add(row)
+        elif self._rep is not None:
+            self._flush_rep(t)
+        if self._set is not None and self._rep is None and t - self._last_rep_end >= self.config["set_gap_seconds"]:
+            self._flush_set()
+
+    # ---------- 結算 ----------
+    def _flush_second(self):
+        agg = self._second_agg
+        self.tiers["second"].append(np.concatenate([[self._second, agg.count], agg.mean]))
+        self._second_agg = RunningAggregate(WIDTH)
+
+    def _flush_rep(self, t):
+        agg, self._rep = self._rep, None
+        if agg.count < self.config["min_rep_frames"]:
+            return
+        if self._set is not None and self._rep_start - self._last_rep_end >= self.config["set_gap_seconds"]:
+            self._flush_set()
+        if self._set is None:
+            self._set = {"start": self._rep_start, "reps": 0, "frames": 0, "sum": np.zeros(WIDTH),
+                         "peak_sum": 0.0, "peak_max": 0.0}
+        self.reps += 1
+        peak = agg.max[-1]
+        std = np.sqrt(np.maximum(agg.m2 / agg.count, 0.0))
+        self.tiers["rep"].append(np.concatenate([[self.reps, self._rep_start, t, agg.count], agg.mean, std, [peak]]))
+
+        current = self._set
+        current["reps"] += 1
+        current["frames"] += agg.count
+        current["sum"] += agg.mean * agg.count
+        current["peak_sum"] += peak
+        current["peak_max"] = max(current["peak_max"], peak)
+        self._last_rep_end = t
+
+    def _flush_set(self):
+        current, self._set = self._set, None
+        self.sets += 1
+        self.tiers["set"].append(np.concatenate([
+            [self.sets, current["start"], self._last_rep_end, current["reps"], current["frames"]],
+            current["sum"] / current["frames"],
+            [current["peak_sum"] / current["reps"], current["peak_max"]],
+        ]))
+
+    # ---------- 查詢 ----------
+    def rows(self, tier, last=None):
+        return self.tiers[tier].rows(last)
+
+    def current_set(self):
+        if self._set is None:
+            return None
+        current = self._set
+        return {"set": self.sets + 1, "start": round(current["start"], 2), "reps": current["reps"],
+                "rep_peak_mean": round(current["peak_sum"] / current["reps"], 2),
+                "rep_peak_max": round(current["peak_max"], 2)}
+
+    def trends(self, tier, last=None):
+        """
+        每個欄位對 x（秒或編號）的最小平方斜率，以及第一列 / 最後一列的值。
+        rep 層的 spine_curvature / peak_curvature 斜率 > 0 表示每一下越彎（疲勞漂移）
+        """
+        columns = TIER_COLUMNS[tier]
+        rows = self.rows(tier, last).astype(np.float64)
+        x_index = columns.index(TIER_X[tier])
+        value_columns = [i for i, c in enumerate(columns) if i != x_index and c != "reserved"
+                         and c not in ("start", "end", "frames", "reps") and not c.endswith("_std")]
+        out = {"tier": tier, "n": len(rows), "x": TIER_X[tier], "slope": {}, "first": {}, "last": {}}
+        if len(rows) == 0:
+            return out
+        x = rows[:, x_index]
+        y = rows[:, value_columns]
+        dx = x - x.mean()
+        denom = float(dx @ dx)
+        slopes = (dx @ (y - y.mean(axis=0))) / denom if denom > 0 else np.zeros(len(value_columns))
+        for k, i in enumerate(value_columns):
+            out["slope"][columns[i]] = round(float(slopes[k]), 4)
+            out["first"][columns[i]] = round(float(rows[0, i]), 4)
+            out["last"][columns[i]] = round(float(rows[-1, i]), 4)
+        return out
+
+    def nbytes(self):
+        return sum(ring.data.nbytes for ring in self.tiers.values())
@@ -0,0 +1,69 @@
+"""
+frame_gate.py
+
+/predict 的前置閘門：在跑圓背偵測、特徵萃取與分類器之前，先判斷這一幀值不值得完整處理。
+
+- low_visibility：圓背偵測用到的關鍵點（鼻、肩、髖、膝）任一 visibility 低於門檻
+  → 人不在畫面內或被遮住，算出來的角度沒有意義，不更新任何狀態
+- static：未在做硬舉、且關鍵點相對「上一次完整處理的幀」位移都低於門檻
+  → 組間站著不動，結果不會改變，直接沿用上一次的回應
+  與上一次完整處理的幀比較（而非上一幀），緩慢漂移累積超過門檻時仍會重新計算
+- 其餘 → full，完整處理
+
+做硬舉時（上一次結果 is_lifting）一律完整處理，避免漏掉連續幀計數與 rep 切分。
+"""
+
+FRAME_GATING = {
+    "enabled": True,
+    "min_visibility": 0.5,        # 關鍵點 visibility 低於此值 → low_visibility（與前端 MIN_VISIBILITY 相同）
+    "static_displacement": 0.01,  # 正規化座標；所有關鍵點位移都低於此值 → static
+    "max_static_skip": 50,        # 連續略過幾幀後強制完整處理一次（約 5 秒 @ 10 fps）
+}
+
+# 圓背偵測 / 髖角用到的關鍵點
+GATE_LANDMARKS = [0, 11, 12, 23, 24, 25, 26]
+# 位移判斷另外納入手腕、腳踝（ML 特徵會用到）
+MOTION_LANDMARKS = [0, 7, 11, 12, 15, 16, 23, 24, 25, 26, 27, 28]
+
+
+def new_gate_state():
+    return {
+        "reference": None,        # 上一次完整處理時的關鍵點 [(x, y), ...]
+        "response": None,         # 上一次完整處理的回應
+        "skipped": 0,             # 目前連續略過的幀數
+        "counts": {"full": 0, "static": 0, "low_visibility": 0},
+    }
+
+
+def _points(landmarks):
+    return [(landmarks[i].x, landmarks[i].y) for i in MOTION_LANDMARKS]
+
+
+def gate_frame(state, landmarks, config=FRAME_GATING):
+    """回傳這一幀要走的路徑："full" / "static" / "low_visibility" """
+    path = "full"
+    if config["enabled"] and len(landmarks) > max(MOTION_LANDMARKS):
+        visible = all(
+            (landmarks[i].visibility if landmarks[i].visibility is not None else 1.0) >= config["min_visibility"]
+            for i in GATE_LANDMARKS
+        )
+        if not visible:
+            path = "low_visibility"
+        elif (state["reference"] is not None and state["response"] is not None
+              and not state["response"]["spine"].get("is_lifting")
+              and state["skipped"] < config["max_static_skip"]):
+            threshold = config["static_displacement"]
+            if all(abs(x - rx) < threshold and abs(y - ry) < threshold
+                   for (x, y), (rx, ry) in zip(_points(landmarks), state["reference"])):
+                path = "static"
+
+    state["counts"][path] += 1
+    state["skipped"] = 0 if path == "full" else state["skipped"] + 1
+    if path == "full":
+        state["reference"] = _points(landmarks)
+    return path
+
+
+def remember_response(state, response):
+    """記錄完整處理的回應，供之後略過的幀沿用"""
+    state["response"] = response
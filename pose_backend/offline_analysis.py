@@ -0,0 +1,173 @@
+"""
+offline_analysis.py
+
+整部影片離線分析的共用核心：取樣控制、30 幀視窗分類器與冷卻機制。
+後端的 /jobs（video_jobs.py）與 video_analysis/（GUI、批次、訓練、基準測試）都 import 這裡，
+只維護一份實作；pose_backend 單獨部署，因此放在這裡，由 video_analysis 以 sys.path 引用。
+
+取樣控制（訓練與推論共用）：
+- target_fps：目標分析幀率，多餘的幀用 cap.grab() 略過，不做解碼後處理與 Pose
+- max_dim：Pose 推論的最大邊長，超過就等比例縮小
+
+MediaPipe 的 landmark 是 0~1 的正規化座標，縮圖不會改變特徵尺度；
+但取樣後 30 幀視窗涵蓋的秒數會改變，因此輸出一律記錄 effective_fps。
+"""
+from collections import deque
+from datetime import timedelta
+import cv2
+import numpy as np
+
+# 取樣控制預設值（None = 每幀、原始解析度）
+TARGET_FPS = None
+MAX_INFERENCE_DIM = None
+
+WINDOW_SIZE = 30              # 滑動視窗 (30 frames)
+COOLDOWN_SECONDS = 1.5        # 相同錯誤至少間隔 1.5 秒才顯示一次
+INFERENCE_HOP = 1             # 視窗滿後每隔幾幀推論一次（1 = 每幀；調大前先以 bench_inference_hop.py 確認事件差異）
+RECHECK_MARGIN = None         # 任一標籤機率距 0.5 小於此值時，下一幀立即再推論一次（None = 關閉，例如 0.15）
+
+
+# ==========================================
+# 取樣
+# ==========================================
+def sampling_step(src_fps, target_fps=None):
+    """每隔幾幀分析一次（1 = 每幀）"""
+    if not target_fps or not src_fps or target_fps >= src_fps:
+        return 1
+    return max(1, int(round(src_fps / target_fps)))
+
+
+def effective_fps(src_fps, step):
+    return src_fps / max(1, step)
+
+
+def resize_for_inference(frame, max_dim=None):
+    """長邊超過 max_dim 時等比例縮小（INTER_AREA）"""
+    if not max_dim:
+        return frame
+    h, w = frame.shape[:2]
+    scale = max_dim / float(max(h, w))
+    if scale >= 1.0:
+        return frame
+    return cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def iter_sampled_frames(cap, step=1, start_frame=0, end_frame=None):
+    """
+    從目前位置 (start_frame) 依序讀取，yield (frame_idx, frame)
+    只有 (frame_idx - start_frame) % step == 0 的幀會被 retrieve，其餘只 grab()
+    """
+    frame_idx = start_frame
+    while cap.isOpened():
+        if end_frame is not None and frame_idx >= end_frame:
+            break
+        if (frame_idx - start_frame) % step:
+            if not cap.grab():
+                break
+            frame_idx += 1
+            continue
+
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield frame_idx, frame
+        frame_idx += 1
+
+
+def format_timestamp(sec):
+    """將秒數轉為 00:00 格式"""
+    time_str = str(timedelta(seconds=int(sec)))
+    if time_str.startswith("0:"): time_str = time_str[2:] # 去掉前面的 0:
+    return time_str
+
+
+# ==========================================
+# 30 幀視窗分類器
+# ==========================================
+def positive_proba(model, X):
+    """多輸出分類器 predict_proba → (n, 標籤數) 正類機率；p > 0.5 與 predict 的 argmax 結果相同"""
+    probas = model.predict_proba(X)
+    classes_per_output = model.classes_
+    if not isinstance(probas, list):
+        # 單一輸出：predict_proba 回傳單一陣列，classes_ 也不是逐輸出的 list
+        probas, classes_per_output = [probas], [model.classes_]
+    out = np.zeros((len(X), len(probas)))
+    for k, (p, classes) in enumerate(zip(probas, classes_per_output)):
+        positive = np.nonzero(np.asarray(classes) == 1)[0]
+        if len(positive):
+            out[:, k] = p[:, positive[0]]
+    return out
+
+
+class WindowClassifier:
+    """
+    30 幀滑動視窗 → 模型推論 → 冷卻機制
+
+    extractor：提供 extract_frame_features(lm) 的特徵萃取器（後端與 video_analysis 各自的版本）
+    相鄰視窗重疊 29/30，逐幀推論大多被冷卻機制吃掉；視窗滿後改為每 hop 幀推論一次。
+    recheck_margin 給定時改用 predict_proba：任一標籤機率落在 0.5 ± margin 內（結果不穩定），
+    下一幀立即再推論，不等滿 hop，避免短暫出現的錯誤被跳過。
+    """
+
+    def __init__(self, model, mlb, extractor, hop=INFERENCE_HOP, recheck_margin=RECHECK_MARGIN,
+                 window_size=WINDOW_SIZE, cooldown=COOLDOWN_SECONDS):
+        self.model = model
+        self.mlb = mlb
+        self.extractor = extractor
+        self.hop = max(1, int(hop or 1))
+        self.recheck_margin = recheck_margin
+        self.cooldown = cooldown
+        self.window = deque(maxlen=window_size)
+        # 冷卻機制 (避免同一秒內重複刷同樣的錯誤)
+        self.last_error_time = {}  # { "錯誤名稱": 上次出現的秒數 }
+        self.events = []           # [(秒數, 標籤)]
+        self.inference_count = 0
+        self.recheck_count = 0
+        self._since_last = self.hop   # 視窗一滿就先推論一次
+        self._recheck = False
+
+    def push(self, current_sec, lm):
+        """餵入一幀 landmarks（None = 未偵測到人），回傳這一幀新產生的事件"""
+        if not lm:
+            return []
+        self.window.append(self.extractor.extract_frame_features(lm))
+        if len(self.window) < self.window.maxlen:
+            return []
+
+        self._since_last += 1
+        if self._since_last < self.hop and not self._recheck:
+            return []
+        if self._since_last < self.hop:
+            self.recheck_count += 1
+        self._since_last = 0
+        return self._infer(current_sec)
+
+    def _infer(self, current_sec):
+        data = np.array(self.window)
+        # 聚合特徵
+        input_vec = np.concatenate([
+            np.mean(data, axis=0), np.max(data, axis=0),
+            np.min(data, axis=0), np.std(data, axis=0)
+        ]).reshape(1, -1)
+
+        # 預測
+        self.inference_count += 1
+        if self.recheck_margin is None:
+            pred = self.model.predict(input_vec)
+        else:
+            proba = positive_proba(self.model, input_vec)
+            pred = (proba > 0.5).astype(int)
+            self._recheck = self.hop > 1 and bool(np.any(np.abs(proba - 0.5) < self.recheck_margin))
+        labels = self.mlb.inverse_transform(pred)[0]
+
+        # 處理偵測結果
+        new_events = []
+        for label in labels:
+            if label == "正確動作":
+                continue
+            # 檢查冷卻時間
+            if current_sec - self.last_error_time.get(label, -999) > self.cooldown:
+                self.last_error_time[label] = current_sec
+                self.events.append((current_sec, label))
+                new_events.append((current_sec, label))
+        return new_events
@@ -0,0 +1,159 @@
+"""
+rep_segmenter.py
+
+串流式次數切分：依 detect_rounded_back 每幀算出的 hip_angle，偵測每一下硬舉的
+開始 (離開鎖定) → 最低點 → 鎖定 (站直)，一次完整的 rep 結束後才跑一次分類器，
+取代視窗滿後每幀都推論。
+
+- 狀態機 (每個 session 一份 dict)：standing → descent → ascent → standing
+  以 start_angle / lockout_angle 做遲滯，避免在門檻附近抖動時重複計次
+- 特徵聚合為固定大小的累加器 (Welford mean/M2 + max/min)，不保留逐幀資料；
+  rep 結束時輸出與 30 幀視窗相同排列的 56 維向量 [mean, max, min, std]
+- 可選的分段 (descent / ascent) 聚合，供分段分類
+- 從地板起槓的第一下（一開始就低於 start_angle）直接從 descent 開始計
+"""
+import numpy as np
+
+REP_SEGMENTATION = {
+    "start_angle": 160,      # 髖角低於此值 → 離開鎖定，rep 開始（與 DEADLIFT_DETECTION 相同）
+    "lockout_angle": 165,    # 髖角回到此值以上 → 鎖定，rep 結束（比 start_angle 高，形成遲滯）
+    "bottom_rebound": 10,    # 髖角比目前最低點回升超過此值 → 已過最低點，進入 ascent
+    "min_depth": 30,         # 鎖定角 - 最低髖角 至少要這麼深才算一下（過濾晃動）
+    "min_frames": 8,         # 太短的 rep 視為雜訊
+    "max_frames": 900,       # 太長（例如蹲著不動或離開畫面）就放棄這一下
+    "classify_phases": False,  # 是否另外對 descent / ascent 各跑一次分類
+}
+
+
+class RunningAggregate:
+    """固定大小的逐幀特徵聚合：Welford 平均 / 變異數 + 最大 / 最小"""
+
+    def __init__(self, dim):
+        self.count = 0
+        self.mean = np.zeros(dim)
+        self.m2 = np.zeros(dim)
+        self.max = np.full(dim, -np.inf)
+        self.min = np.full(dim, np.inf)
+
+    def add(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        np.maximum(self.max, x, out=self.max)
+        np.minimum(self.min, x, out=self.min)
+
+    def vector(self):
+        """與 /predict 視窗相同排列：[mean, max, min, std] (ddof=0)"""
+        std = np.sqrt(np.maximum(self.m2 / max(self.count, 1), 0.0))
+        return np.concatenate([self.mean, self.max, self.min, std])
+
+
+def new_rep_state():
+    return {
+        "phase": "standing",
+        "frame": 0,              # session 內的幀編號
+        "rep_count": 0,
+        "current": None,         # 進行中的 rep
+        "last_rep": None,        # 最近一次完成的 rep 摘要
+        "last_labels": None,     # 最近一次 rep 的分類結果（在下一下完成前沿用）
+    }
+
+
+def _start_rep(state, hip_angle, ts, dim):
+    state["phase"] = "descent"
+    state["current"] = {
+        "start_frame": state["frame"],
+        "start_ts": ts,
+        "bottom_frame": state["frame"],
+        "bottom_ts": ts,
+        "min_hip_angle": hip_angle,
+        "frames": 0,
+        "aggregate": RunningAggregate(dim),
+        "descent": RunningAggregate(dim),
+        "ascent": RunningAggregate(dim),
+    }
+
+
+def update_rep(state, hip_angle, features, ts, config=REP_SEGMENTATION):
+    """
+    餵入一幀，回傳這一幀完成的 rep（dict，含 vector / phase_vectors），否則回傳 None
+
+    ts：秒，用來計算 rep 時長（客戶端時間戳或伺服器時間）
+    """
+    state["frame"] += 1
+    phase = state["phase"]
+
+    if phase == "standing":
+        if hip_angle >= config["start_angle"]:
+            return None
+        _start_rep(state, hip_angle, ts, len(features))
+        phase = "descent"
+
+    rep = state["current"]
+    rep["frames"] += 1
+    rep["aggregate"].add(features)
+
+    if phase == "descent":
+        rep["descent"].add(features)
+        if hip_angle < rep["min_hip_angle"]:
+            rep["min_hip_angle"] = hip_angle
+            rep["bottom_frame"], rep["bottom_ts"] = state["frame"], ts
+        elif hip_angle - rep["min_hip_angle"] > config["bottom_rebound"]:
+            state["phase"] = "ascent"
+    else:
+        rep["ascent"].add(features)
+
+    if rep["frames"] > config["max_frames"]:
+        state["phase"], state["current"] = "standing", None
+        return None
+
+    if hip_angle < config["lockout_angle"]:
+        return None
+
+    # 鎖定：rep 結束
+    state["phase"], state["current"] = "standing", None
+    depth = config["lockout_angle"] - rep["min_hip_angle"]
+    if rep["frames"] < config["min_frames"] or depth < config["min_depth"]:
+        return None
+
+    state["rep_count"] += 1
+    completed = {
+        "index": state["rep_count"],
+        "start_ts": rep["start_ts"],
+        "bottom_ts": rep["bottom_ts"],
+        "end_ts": ts,
+        "duration": float(ts - rep["start_ts"]),
+        "frames": rep["frames"],
+        "min_hip_angle": float(round(rep["min_hip_angle"], 1)),
+        "vector": rep["aggregate"].vector(),
+        "phase_vectors": None,
+    }
+    if config["classify_phases"] and rep["descent"].count and rep["ascent"].count:
+        completed["phase_vectors"] = {"descent": rep["descent"].vector(), "ascent": rep["ascent"].vector()}
+    return completed
+
+
+def rep_summary(state, completed=None):
+    """回應用的 rep 資訊（不含特徵向量）"""
+    current = state["current"]
+    return {
+        "count": state["rep_count"],
+        "phase": state["phase"],
+        "frames_in_rep": current["frames"] if current else 0,
+        "completed": completed is not None,
+        "last": state["last_rep"],
+    }
+
+
+def finish_rep(state, completed, labels, phase_labels=None):
+    """記錄完成的 rep 與分類結果，回傳摘要"""
+    summary = {k: completed[k] for k in ("index", "start_ts", "bottom_ts", "end_ts", "duration",
+                                         "frames", "min_hip_angle")}
+    summary["labels"] = labels
+    if phase_labels:
+        summary["phases"] = phase_labels
+    state["last_rep"] = summary
+    state["last_labels"] = labels
+    return summary
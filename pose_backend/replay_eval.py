@@ -0,0 +1,346 @@
+"""
+replay_eval.py
+
+離線重播 landmarks 序列，用向量化的 detect_rounded_back 快速評估 SPINE_THRESHOLDS / STABILITY_CONFIG /
+模型，不必開瀏覽器手動測試。
+
+- 來源：session_recorder 錄下的 segment（--recordings），或合成的硬舉序列（--synthetic）
+- 圓背偵測整段陣列一次算完：
+    EMA 平滑     → scipy.signal.lfilter（與逐幀 state["smoothed_angle"] 相同的一階遞迴，初值 0）
+    連續幀計數   → 以 cumsum 扣掉最近一次中斷位置的累積值，得到每幀的 run length
+    狀態判斷     → np.select，順序與 detect_rounded_back 的 if/elif 相同
+- 視窗 / 模型（--ml）：逐幀特徵向量化後以 sliding_window_view 算 [mean, max, min, std]，分批 predict
+- --parity N：前 N 幀另外逐幀呼叫 app.detect_rounded_back / app._predict_window，比對結果是否一致
+- --warning / --danger / --frames：門檻組合掃描，輸出每組的狀態比例與警報次數
+
+用法：
+    uv run python replay_eval.py --synthetic 1000000 --sessions 20 --parity 20000
+    uv run python replay_eval.py --recordings recordings --warning 15 20 25 --danger 25 30 35 --frames 5 10 15 --ml
+"""
+import time
+import json
+import argparse
+import itertools
+import numpy as np
+from scipy.signal import lfilter
+from numpy.lib.stride_tricks import sliding_window_view
+
+import app
+from app import SPINE_THRESHOLDS, STABILITY_CONFIG, DEADLIFT_DETECTION
+
+STATUS_ORDER = ["safe", "monitoring", "warning", "danger", "critical"]
+WINDOW_SIZE = 30
+
+# /predict 的 ML 特徵用到的 landmarks（與 app.FEATURE_LANDMARKS 相同）
+REQUIRED_IDX = {
+    "left_ear": 7,
+    "left_shoulder": 11, "right_shoulder": 12,
+    "left_hip": 23, "right_hip": 24,
+    "left_knee": 25, "right_knee": 26,
+    "left_ankle": 27, "right_ankle": 28,
+    "left_wrist": 15, "right_wrist": 16
+}
+
+
+# ==========================================
+# 向量化幾何
+# ==========================================
+def _angle_between(u, v):
+    """逐列兩向量夾角（度）；長度為 0 時回傳 NaN"""
+    dot = np.einsum("ij,ij->i", u, v)
+    mag = np.linalg.norm(u, axis=1) * np.linalg.norm(v, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cos = np.clip(dot / mag, -1.0, 1.0)
+    return np.where(mag > 0, np.degrees(np.arccos(cos)), np.nan)
+
+
+def _joint_angle(a, b, c):
+    """與 DeadliftFeatureExtractor.calculate_angle 相同（分母加 1e-7）"""
+    ba, bc = a - b, c - b
+    cos = np.einsum("ij,ij->i", ba, bc) / (np.linalg.norm(ba, axis=1) * np.linalg.norm(bc, axis=1) + 1e-7)
+    return np.degrees(np.arccos(np.clip(cos, -1.0, 1.0)))
+
+
+def run_length(cond):
+    """每幀截至目前為止連續為 True 的幀數（False 時為 0）"""
+    count = np.cumsum(cond)
+    reset = np.maximum.accumulate(np.where(cond, 0, count))
+    return count - reset
+
+
+def spine_batch(points, thresholds=SPINE_THRESHOLDS, stability=STABILITY_CONFIG, detection=DEADLIFT_DETECTION):
+    """
+    單一 session 的整段 landmarks (n, 33, >=2) → detect_rounded_back 各欄位的陣列
+
+    與逐幀版本相同的語意：EMA 對每一幀都更新；未做硬舉時計數器歸零。
+    """
+    p = np.asarray(points, dtype=np.float64)[:, :, :2]
+    nose = p[:, 0]
+    mid_shoulder = (p[:, 11] + p[:, 12]) / 2
+    mid_hip = (p[:, 23] + p[:, 24]) / 2
+    mid_knee = (p[:, 25] + p[:, 26]) / 2
+
+    raw = np.nan_to_num(_angle_between(nose - mid_shoulder, mid_shoulder - mid_hip), nan=0.0)
+    alpha = stability["smoothing_factor"]
+    curvature = lfilter([alpha], [1.0, -(1.0 - alpha)], raw)
+    hip_angle = np.nan_to_num(_angle_between(mid_shoulder - mid_hip, mid_knee - mid_hip), nan=180.0)
+    return _spine_status(raw, curvature, hip_angle, thresholds, stability, detection)
+
+
+def _spine_status(raw, curvature, hip_angle, thresholds, stability, detection):
+    """門檻相關部分；掃描門檻時可重複使用同一組 curvature / hip_angle"""
+    lifting = hip_angle < detection["hip_angle_threshold"]
+    warning_frames = run_length(lifting & (curvature > thresholds["safe"]))
+    danger_frames = run_length(lifting & (curvature > thresholds["danger"]))
+    frame_threshold = stability["frame_threshold"]
+
+    is_critical = lifting & (curvature > thresholds["critical"])
+    is_danger = lifting & (danger_frames >= frame_threshold) & (curvature > thresholds["danger"])
+    is_warning = lifting & (warning_frames >= frame_threshold) & (curvature > thresholds["warning"])
+    is_monitoring = lifting & (curvature > thresholds["safe"])
+    status = np.select([is_critical, is_danger, is_warning, is_monitoring], [4, 3, 2, 1], default=0)
+    confirmed = np.where(status == 1, 0, status)
+    return {
+        "raw_angle": raw,
+        "spine_curvature": curvature,
+        "hip_angle": hip_angle,
+        "is_lifting": lifting,
+        "warning_frames": warning_frames,
+        "danger_frames": danger_frames,
+        "status": status,                 # STATUS_ORDER 索引
+        "confirmed_status": confirmed,
+        "is_rounded": status >= 3,
+    }
+
+
+def frame_features_batch(points):
+    """(n, 33, >=2) → (n, 14)，與 DeadliftFeatureExtractor.extract_frame_features 相同"""
+    p = np.asarray(points, dtype=np.float64)[:, :, :2]
+    lm = {key: p[:, idx] for key, idx in REQUIRED_IDX.items()}
+    shoulder_c = (lm["left_shoulder"] + lm["right_shoulder"]) / 2
+    hip_c = (lm["left_hip"] + lm["right_hip"]) / 2
+    knee_c = (lm["left_knee"] + lm["right_knee"]) / 2
+    ankle_c = (lm["left_ankle"] + lm["right_ankle"]) / 2
+    wrist_c = (lm["left_wrist"] + lm["right_wrist"]) / 2
+
+    torso_len = np.linalg.norm(shoulder_c - hip_c, axis=1)
+    torso_len = np.where(torso_len == 0, 1.0, torso_len)[:, None]
+    up = hip_c - np.array([0.0, 0.5])
+
+    feats = np.empty((len(p), 14))
+    feats[:, 0] = _joint_angle(lm["left_ear"], shoulder_c, hip_c)
+    feats[:, 1] = _joint_angle(shoulder_c, hip_c, knee_c)
+    feats[:, 2] = _joint_angle(hip_c, knee_c, ankle_c)
+    feats[:, 3] = _joint_angle(up, hip_c, shoulder_c)
+    feats[:, 4] = np.linalg.norm(lm["left_ear"] - shoulder_c, axis=1) / torso_len[:, 0]
+    feats[:, 5] = 0.0
+    feats[:, 6:8] = (shoulder_c - hip_c) / torso_len
+    feats[:, 8:10] = (hip_c - knee_c) / torso_len
+    feats[:, 10:12] = (lm["left_ear"] - shoulder_c) / torso_len
+    feats[:, 12:14] = (wrist_c - ankle_c) / torso_len
+    return feats
+
+
+def window_vectors(feats, window=WINDOW_SIZE):
+    """(n, 14) → (n - window + 1, 56)；第 i 列對應第 i + window - 1 幀時 /predict 的輸入"""
+    if len(feats) < window:
+        return np.empty((0, feats.shape[1] * 4))
+    w = sliding_window_view(feats, window, axis=0)   # (m, 14, window)
+    return np.concatenate([w.mean(axis=2), w.max(axis=2), w.min(axis=2), w.std(axis=2)], axis=1)
+
+
+def predict_windows(vectors, batch=8192):
+    """分批跑模型，回傳多標籤 0/1 矩陣 (m, n_labels)"""
+    out = [np.asarray(app.clf.predict(vectors[i:i + batch])) for i in range(0, len(vectors), batch)]
+    return np.concatenate(out) if out else np.empty((0, len(app.mlb.classes_)), dtype=int)
+
+
+# ==========================================
+# 來源
+# ==========================================
+def load_recordings(directory):
+    """回傳 {session_id: (n, 33, 4)}，依 server_ts 排序"""
+    from session_recorder import list_segments, load_segment
+    parts, names = {}, {}
+    for path in list_segments(directory):
+        records, meta = load_segment(path)
+        names.update({int(k): v for k, v in meta["sessions"].items()})
+        for key in np.unique(records["session"]):
+            sel = records[records["session"] == key]
+            parts.setdefault(int(key), []).append((sel["server_ts"], sel["landmarks"]))
+    sessions = {}
+    for key, chunks in parts.items():
+        ts = np.concatenate([c[0] for c in chunks])
+        points = np.concatenate([c[1] for c in chunks])
+        sessions[names.get(key, str(key))] = points[np.argsort(ts, kind="stable")]
+    return sessions
+
+
+def synthetic_session(n_frames, seed=0, fps=10, drift=0.0):
+    """
+    合成的硬舉側面序列 (n, 33, 4)：髖關節固定，軀幹前傾 0°→60~80°→0° 反覆，
+    每下隨機的頭頸前屈（模擬圓背）加上 landmark 抖動；drift 為每一下額外增加的前屈角度（模擬疲勞）
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_frames) / fps
+    rep_len = rng.uniform(3.0, 5.0)
+    rep_idx = (t // rep_len).astype(int)
+    phase = (t % rep_len) / rep_len
+    depth = rng.uniform(60, 80, rep_idx.max() + 1)[rep_idx]
+    rounding = rng.choice([5, 15, 25, 35, 45], rep_idx.max() + 1)[rep_idx] + drift * rep_idx
+    lean = np.radians(depth * np.clip(np.sin(np.pi * phase) * 1.4, 0, 1))
+    bend = np.radians(rounding * np.clip(np.sin(np.pi * phase) * 1.2, 0, 1))
+
+    hip = np.array([0.5, 0.6])
+    torso, head = 0.25, 0.1
+    shoulder = hip + torso * np.stack([np.sin(lean), -np.cos(lean)], axis=1)
+    nose = shoulder + head * np.stack([np.sin(lean + bend), -np.cos(lean + bend)], axis=1)
+    knee = hip + np.stack([0.02 * np.sin(lean), np.full(n_frames, 0.2)], axis=1)
+    ankle = np.tile([0.5, 0.95], (n_frames, 1))
+    wrist = shoulder + np.array([0.0, 0.2])
+
+    points = np.zeros((n_frames, 33, 4))
+    points[:, :, :2] = hip
+    points[:, :, 3] = 0.9
+    points[:, 0, :2] = nose
+    points[:, 7, :2] = nose - np.array([0.02, 0.0])
+    points[:, [11, 12], :2] = shoulder[:, None]
+    points[:, [23, 24], :2] = hip
+    points[:, [25, 26], :2] = knee[:, None]
+    points[:, [27, 28], :2] = ankle[:, None]
+    points[:, [15, 16], :2] = wrist[:, None]
+    points[:, :, :2] += rng.normal(0, 0.002, (n_frames, 33, 2))
+    return points
+
+
+# ==========================================
+# 一致性檢查
+# ==========================================
+def parity_check(points, limit, check_ml):
+    """前 limit 幀逐幀呼叫 app 的實作，回傳不一致的幀數"""
+    n = min(limit, len(points))
+    batch = spine_batch(points[:n])
+    app.user_spine_state.pop("__replay__", None)
+    app.user_windows.pop("__replay__", None)
+    mismatches = {"status": 0, "confirmed_status": 0, "counters": 0, "curvature": 0, "ml": 0}
+    if check_ml:
+        labels_batch = predict_windows(window_vectors(frame_features_batch(points[:n])))
+
+    for i in range(n):
+        landmarks = [app.Landmark(x=x, y=y, z=z, visibility=v) for x, y, z, v in points[i]]
+        single = app.detect_rounded_back(landmarks, "__replay__")
+        if single["status"] != STATUS_ORDER[batch["status"][i]]:
+            mismatches["status"] += 1
+        if single["confirmed_status"] != STATUS_ORDER[batch["confirmed_status"][i]]:
+            mismatches["confirmed_status"] += 1
+        if (single["warning_frames"], single["danger_frames"]) != (batch["warning_frames"][i], batch["danger_frames"][i]):
+            mismatches["counters"] += 1
+        if abs(single["spine_curvature"] - batch["spine_curvature"][i]) > 0.051:
+            mismatches["curvature"] += 1
+        if check_ml:
+            lm = {key: np.array([landmarks[idx].x, landmarks[idx].y]) for key, idx in REQUIRED_IDX.items()}
+            labels, ready, _ = app._predict_window("__replay__", app.extractor.extract_frame_features(lm))
+            if ready:
+                expected = list(app.mlb.inverse_transform(labels_batch[i - WINDOW_SIZE + 1][None])[0])
+                if labels != expected:
+                    mismatches["ml"] += 1
+
+    app.user_spine_state.pop("__replay__", None)
+    app.user_windows.pop("__replay__", None)
+    return n, mismatches
+
+
+# ==========================================
+# 統計
+# ==========================================
+def alert_stats(results):
+    """results：[spine dict] → 各狀態幀數比例與警報次數（confirmed 進入 danger/critical 的次數）"""
+    confirmed = np.concatenate([r["confirmed_status"] for r in results])
+    lifting = np.concatenate([r["is_lifting"] for r in results])
+    alerts = 0
+    for r in results:
+        alarm = r["confirmed_status"] >= 3
+        alerts += int(alarm[0]) + int(np.count_nonzero(alarm[1:] & ~alarm[:-1]))
+    total = max(len(confirmed), 1)
+    stats = {"frames": int(len(confirmed)), "lifting": float(lifting.mean()) if len(lifting) else 0.0,
+             "alerts": alerts}
+    for code, name in enumerate(STATUS_ORDER):
+        if name != "monitoring":
+            stats[name] = float(np.count_nonzero(confirmed == code) / total)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="landmarks 序列離線重播與門檻評估")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--recordings", help="session_recorder 的 segment 目錄")
+    source.add_argument("--synthetic", type=int, help="合成總幀數")
+    parser.add_argument("--sessions", type=int, default=10, help="合成 session 數")
+    parser.add_argument("--parity", type=int, default=0, help="前 N 幀與逐幀實作比對")
+    parser.add_argument("--ml", action="store_true", help="同時跑 30 幀視窗 + 模型")
+    parser.add_argument("--warning", nargs="+", type=float, default=[SPINE_THRESHOLDS["warning"]])
+    parser.add_argument("--danger", nargs="+", type=float, default=[SPINE_THRESHOLDS["danger"]])
+    parser.add_argument("--frames", nargs="+", type=int, default=[STABILITY_CONFIG["frame_threshold"]])
+    parser.add_argument("--json", help="把統計結果另存為 JSON")
+    args = parser.parse_args()
+
+    if args.recordings:
+        sessions = load_recordings(args.recordings)
+    else:
+        per = args.synthetic // args.sessions
+        sessions = {f"synthetic-{i}": synthetic_session(per, seed=i) for i in range(args.sessions)}
+    total = sum(len(p) for p in sessions.values())
+    print(f"📼 {len(sessions)} sessions，{total:,} 幀")
+    if args.ml and not app.init_ml_model():
+        args.ml = False
+
+    report = {"sessions": len(sessions), "frames": total}
+
+    if args.parity:
+        first = next(iter(sessions.values()))
+        n, mismatches = parity_check(first, args.parity, args.ml)
+        ok = not any(mismatches.values())
+        print(f"{'✅' if ok else '⚠️'} 逐幀一致性（{n:,} 幀）：{mismatches}")
+        report["parity"] = {"frames": n, "mismatches": mismatches}
+
+    # 幾何與 EMA 只算一次，門檻掃描只重跑 _spine_status
+    t0 = time.perf_counter()
+    base = {sid: spine_batch(points) for sid, points in sessions.items()}
+    elapsed = time.perf_counter() - t0
+    print(f"🏥 圓背偵測：{elapsed:.2f}s，{total / max(elapsed, 1e-9) * 60 / 1e6:,.1f}M 幀/分鐘")
+    report["spine_frames_per_min"] = total / max(elapsed, 1e-9) * 60
+
+    if args.ml:
+        t0 = time.perf_counter()
+        counts = np.zeros(len(app.mlb.classes_), dtype=int)
+        windows = 0
+        for points in sessions.values():
+            pred = predict_windows(window_vectors(frame_features_batch(points)))
+            counts += pred.sum(axis=0)
+            windows += len(pred)
+        elapsed = time.perf_counter() - t0
+        label_freq = {str(label): float(c / max(windows, 1)) for label, c in zip(app.mlb.classes_, counts)}
+        print(f"🤖 視窗推論：{windows:,} 個視窗，{elapsed:.2f}s，{windows / max(elapsed, 1e-9) * 60 / 1e6:,.2f}M 視窗/分鐘")
+        print("   標籤比例：" + "，".join(f"{k} {v:.1%}" for k, v in label_freq.items()))
+        report["ml"] = {"windows": windows, "label_frequency": label_freq}
+
+    print(f"\n{'warning':>8} {'danger':>7} {'frames':>7} {'lifting':>8} {'safe':>7} {'warning':>8} "
+          f"{'danger':>7} {'critical':>9} {'alerts':>7}")
+    report["sweep"] = []
+    for warning, danger, frames in itertools.product(args.warning, args.danger, args.frames):
+        thresholds = dict(SPINE_THRESHOLDS, warning=warning, danger=danger)
+        stability = dict(STABILITY_CONFIG, frame_threshold=frames)
+        results = [_spine_status(b["raw_angle"], b["spine_curvature"], b["hip_angle"],
+                                 thresholds, stability, DEADLIFT_DETECTION) for b in base.values()]
+        stats = alert_stats(results)
+        print(f"{warning:>8g} {danger:>7g} {frames:>7d} {stats['lifting']:>8.1%} {stats['safe']:>7.1%} "
+              f"{stats['warning']:>8.1%} {stats['danger']:>7.1%} {stats['critical']:>9.1%} {stats['alerts']:>7d}")
+        report["sweep"].append(dict(stats, warning=warning, danger=danger, frame_threshold=frames))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
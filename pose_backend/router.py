@@ -0,0 +1,242 @@
+"""
+router.py
+
+session 親和路由：把同一個 session_id 固定送到同一個 pose_backend 實例，讓程序內的 session 狀態
+（30 幀視窗、連續幀計數）不必共用也能水平擴充。
+
+- 一致性雜湊環：每個實例 vnodes 個虛擬節點；實例加入 / 離開時只有約 1/N 的 session 換實例
+- session_id 來源：X-Session-Id 標頭 > 查詢參數 session_id > /predict JSON body 的 session_id > 用戶端 IP
+- 轉送 /predict、/api/pose（及其他路徑）；httpx.AsyncClient 連線池重複使用 TCP 連線
+- 健康檢查：每 health_interval 秒呼叫各實例的 /api/ping，不健康的實例從環上移除、恢復後加回；
+  轉送時連線失敗會立即標記不健康並改送環上的下一個實例
+
+用法：
+    ROUTER_BACKENDS=http://127.0.0.1:8001,http://127.0.0.1:8002 uv run uvicorn router:app --port 8000
+"""
+import os
+import time
+import json
+import bisect
+import asyncio
+import hashlib
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import httpx  # type: ignore
+    HAVE_HTTPX = True
+except Exception:
+    HAVE_HTTPX = False
+
+ROUTER = {
+    "backends": [b.strip().rstrip("/") for b in os.environ.get("ROUTER_BACKENDS", "").split(",") if b.strip()],
+    "vnodes": int(os.environ.get("ROUTER_VNODES", 160)),
+    "health_path": "/api/ping",
+    "health_interval": float(os.environ.get("ROUTER_HEALTH_INTERVAL", 2.0)),
+    "health_timeout": 1.0,
+    "request_timeout": float(os.environ.get("ROUTER_REQUEST_TIMEOUT", 30.0)),
+    "max_connections": int(os.environ.get("ROUTER_MAX_CONNECTIONS", 200)),
+}
+
+# 不轉送的 hop-by-hop 標頭
+HOP_HEADERS = {"host", "content-length", "connection", "keep-alive", "transfer-encoding", "te", "trailer", "upgrade"}
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, nodes=(), vnodes=ROUTER["vnodes"]):
+        self.vnodes = vnodes
+        self._keys = []
+        self._owners = []
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for v in range(self.vnodes):
+            h = _hash(f"{node}#{v}")
+            i = bisect.bisect(self._keys, h)
+            self._keys.insert(i, h)
+            self._owners.insert(i, node)
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        keep = [(k, o) for k, o in zip(self._keys, self._owners) if o != node]
+        self._keys = [k for k, _ in keep]
+        self._owners = [o for _, o in keep]
+
+    def get(self, key, skip=()):
+        """key 落在環上的實例；skip 內的實例略過（改送順時針的下一個）"""
+        if not self._keys:
+            return None
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        for step in range(len(self._keys)):
+            owner = self._owners[(i + step) % len(self._keys)]
+            if owner not in skip:
+                return owner
+        return None
+
+
+class Router:
+    def __init__(self, backends=ROUTER["backends"], config=ROUTER):
+        self.config = config
+        self.backends = list(backends)
+        self.healthy = set(self.backends)
+        self.ring = HashRing(self.backends, config["vnodes"])
+        self.stats = {b: {"requests": 0, "errors": 0} for b in self.backends}
+        self.client = None
+        self._health_task = None
+
+    # ---------- 實例管理 ----------
+    def add_backend(self, url):
+        url = url.rstrip("/")
+        if url not in self.backends:
+            self.backends.append(url)
+            self.stats[url] = {"requests": 0, "errors": 0}
+        self.mark(url, True)
+
+    def remove_backend(self, url):
+        url = url.rstrip("/")
+        self.mark(url, False)
+        if url in self.backends:
+            self.backends.remove(url)
+
+    def mark(self, url, healthy):
+        if healthy and url not in self.healthy:
+            self.healthy.add(url)
+            self.ring.add(url)
+            print(f"✅ Backend up: {url}")
+        elif not healthy and url in self.healthy:
+            self.healthy.discard(url)
+            self.ring.remove(url)
+            print(f"⚠️ Backend down: {url}")
+
+    # ---------- 生命週期 ----------
+    async def start(self):
+        self.client = httpx.AsyncClient(
+            timeout=self.config["request_timeout"],
+            limits=httpx.Limits(max_connections=self.config["max_connections"],
+                                max_keepalive_connections=self.config["max_connections"]),
+        )
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop(self):
+        if self._health_task:
+            self._health_task.cancel()
+        if self.client:
+            await self.client.aclose()
+
+    async def check(self, url):
+        try:
+            r = await self.client.get(url + self.config["health_path"], timeout=self.config["health_timeout"])
+            return r.status_code == 200
+        except httpx.HTTPError:
+            return False
+
+    async def _health_loop(self):
+        while True:
+            backends = list(self.backends)
+            results = await asyncio.gather(*(self.check(b) for b in backends))
+            for backend, ok in zip(backends, results):
+                if backend in self.backends:
+                    self.mark(backend, ok)
+            await asyncio.sleep(self.config["health_interval"])
+
+    # ---------- 轉送 ----------
+    async def forward(self, request: Request, key: str, body: bytes):
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_HEADERS}
+        tried = set()
+        while True:
+            backend = self.ring.get(key, skip=tried)
+            if backend is None:
+                return JSONResponse({"success": False, "error": "no healthy backend"}, status_code=503)
+            try:
+                r = await self.client.request(request.method, backend + request.url.path,
+                                              params=request.query_params, headers=headers, content=body)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                # 連不上（請求還沒送出）：立即移出環，改送下一個實例（健康檢查恢復後會自動加回）
+                self.stats[backend]["errors"] += 1
+                self.mark(backend, False)
+                tried.add(backend)
+                continue
+            except httpx.TransportError as e:
+                # 請求可能已送達（例如 /predict 處理較慢、POST /jobs 上傳中）：不重送到其他實例，
+                # 也不判定為故障，交給健康檢查
+                self.stats[backend]["errors"] += 1
+                status = 504 if isinstance(e, httpx.TimeoutException) else 502
+                return JSONResponse({"success": False, "error": f"backend {type(e).__name__}"},
+                                    status_code=status, headers={"X-Backend": backend})
+            self.stats[backend]["requests"] += 1
+            out_headers = {k: v for k, v in r.headers.items() if k.lower() not in HOP_HEADERS | {"content-encoding"}}
+            out_headers["X-Backend"] = backend
+            return Response(content=r.content, status_code=r.status_code, headers=out_headers)
+
+
+def session_key(request: Request, body: bytes):
+    key = request.headers.get("x-session-id") or request.query_params.get("session_id")
+    if key:
+        return key
+    if body and request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            session = json.loads(body).get("session_id")
+            if session:
+                return str(session)
+        except (ValueError, AttributeError):
+            pass
+    return request.client.host if request.client else "anonymous"
+
+
+app = FastAPI(title="Pose Backend Session Router")
+router = Router()
+
+
+@app.on_event("startup")
+async def start_router():
+    if not HAVE_HTTPX:
+        raise RuntimeError("httpx is not installed. Install with: pip install httpx")
+    await router.start()
+
+
+@app.on_event("shutdown")
+async def stop_router():
+    await router.stop()
+
+
+@app.get("/router/status")
+def router_status():
+    return {
+        "backends": router.backends,
+        "healthy": sorted(router.healthy),
+        "vnodes": router.ring.vnodes,
+        "stats": router.stats,
+        "time": time.time(),
+    }
+
+
+@app.post("/router/backends")
+async def add_backend(request: Request):
+    url = (await request.json()).get("url")
+    if not url:
+        return JSONResponse({"success": False, "error": "url is required"}, status_code=400)
+    router.add_backend(url)
+    return {"success": True, "backends": router.backends}
+
+
+@app.delete("/router/backends")
+async def remove_backend(url: str):
+    router.remove_backend(url)
+    return {"success": True, "backends": router.backends}
+
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"])
+async def proxy(path: str, request: Request):
+    body = await request.body()
+    return await router.forward(request, session_key(request, body), body)
@@ -0,0 +1,118 @@
+"""
+session_analytics.py
+
+每個 session 的訓練摘要：在 /predict 中逐幀以常數時間、常數記憶體更新，不保留逐幀資料，
+10 分鐘與 2 小時的 session 摘要大小與查詢成本相同（GET /session/{id}/summary）。
+
+依 /predict 回應（detect_rounded_back 的 spine 結果、ML 標籤、rep 資訊）累加：
+- 時間：相鄰幀的時間差（客戶端 timestamp，未提供時用伺服器的牆上時間）計入該幀的 confirmed_status；
+  超過 max_gap_seconds 的間隔（暫停、離開）只計 max_gap_seconds
+- 次數：兩種 ML 模式都以 rep_segmenter 的 rep.completed 計（遲滯 + 最少幀數 / 深度），
+  與回應的 rep.count 一致；is_lifting 在門檻附近抖動不會多計
+- 曲率：整個 session 的最大 spine_curvature（與所在的 rep），以及每一下最大曲率的平均 / 最大；
+  進行中這一下以 rep.phase 判斷，被 rep_segmenter 捨棄的一下（太淺、太短、太長）不計入
+- 標籤：每個標籤出現在幾下之中（rep.last.labels：rep 模式為該下的分類結果，window 模式為該下期間視窗標籤的聯集），
+  以及 ML 就緒的幀中各標籤出現的幀數
+"""
+import time
+
+SESSION_ANALYTICS = {
+    "max_gap_seconds": 1.0,     # 相鄰幀間隔上限，避免暫停被計入某個狀態
+}
+
+SPINE_STATUSES = ["safe", "warning", "danger", "critical", "error"]
+
+
+def new_session_stats():
+    return {
+        "frames": 0,
+        "started_at": None,
+        "last_ts": None,
+        "duration": 0.0,
+        "paths": {},
+        "status_time": {s: 0.0 for s in SPINE_STATUSES},
+        "lifting_time": {s: 0.0 for s in SPINE_STATUSES},
+        "reps": 0,
+        "peak": {"curvature": 0.0, "rep": None, "ts": None},
+        "rep_peak": {"sum": 0.0, "max": 0.0},           # 每一下最大曲率的總和 / 最大
+        "current_peak": 0.0,                             # 進行中這一下的最大曲率
+        "labels_per_rep": {},
+        "ml_frames": 0,
+        "label_frames": {},
+    }
+
+
+def _finish_rep(stats, labels):
+    stats["reps"] += 1
+    peak = stats["current_peak"]
+    stats["rep_peak"]["sum"] += peak
+    stats["rep_peak"]["max"] = max(stats["rep_peak"]["max"], peak)
+    for label in labels:
+        stats["labels_per_rep"][label] = stats["labels_per_rep"].get(label, 0) + 1
+    stats["current_peak"] = 0.0
+
+
+def update_session_stats(stats, response, ts=None, config=SESSION_ANALYTICS):
+    """以一幀的 /predict 回應更新摘要（呼叫端須持有該 session 的鎖）"""
+    ts = ts if ts is not None else time.time()     # 牆上時間：多個 worker 程序之間可比較
+    spine = response["spine"]
+    status = spine.get("confirmed_status", spine.get("status", "safe"))
+    lifting = spine.get("is_lifting", False)
+    path = response.get("path", "full")
+
+    stats["frames"] += 1
+    stats["paths"][path] = stats["paths"].get(path, 0) + 1
+    if stats["started_at"] is None:
+        stats["started_at"] = ts
+    elif stats["last_ts"] is not None:
+        dt = min(max(ts - stats["last_ts"], 0.0), config["max_gap_seconds"])
+        stats["duration"] += dt
+        stats["status_time"][status] = stats["status_time"].get(status, 0.0) + dt
+        if lifting:
+            stats["lifting_time"][status] = stats["lifting_time"].get(status, 0.0) + dt
+    stats["last_ts"] = ts
+
+    rep = response.get("rep")
+    in_rep = rep is not None and rep.get("phase", "standing") != "standing"
+    curvature = spine.get("spine_curvature", 0.0)
+    if in_rep and path == "full":
+        stats["current_peak"] = max(stats["current_peak"], curvature)
+        if curvature > stats["peak"]["curvature"]:
+            stats["peak"] = {"curvature": curvature, "rep": stats["reps"] + 1, "ts": ts}
+
+    labels = response.get("A") or []
+    if response.get("ml_ready"):
+        stats["ml_frames"] += 1
+        for label in labels:
+            stats["label_frames"][label] = stats["label_frames"].get(label, 0) + 1
+
+    if rep is not None and rep.get("completed"):
+        _finish_rep(stats, (rep.get("last") or {}).get("labels") or [])
+    elif not in_rep:
+        # 站立中，或 rep_segmenter 捨棄了這一下：不把它的曲率帶到下一下
+        stats["current_peak"] = 0.0
+
+
+def session_summary(stats):
+    reps = stats["reps"]
+    ml_frames = stats["ml_frames"]
+    return {
+        "frames": stats["frames"],
+        "duration_s": round(stats["duration"], 1),
+        "reps": reps,
+        "time_by_status_s": {s: round(t, 1) for s, t in stats["status_time"].items() if t > 0},
+        "lifting_time_by_status_s": {s: round(t, 1) for s, t in stats["lifting_time"].items() if t > 0},
+        "peak_curvature": {
+            "value": round(stats["peak"]["curvature"], 1),
+            "rep": stats["peak"]["rep"],
+            "ts": stats["peak"]["ts"],
+        },
+        "rep_peak_curvature": {
+            "mean": round(stats["rep_peak"]["sum"] / reps, 1) if reps else None,
+            "max": round(stats["rep_peak"]["max"], 1) if reps else None,
+        },
+        "labels_per_rep": dict(sorted(stats["labels_per_rep"].items(), key=lambda kv: -kv[1])),
+        "label_frame_share": {label: round(n / ml_frames, 3)
+                              for label, n in sorted(stats["label_frames"].items(), key=lambda kv: -kv[1])},
+        "paths": stats["paths"],
+    }
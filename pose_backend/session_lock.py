@@ -0,0 +1,79 @@
+"""
+session_lock.py
+
+/predict 的 session 順序鎖：同一個 session 的幀依到達順序逐一處理，不同 session 在 threadpool 中完全平行。
+
+- 分段 (striped)：session_id 雜湊到固定數量的 stripe，每個 stripe 一把鎖；記憶體固定，不隨 session 數成長
+- 取號 (ticket)：在事件迴圈上依請求到達順序取號，執行緒只在輪到自己時才進入，
+  因此同 session 的幀不只互斥，也保證先到先處理（threading.Lock 本身不保證 FIFO）
+- 取了號卻沒執行（例如請求在排到 threadpool 前被取消）時用 abandon() 讓出號碼，避免後面的幀永遠等待
+
+兩個 session 落在同一 stripe 時會互相排隊；stripe 數遠大於同時處理的請求數時影響可忽略。
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+SESSION_LOCK = {
+    "stripes": int(os.environ.get("SESSION_LOCK_STRIPES", 256)),
+}
+
+
+class StripedSessionLock:
+    def __init__(self, stripes=SESSION_LOCK["stripes"]):
+        self.stripes = stripes
+        self._conds = [threading.Condition() for _ in range(stripes)]
+        self._next = [0] * stripes        # 下一個要發出的號碼
+        self._serving = [0] * stripes     # 目前輪到的號碼
+        self._abandoned = [set() for _ in range(stripes)]
+
+    def stripe(self, session_id):
+        return hash(session_id) % self.stripes
+
+    def ticket(self, session_id):
+        """取號；回傳 (stripe, 號碼)"""
+        i = self.stripe(session_id)
+        with self._conds[i]:
+            number = self._next[i]
+            self._next[i] += 1
+        return i, number
+
+    def _advance(self, i):
+        # 呼叫時須持有 self._conds[i]
+        self._serving[i] += 1
+        while self._serving[i] in self._abandoned[i]:
+            self._abandoned[i].discard(self._serving[i])
+            self._serving[i] += 1
+        self._conds[i].notify_all()
+
+    @contextmanager
+    def hold(self, ticket):
+        """等到輪到這個號碼才進入；離開時交給下一號"""
+        i, number = ticket
+        cond = self._conds[i]
+        with cond:
+            while self._serving[i] != number:
+                cond.wait()
+        try:
+            yield
+        finally:
+            with cond:
+                self._advance(i)
+
+    def abandon(self, ticket):
+        """放棄尚未使用的號碼（已處理過的號碼不受影響）"""
+        i, number = ticket
+        with self._conds[i]:
+            if number == self._serving[i]:
+                self._advance(i)
+            elif number > self._serving[i]:
+                self._abandoned[i].add(number)
+
+    @contextmanager
+    def lock(self, session_id):
+        """取號並等待，供非事件迴圈的呼叫端使用"""
+        with self.hold(self.ticket(session_id)):
+            yield
+
+
+session_locks = StripedSessionLock()
@@ -0,0 +1,243 @@
+"""
+session_recorder.py
+
+/predict 逐幀紀錄（選用，SESSION_RECORDING=1 開啟），供重新訓練與除錯：
+
+    <dir>/seg_<開始時間>_<pid>_<序號>.rec    固定大小的二進位紀錄（RECORD_DTYPE），無標頭，只會附加
+    <dir>/seg_<開始時間>_<pid>_<序號>.json   側檔：dtype 版本、session 對照表、標籤表、狀態碼表
+
+- 請求端只做一次 numpy 結構填寫 + put_nowait，寫檔在背景執行緒批次進行
+- 佇列有上限；滿了就丟棄並計數（dropped），不會拖慢 /predict
+- 每個程序只有一個 SessionRecorder，所有 session 寫入同一組輪替 segment，超過 max_records 就換新檔；
+  檔名含 pid，同一秒啟動的多個 worker 程序不會寫到同一個檔案
+- 讀回：np.memmap(path, dtype=RECORD_DTYPE, mode="r")，或用 load_segment()
+"""
+import os
+import json
+import time
+import queue
+import hashlib
+import tempfile
+import threading
+import numpy as np
+
+SESSION_RECORDING = {
+    "enabled": os.environ.get("SESSION_RECORDING", "0") == "1",
+    "dir": os.environ.get("SESSION_RECORDING_DIR", "recordings"),
+    "max_records": int(os.environ.get("SESSION_RECORDING_MAX_RECORDS", 200_000)),  # 約 115MB / segment
+    "queue_size": 4096,       # 尚未寫入的幀數上限
+    "batch_size": 256,        # 背景執行緒每次最多合併寫入的幀數
+    "flush_interval": 1.0,    # 秒；沒有新資料時也會定期 flush 與更新側檔
+}
+
+RECORD_VERSION = 1
+STATUS_CODES = ["safe", "monitoring", "warning", "danger", "critical", "error"]
+PATH_CODES = ["full", "static", "low_visibility", "degraded"]
+
+RECORD_DTYPE = np.dtype([
+    ("session", "<u8"),            # session_id 的 64-bit 雜湊，對照表在側檔
+    ("server_ts", "<f8"),          # 伺服器收到的時間 (time.time())
+    ("client_ts", "<f8"),          # 客戶端 timestamp，未提供時 NaN
+    ("landmarks", "<f4", (33, 4)), # x, y, z, visibility
+    ("spine_curvature", "<f4"),
+    ("raw_angle", "<f4"),
+    ("hip_angle", "<f4"),
+    ("status", "u1"),              # STATUS_CODES 索引
+    ("confirmed_status", "u1"),
+    ("path", "u1"),                # PATH_CODES 索引
+    ("flags", "u1"),               # bit0 is_lifting, bit1 is_rounded, bit2 ml_ready
+    ("warning_frames", "<u2"),
+    ("danger_frames", "<u2"),
+    ("labels", "<u4"),             # 標籤位元遮罩，位元順序見側檔 labels
+])
+
+
+def session_key(session_id):
+    return int.from_bytes(hashlib.blake2b(session_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _code(table, value):
+    try:
+        return table.index(value)
+    except ValueError:
+        return 255
+
+
+class SessionRecorder:
+    def __init__(self, config=SESSION_RECORDING):
+        self.config = config
+        self.queue = queue.Queue(maxsize=config["queue_size"])
+        self.sessions = {}             # key → session_id
+        self.labels = []               # 位元順序
+        self.dropped = 0
+        self.written = 0
+        self._segment_index = 0
+        self._segment_records = 0
+        self._segment_sessions = set()
+        self._segment_path = None
+        self._file = None
+        self._dirty = False
+        self._lock = threading.Lock()  # 保護 sessions / labels（請求執行緒與寫入執行緒共用）
+        self._stop = threading.Event()
+        os.makedirs(config["dir"], exist_ok=True)
+        self._started = time.strftime("%Y%m%d_%H%M%S")
+        self._thread = threading.Thread(target=self._run, name="session-recorder", daemon=True)
+        self._thread.start()
+
+    # ---------- 請求端 ----------
+    def _label_mask(self, labels):
+        mask = 0
+        for label in labels:
+            if label not in self.labels:
+                with self._lock:
+                    if label not in self.labels and len(self.labels) < 32:
+                        self.labels.append(label)
+            if label in self.labels:
+                mask |= 1 << self.labels.index(label)
+        return mask
+
+    def record(self, session_id, landmarks, client_ts, spine, labels, ml_ready, path):
+        """填一筆紀錄丟進佇列；佇列滿時丟棄，不阻塞"""
+        rec = np.zeros((), dtype=RECORD_DTYPE)
+        key = session_key(session_id)
+        if key not in self.sessions:
+            with self._lock:
+                self.sessions[key] = session_id
+        rec["session"] = key
+        rec["server_ts"] = time.time()
+        rec["client_ts"] = client_ts if client_ts is not None else np.nan
+        rec["landmarks"][:len(landmarks)] = [
+            (lm.x, lm.y, lm.z, lm.visibility if lm.visibility is not None else 1.0) for lm in landmarks[:33]
+        ]
+        rec["spine_curvature"] = spine.get("spine_curvature", 0)
+        rec["raw_angle"] = spine.get("raw_angle", 0)
+        rec["hip_angle"] = spine.get("hip_angle", 180)
+        rec["status"] = _code(STATUS_CODES, spine.get("status"))
+        rec["confirmed_status"] = _code(STATUS_CODES, spine.get("confirmed_status"))
+        rec["path"] = _code(PATH_CODES, path)
+        rec["flags"] = (bool(spine.get("is_lifting")) | bool(spine.get("is_rounded")) << 1 | bool(ml_ready) << 2)
+        rec["warning_frames"] = min(int(spine.get("warning_frames", 0)), 65535)
+        rec["danger_frames"] = min(int(spine.get("danger_frames", 0)), 65535)
+        rec["labels"] = self._label_mask(labels)
+        try:
+            self.queue.put_nowait(rec)
+        except queue.Full:
+            self.dropped += 1
+
+    # ---------- 寫入執行緒 ----------
+    def _open_segment(self):
+        self._segment_index += 1
+        self._segment_records = 0
+        self._segment_sessions = set()
+        name = f"seg_{self._started}_{os.getpid()}_{self._segment_index:04d}"
+        self._segment_path = os.path.join(self.config["dir"], name + ".rec")
+        self._file = open(self._segment_path, "ab")
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._file.close()
+            self._write_sidecar()
+            self._file = None
+
+    def _write_sidecar(self):
+        with self._lock:
+            meta = {
+                "version": RECORD_VERSION,
+                "dtype": RECORD_DTYPE.descr,
+                "records": self._segment_records,
+                "sessions": {str(k): self.sessions[k] for k in sorted(self._segment_sessions)},
+                "labels": list(self.labels),
+                "status_codes": STATUS_CODES,
+                "path_codes": PATH_CODES,
+            }
+        path = self._segment_path[:-len(".rec")] + ".json"
+        fd, tmp = tempfile.mkstemp(dir=self.config["dir"], suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _write_batch(self, batch):
+        while batch:
+            if self._file is None or self._segment_records >= self.config["max_records"]:
+                self._close_segment()
+                self._open_segment()
+            room = self.config["max_records"] - self._segment_records
+            chunk, batch = batch[:room], batch[room:]
+            records = np.stack(chunk)
+            self._file.write(records.tobytes())
+            self._segment_sessions.update(int(k) for k in np.unique(records["session"]))
+            self._segment_records += len(chunk)
+            self.written += len(chunk)
+            self._dirty = True
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while not (self._stop.is_set() and self.queue.empty()):
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=self.config["flush_interval"]))
+                while len(batch) < self.config["batch_size"]:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch:
+                self._write_batch(batch)
+            if self._dirty and (time.monotonic() - last_flush >= self.config["flush_interval"] or not batch):
+                self._file.flush()
+                self._write_sidecar()
+                self._dirty = False
+                last_flush = time.monotonic()
+        self._close_segment()
+
+    def close(self, timeout=5.0):
+        """寫完佇列中剩下的紀錄後結束背景執行緒"""
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {"written": self.written, "dropped": self.dropped, "pending": self.queue.qsize(),
+                "segment": os.path.basename(self._segment_path) if self._segment_path else None}
+
+
+# ==========================================
+# 讀回
+# ==========================================
+def load_segment(path):
+    """回傳 (np.memmap 紀錄陣列, 側檔 meta)；只讀取完整的紀錄"""
+    rec_path = path if path.endswith(".rec") else path + ".rec"
+    with open(rec_path[:-len(".rec")] + ".json", encoding="utf-8") as f:
+        meta = json.load(f)
+    count = os.path.getsize(rec_path) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE), meta
+    return np.memmap(rec_path, dtype=RECORD_DTYPE, mode="r", shape=(count,)), meta
+
+
+def list_segments(directory=SESSION_RECORDING["dir"]):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".rec"))
+
+
+def decode_labels(mask, labels):
+    return [label for bit, label in enumerate(labels) if mask >> bit & 1]
+
+
+recorder = None
+_recorder_lock = threading.Lock()   # get_recorder 由 threadpool 的多個執行緒同時呼叫
+
+
+def get_recorder():
+    """SESSION_RECORDING 開啟時回傳共用的 SessionRecorder，否則 None"""
+    global recorder
+    if recorder is None and SESSION_RECORDING["enabled"]:
+        with _recorder_lock:
+            if recorder is None:
+                recorder = SessionRecorder()
+    return recorder
+
+
+def shutdown():
+    global recorder
+    with _recorder_lock:
+        if recorder is not None:
+            recorder.close()
+            recorder = None
@@ -0,0 +1,112 @@
+"""
+session_store.py
+
+/predict 的 session 狀態後端（SESSION_STORE 環境變數選擇）：
+
+    memory（預設）— 狀態留在 app.py 的 user_* dict，單一程序，不做任何序列化
+    sqlite       — 本機共用的 key-value（SQLite WAL），多個 uvicorn worker / 同一台機器上的容器共用；
+                   每幀開始時載入、結束時寫回，連續幀落在不同程序也能接續 30 幀視窗與連續幀計數
+
+每個 session 存一份 pickle 後的精簡狀態：圓背計數器與 EMA、30×14 特徵視窗 (ndarray)、rep 切分累加器、閘門狀態，
+約 5KB。寫回採樂觀鎖（version 欄位），同一 session 的兩幀同時在不同程序處理時，後寫入者重新載入並重算該幀。
+閒置超過 ttl_seconds 的 session 會被定期清除。
+"""
+import os
+import time
+import pickle
+import sqlite3
+import threading
+
+SESSION_STORE = {
+    "backend": os.environ.get("SESSION_STORE", "memory"),
+    "path": os.environ.get("SESSION_STORE_PATH", "session_state.sqlite3"),
+    "ttl_seconds": int(os.environ.get("SESSION_STORE_TTL", 1800)),
+    "max_retries": 3,             # 樂觀鎖衝突時重算的次數上限
+    "evict_every": 1000,          # 每寫入幾次清除一次過期 session
+}
+
+
+class InProcessStore:
+    """預設：狀態就是 app.py 的 user_* dict，不需要載入 / 寫回"""
+    shared = False
+
+    def load(self, session_id):
+        return None, 0
+
+    def save(self, session_id, state, version):
+        return True
+
+
+class SqliteSessionStore:
+    shared = True
+
+    def __init__(self, path=SESSION_STORE["path"], ttl_seconds=SESSION_STORE["ttl_seconds"]):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._writes = 0
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_state ("
+                " session_id TEXT PRIMARY KEY, version INTEGER NOT NULL, updated_at REAL NOT NULL, state BLOB NOT NULL)"
+            )
+
+    def _conn(self):
+        # sqlite3 連線不能跨執行緒共用，每個 threadpool 執行緒各開一條
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, session_id):
+        """回傳 (狀態 dict 或 None, version)；不存在時 version 為 0"""
+        row = self._conn().execute(
+            "SELECT version, state FROM session_state WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None, 0
+        return pickle.loads(row[1]), row[0]
+
+    def save(self, session_id, state, version):
+        """version 與載入時相同才寫入，回傳是否成功（False = 其他程序已先寫入）"""
+        blob = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        conn = self._conn()
+        if version == 0:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO session_state (session_id, version, updated_at, state) VALUES (?, 1, ?, ?)",
+                (session_id, now, blob),
+            )
+        else:
+            cur = conn.execute(
+                "UPDATE session_state SET version = version + 1, updated_at = ?, state = ?"
+                " WHERE session_id = ? AND version = ?",
+                (now, blob, session_id, version),
+            )
+        self._writes += 1
+        if self._writes % SESSION_STORE["evict_every"] == 0:
+            self.evict_expired()
+        return cur.rowcount == 1
+
+    def delete(self, session_id):
+        self._conn().execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+
+    def evict_expired(self):
+        cur = self._conn().execute("DELETE FROM session_state WHERE updated_at < ?",
+                                   (time.time() - self.ttl_seconds,))
+        return cur.rowcount
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM session_state").fetchone()[0]
+
+
+def create_store(backend=None):
+    backend = backend or SESSION_STORE["backend"]
+    if backend == "sqlite":
+        return SqliteSessionStore()
+    if backend != "memory":
+        print(f"⚠️ Unknown SESSION_STORE '{backend}', using in-process state")
+    return InProcessStore()
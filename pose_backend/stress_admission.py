@@ -0,0 +1,120 @@
+"""
+stress_admission.py
+
+突發流量下的准入控制：先讓 --existing 個 session 正常送幀，再同時湧入 --burst 個新 session，
+分別在准入控制開啟 / 關閉時比較：
+
+- 既有 session 的延遲（p50 / p95）與超過 --deadline 的比例（前端視為逾時）
+- 既有 session 被降級（path = degraded，只做圓背偵測）的幀比例
+- 新 session 放行與始終被拒絕（503 + Retry-After）的數量
+- 最後的 /api/metrics 降載狀態
+
+以 httpx.ASGITransport 直接呼叫 app（含 middleware 與 threadpool），不需要啟動 uvicorn。
+
+用法：
+    uv run python stress_admission.py --existing 8 --burst 120 --frames 40 --max-sessions 32
+"""
+import time
+import asyncio
+import argparse
+
+import httpx
+import numpy as np
+
+import app
+from replay_eval import synthetic_session
+
+
+def reset_state():
+    for state in (app.user_spine_state, app.user_windows, app.user_rep_state, app.user_gate_state):
+        state.clear()
+    app.admission.sessions.clear()
+    for key in app.admission.counters:
+        app.admission.counters[key] = 0
+    app.load_monitor.service_ms = 0.0
+
+
+def frames_for(session, n, seed):
+    return [{"session_id": session, "points": p.ravel().tolist(), "timestamp": i / 10}
+            for i, p in enumerate(synthetic_session(n, seed=seed))]
+
+
+async def run_session(client, frames, results, interval=0.1):
+    """依伺服器建議（hint / Retry-After）的間隔依序送幀，記錄 (延遲秒數, 狀態碼, path)"""
+    for frame in frames:
+        t0 = time.perf_counter()
+        r = await client.post("/predict", json=frame)
+        latency = time.perf_counter() - t0
+        body = r.json()
+        results.append((latency, r.status_code, body.get("path")))
+        if r.status_code == 503:
+            await asyncio.sleep(min(float(r.headers.get("retry-after", 1)), 1.0))   # 測試中縮短等待
+            continue
+        await asyncio.sleep(max(body.get("hint", {}).get("interval_ms", interval * 1000) / 1000 - latency, 0))
+
+
+async def scenario(args, enabled):
+    reset_state()
+    app.ADMISSION["enabled"] = enabled
+    transport = httpx.ASGITransport(app=app.app)
+    existing = [f"existing-{k}" for k in range(args.existing)]
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        # 暖身：既有 session 先進入活躍名單並累積視窗
+        await asyncio.gather(*(run_session(client, frames_for(s, 30, k), []) for k, s in enumerate(existing)))
+
+        old, new = {s: [] for s in existing}, {}
+        tasks = [run_session(client, frames_for(s, args.frames, 100 + k), old[s]) for k, s in enumerate(existing)]
+        for k in range(args.burst):
+            session = f"burst-{k}"
+            new[session] = []
+            tasks.append(run_session(client, frames_for(session, args.frames, 1000 + k), new[session]))
+        t0 = time.perf_counter()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - t0
+        metrics = (await client.get("/api/metrics")).json()["admission"]
+
+    latencies = np.array([r[0] for rs in old.values() for r in rs])
+    paths = [r[2] for rs in old.values() for r in rs]
+    refused = sum(all(r[1] == 503 for r in rs) for rs in new.values())
+    admitted = sum(any(r[1] == 200 for r in rs) for rs in new.values())
+    return {
+        "p50": np.percentile(latencies, 50) * 1000,
+        "p95": np.percentile(latencies, 95) * 1000,
+        "late": float(np.mean(latencies > args.deadline)),
+        "degraded": paths.count("degraded") / max(len(paths), 1),
+        "refused": refused,
+        "admitted": admitted,
+        "elapsed": elapsed,
+        "metrics": metrics,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="突發流量下的准入控制與降載")
+    parser.add_argument("--existing", type=int, default=8)
+    parser.add_argument("--burst", type=int, default=120)
+    parser.add_argument("--frames", type=int, default=40)
+    parser.add_argument("--max-sessions", type=int, default=32)
+    parser.add_argument("--deadline", type=float, default=1.0, help="既有 session 單幀延遲超過此秒數視為逾時")
+    parser.add_argument("--mode", choices=["rep", "window"], default="window")
+    args = parser.parse_args()
+
+    app.ML_INFERENCE_MODE = args.mode
+    app.ADMISSION["max_sessions"] = args.max_sessions
+    app.init_ml_model()
+    print(f"🏋️ {args.existing} 個既有 session + 突發 {args.burst} 個新 session × {args.frames} 幀，"
+          f"模式 {args.mode}，max_sessions {args.max_sessions}\n")
+    print(f"{'准入控制':>8} {'p50 ms':>8} {'p95 ms':>8} {'逾時':>6} {'降級':>6} {'新 session 放行':>14} {'始終被拒':>8} {'總秒數':>7}")
+    for enabled in (False, True):
+        r = asyncio.run(scenario(args, enabled))
+        print(f"{'開' if enabled else '關':>8} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['late']:>6.1%} {r['degraded']:>6.1%} "
+              f"{r['admitted']:>14} {r['refused']:>8} {r['elapsed']:>7.1f}")
+        if enabled:
+            m = r["metrics"]
+            print(f"\n/api/metrics：state={m['state']} active={m['active_sessions']}/{m['max_sessions']} "
+                  f"memory={m['memory_mb']}MB pressure={m['pressure']} refused_sessions={m['refused_sessions']} "
+                  f"degraded_frames={m['degraded_frames']}")
+
+
+if __name__ == "__main__":
+    main()
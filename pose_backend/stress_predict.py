@@ -0,0 +1,122 @@
+"""
+stress_predict.py
+
+/predict 並行壓力測試：多個 session 的幀交錯送進 N 個執行緒，檢查 session 順序鎖的正確性與吞吐量。
+
+- 基準：單執行緒依序處理每個 session，記下每一幀的 spine_curvature（EMA，與處理順序相關）與最終狀態
+- 並行：每一輪把所有 session 的下一幀同時丟進 ThreadPoolExecutor（同 session 也會有多幀同時在途），
+  取號在送出端依序進行，與 /predict 在事件迴圈上取號相同
+- 正確性：每個 session 的曲率序列、rep 幀數、視窗長度都必須與基準完全相同
+- --no-lock：拿掉順序鎖對照，可看到亂序造成的不一致
+
+用法：
+    uv run python stress_predict.py --sessions 32 --frames 300 --workers 1 2 4 8
+"""
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import app
+from replay_eval import synthetic_session
+
+
+class NoLock:
+    """對照組：不做任何排序或互斥"""
+
+    def ticket(self, session_id):
+        return None
+
+    @contextmanager
+    def hold(self, ticket):
+        yield
+
+    def abandon(self, ticket):
+        pass
+
+
+def reset_state():
+    for state in (app.user_spine_state, app.user_windows, app.user_rep_state, app.user_gate_state):
+        state.clear()
+
+
+def make_frames(sessions, frames):
+    out = {}
+    for k in range(sessions):
+        points = synthetic_session(frames, seed=k)
+        out[f"stress-{k}"] = [
+            app.FrameData(session_id=f"stress-{k}", points=p.ravel().tolist(), timestamp=i / 10)
+            for i, p in enumerate(points)
+        ]
+    return out
+
+
+def snapshot(session):
+    rep = app.user_rep_state.get(session)
+    return {
+        "rep_frames": rep["frame"] if rep else None,
+        "window": len(app.user_windows.get(session, ())),
+        "smoothed": app.user_spine_state[session]["smoothed_angle"],
+    }
+
+
+def curvature(response):
+    return json.loads(response.body)["spine"]["spine_curvature"]
+
+
+def run_sequential(frames):
+    reset_state()
+    curves = {s: [curvature(app.predict_frame(d)) for d in seq] for s, seq in frames.items()}
+    return curves, {s: snapshot(s) for s in frames}
+
+
+def run_concurrent(frames, workers):
+    reset_state()
+    lock = app.session_locks
+    futures = {s: [] for s in frames}
+    n = max(len(seq) for seq in frames.values())
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i in range(n):
+            for s, seq in frames.items():
+                if i < len(seq):
+                    futures[s].append(pool.submit(app.predict_frame, seq[i], lock.ticket(s)))
+        curves = {s: [curvature(f.result()) for f in fs] for s, fs in futures.items()}
+    elapsed = time.perf_counter() - t0
+    return curves, {s: snapshot(s) for s in frames}, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/predict 並行壓力測試")
+    parser.add_argument("--sessions", type=int, default=32)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--mode", choices=["rep", "window"], default=app.ML_INFERENCE_MODE)
+    parser.add_argument("--no-lock", action="store_true", help="拿掉順序鎖作為對照")
+    args = parser.parse_args()
+
+    app.ML_INFERENCE_MODE = args.mode
+    app.FRAME_GATING["enabled"] = False       # 每一幀都完整處理，計數才有意義
+    app.init_ml_model()
+    if args.no_lock:
+        app.session_locks = NoLock()
+
+    frames = make_frames(args.sessions, args.frames)
+    total = args.sessions * args.frames
+    ref_curves, ref_state = run_sequential(frames)
+    print(f"🏋️ {args.sessions} sessions × {args.frames} 幀，模式 {args.mode}，"
+          f"{'無鎖（對照）' if args.no_lock else '順序鎖'}\n")
+    print(f"{'workers':>7} {'幀/秒':>9} {'加速':>6} {'亂序 session':>12} {'狀態不符':>8}")
+    base = None
+    for workers in args.workers:
+        curves, state, elapsed = run_concurrent(frames, workers)
+        rate = total / elapsed
+        base = base or rate
+        wrong_order = sum(curves[s] != ref_curves[s] for s in frames)
+        wrong_state = sum(state[s] != ref_state[s] for s in frames)
+        print(f"{workers:>7} {rate:>9.0f} {rate / base:>6.2f} {wrong_order:>12} {wrong_state:>8}")
+
+
+if __name__ == "__main__":
+    main()
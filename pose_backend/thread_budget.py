@@ -0,0 +1,160 @@
+"""
+thread_budget.py
+
+同一個程序內各元件的執行緒預算：MediaPipe 內部執行緒、NumPy / BLAS、sklearn (joblib)、OpenCV
+與 FastAPI（anyio）的 threadpool 各自預設依 CPU 數開執行緒，小型共享主機上會超額訂閱核心、拉高尾端延遲。
+
+預設關閉（THREAD_BUDGET=0），只回報各元件實際的執行緒數；THREAD_BUDGET=1 時套用下表：
+
+| 元件 | 環境變數 | 開啟時預設 | 設定方式 |
+|------|------|------|------|
+| BLAS / OpenMP | THREAD_BUDGET_BLAS | 1 | import numpy 前設 OMP/OPENBLAS/MKL_NUM_THREADS，啟動時再以 threadpoolctl 限制 |
+| sklearn | THREAD_BUDGET_SKLEARN | 1 | 載入模型後設定 n_jobs（單筆推論平行化只有額外成本） |
+| OpenCV | THREAD_BUDGET_OPENCV | 1 | cv2.setNumThreads |
+| threadpool | THREAD_BUDGET_THREADPOOL | 不變（anyio 預設 40） | anyio 預設 limiter 的 total_tokens |
+| MediaPipe | — | — | Python API 無法設定內部執行緒數，只回報程序的總執行緒數 |
+
+threadpool 縮小要小心：/predict 等待 session 順序鎖（session_lock.py）的請求也占用 threadpool 的名額，
+名額太少時一個慢的 session 會擋住其他 session。1 核主機上以 bench_threads.py 量測，各組預算的 /predict p99
+都在量測雜訊內、沒有穩定改善，所以預設不開；請在實際部署的機器上量測後再開啟。
+
+THREAD_BUDGET_CPUS 可選擇性設定 CPU affinity：
+    "0-1"        本程序綁在 CPU 0、1
+    "0-1;2-3"    多個 uvicorn worker 各自取一段：以檔案鎖搶第一個空的 slot，程序結束時自動釋放
+
+必須在 numpy / sklearn 之前 import（app.py 第一行），環境變數才會生效；已明確設定的環境變數不覆蓋。
+"""
+import os
+import tempfile
+
+
+THREAD_BUDGET = {
+    "enabled": os.environ.get("THREAD_BUDGET", "0") == "1",
+    "blas": int(os.environ.get("THREAD_BUDGET_BLAS", 1)),
+    "sklearn": int(os.environ.get("THREAD_BUDGET_SKLEARN", 1)),
+    "opencv": int(os.environ.get("THREAD_BUDGET_OPENCV", 1)),
+    "threadpool": int(os.environ["THREAD_BUDGET_THREADPOOL"]) if os.environ.get("THREAD_BUDGET_THREADPOOL") else None,
+    "cpus": os.environ.get("THREAD_BUDGET_CPUS", ""),
+}
+
+BLAS_ENV = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+if THREAD_BUDGET["enabled"]:
+    for name in BLAS_ENV:
+        os.environ.setdefault(name, str(THREAD_BUDGET["blas"]))
+
+_applied = {"affinity_slot": None, "threadpool": None}
+_slot_file = None
+
+
+def _parse_cpus(spec):
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if "-" in part:
+            lo, hi = part.split("-")
+            cpus.update(range(int(lo), int(hi) + 1))
+        elif part:
+            cpus.add(int(part))
+    return cpus
+
+
+def _claim_slot(slices):
+    """多個 worker 以檔案鎖各取一段 CPU；全部被占用時回傳 None"""
+    global _slot_file
+    import fcntl
+    for i in range(len(slices)):
+        path = os.path.join(tempfile.gettempdir(), f"pose_backend_cpu_slot_{i}.lock")
+        f = open(path, "w")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            continue
+        _slot_file = f          # 保持開啟直到程序結束
+        return i
+    return None
+
+
+def _apply_affinity(spec):
+    if not spec or not hasattr(os, "sched_setaffinity"):
+        return
+    slices = [s for s in spec.split(";") if s.strip()]
+    slot = 0 if len(slices) == 1 else _claim_slot(slices)
+    if slot is None:
+        print(f"⚠️ THREAD_BUDGET_CPUS: all {len(slices)} CPU slices are taken, affinity unchanged")
+        return
+    os.sched_setaffinity(0, _parse_cpus(slices[slot]))
+    _applied["affinity_slot"] = slot
+
+
+def apply():
+    """程序啟動時呼叫一次：BLAS、OpenCV、CPU affinity"""
+    if not THREAD_BUDGET["enabled"]:
+        return
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(THREAD_BUDGET["blas"])
+    except ImportError:
+        pass
+    try:
+        import cv2
+        cv2.setNumThreads(THREAD_BUDGET["opencv"])
+    except ImportError:
+        pass
+    try:
+        _apply_affinity(THREAD_BUDGET["cpus"])
+    except (OSError, ValueError) as e:
+        print(f"⚠️ THREAD_BUDGET_CPUS '{THREAD_BUDGET['cpus']}' not applied: {e}")
+
+
+def apply_threadpool():
+    """在事件迴圈內呼叫（startup 事件）：限制 run_in_threadpool / 同步端點共用的 anyio threadpool"""
+    import anyio.to_thread
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    if THREAD_BUDGET["enabled"] and THREAD_BUDGET["threadpool"]:
+        limiter.total_tokens = THREAD_BUDGET["threadpool"]
+    _applied["threadpool"] = limiter.total_tokens
+
+
+def configure_model(clf):
+    """載入模型後設定 sklearn 的 n_jobs（CompactDeadliftModel 等沒有 n_jobs 的模型不受影響）"""
+    if THREAD_BUDGET["enabled"] and hasattr(clf, "n_jobs"):
+        clf.n_jobs = THREAD_BUDGET["sklearn"]
+    return clf
+
+
+def process_threads():
+    """目前程序的作業系統執行緒數（含 MediaPipe / TFLite 內部執行緒）"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import threading
+    return threading.active_count()
+
+
+def report(clf=None):
+    """實際生效的執行緒數（/api/metrics 與啟動紀錄）"""
+    out = {"enabled": THREAD_BUDGET["enabled"], "budget": {k: v for k, v in THREAD_BUDGET.items() if k != "enabled"}}
+    try:
+        from threadpoolctl import threadpool_info
+        out["blas"] = [{"library": info["internal_api"], "num_threads": info["num_threads"]}
+                       for info in threadpool_info()]
+    except ImportError:
+        out["blas"] = {name: os.environ.get(name) for name in BLAS_ENV}
+    try:
+        import cv2
+        out["opencv"] = cv2.getNumThreads()
+    except ImportError:
+        out["opencv"] = None
+    out["sklearn_n_jobs"] = getattr(clf, "n_jobs", None)
+    out["threadpool"] = _applied["threadpool"]
+    out["process_threads"] = process_threads()
+    out["cpus"] = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None
+    out["affinity_slot"] = _applied["affinity_slot"]
+    out["mediapipe"] = "not configurable (counted in process_threads)"
+    return out
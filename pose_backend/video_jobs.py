@@ -0,0 +1,477 @@
+"""
+video_jobs.py
+
+整部影片的離線診斷工作佇列（與即時 /predict 分開）：
+
+    POST   /jobs          上傳影片 → 回傳 job_id
+    GET    /jobs/{id}     查詢狀態 / 進度 / 結果（時間點 + 標籤記錄）
+    DELETE /jobs/{id}     取消工作
+
+- 工作在有上限的 ProcessPoolExecutor 執行：Pose 與模型推論在獨立程序，不會佔用 /predict 的 CPU 與 GIL
+- 工作狀態存在本機 SQLite（VIDEO_JOBS["db_path"]），服務重啟後仍可查詢
+- 每個工作記錄建立它的服務程序 (owner)，owner 存活期間持有一個檔案鎖；
+  只有 owner 已結束（鎖可以取得）的排隊 / 執行中工作才標記為 failed，多個 uvicorn worker 互不影響
+- 取消：尚未開始的工作直接從佇列移除；執行中的工作由 worker 定期檢查取消旗標後停止
+- 分析流程與 video_analysis/analysis_pipeline.py 相同，共用 offline_analysis.py 的取樣與 WindowClassifier：
+  取樣解碼 → Pose → 30 幀視窗 → 每 hop 幀推論 → 冷卻機制
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from offline_analysis import (
+    TARGET_FPS, MAX_INFERENCE_DIM, WINDOW_SIZE, COOLDOWN_SECONDS, INFERENCE_HOP, RECHECK_MARGIN,
+    sampling_step, effective_fps, resize_for_inference, iter_sampled_frames, format_timestamp, WindowClassifier,
+)
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+
+# =====================================
+# ⚙️ 工作佇列設定
+# =====================================
+VIDEO_JOBS = {
+    "max_workers": int(os.environ.get("VIDEO_JOB_WORKERS", 1)),   # 同時執行的分析程序數
+    "max_pending": int(os.environ.get("VIDEO_JOB_MAX_PENDING", 8)),  # 排隊 + 執行中的上限，超過回 503
+    "db_path": os.environ.get("VIDEO_JOB_DB", "video_jobs.sqlite3"),
+    "upload_dir": os.environ.get("VIDEO_JOB_DIR", "video_jobs"),
+    "max_upload_mb": 500,
+    "keep_uploads": False,       # 工作結束後是否保留上傳的影片
+}
+
+# 離線分析參數：預設值與 video_analysis 相同，都來自 offline_analysis.py（上傳時可指定 hop / target_fps）
+OFFLINE_ANALYSIS = {
+    "target_fps": TARGET_FPS,
+    "max_dim": MAX_INFERENCE_DIM,
+    "window_size": WINDOW_SIZE,
+    "hop": INFERENCE_HOP,
+    "recheck_margin": RECHECK_MARGIN,
+    "cooldown_seconds": COOLDOWN_SECONDS,
+}
+
+PROGRESS_INTERVAL = 1.0          # worker 回寫進度 / 檢查取消的間隔 (秒)
+ACTIVE_STATUSES = ("queued", "running")
+
+REQUIRED_LANDMARKS = {
+    "left_ear": 7,
+    "left_shoulder": 11, "right_shoulder": 12,
+    "left_hip": 23, "right_hip": 24,
+    "left_knee": 25, "right_knee": 26,
+    "left_ankle": 27, "right_ankle": 28,
+    "left_wrist": 15, "right_wrist": 16
+}
+
+
+# =====================================
+# 🗄️ SQLite 工作狀態
+# =====================================
+class JobStore:
+    """每個程序各自開連線；SQLite WAL 讓 API 讀取與 worker 寫入互不阻塞"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    filename TEXT,
+                    video_path TEXT,
+                    params TEXT,
+                    progress REAL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER DEFAULT 0,
+                    owner TEXT,
+                    created_at REAL,
+                    updated_at REAL
+                )
+            """)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if "owner" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def create(self, job_id, filename, video_path, params, owner=None):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, filename, video_path, params, owner, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (job_id, filename, video_path, json.dumps(params), owner, now, now))
+
+    def update(self, job_id, **fields):
+        if "result" in fields and fields["result"] is not None:
+            fields["result"] = json.dumps(fields["result"], ensure_ascii=False)
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{k} = ?" for k in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"]) if job["params"] else {}
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def count_active(self):
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", ACTIVE_STATUSES).fetchone()[0]
+
+    def request_cancel(self, job_id):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def cancel_requested(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def active_owners(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT DISTINCT owner FROM jobs WHERE status IN (?, ?)", ACTIVE_STATUSES).fetchall()
+        return [row[0] for row in rows]
+
+    def fail_owner(self, owner):
+        """owner 程序已結束：它排隊或執行中的工作已隨程序消失（owner 為 None = 舊版資料庫的工作）"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'interrupted by server restart', updated_at = ? "
+                "WHERE status IN (?, ?) AND owner IS ?", (time.time(), *ACTIVE_STATUSES, owner))
+
+
+# =====================================
+# 🎬 Worker 程序：離線分析
+# =====================================
+_worker = {}
+
+
+def _init_worker():
+    """每個 worker 程序只載入一次模型與 Pose；只 import 特徵萃取與模型載入，不重跑 app.py 的啟動設定"""
+    import cv2
+    import mediapipe as mp
+    from deadlift_model import DeadliftFeatureExtractor, load_ml_model
+
+    cv2.setNumThreads(1)
+    loaded = load_ml_model()
+    if loaded is None:
+        raise RuntimeError("ML model not found")
+    _worker["clf"], _worker["mlb"], _ = loaded
+    _worker["extractor"] = DeadliftFeatureExtractor()
+    _worker["pose"] = mp.solutions.pose.Pose(
+        static_image_mode=False, model_complexity=1,
+        min_detection_confidence=0.5, min_tracking_confidence=0.5
+    )
+
+
+def _landmarks(results):
+    """Pose 結果 → 特徵萃取需要的 landmarks dict（未偵測到人回傳 None）"""
+    if not results.pose_landmarks:
+        return None
+    lm_all = results.pose_landmarks.landmark
+    return {key: np.array([lm_all[idx].x, lm_all[idx].y]) for key, idx in REQUIRED_LANDMARKS.items()}
+
+
+def analyze_video(video_path, params, on_progress=None):
+    """
+    回傳 (events, meta)；events = [(秒數, 標籤)]
+    取樣、視窗推論與冷卻機制都來自 offline_analysis.py（與 video_analysis/analysis_pipeline.py 相同）
+    on_progress(progress) 回傳 False 時中止（取消）
+    """
+    import cv2
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError("無法開啟影片")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if fps <= 0: fps = 30.0
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    step = sampling_step(fps, params.get("target_fps"))
+    classifier = WindowClassifier(_worker["clf"], _worker["mlb"], _worker["extractor"],
+                                  params.get("hop"), params.get("recheck_margin"),
+                                  params["window_size"], params["cooldown_seconds"])
+    pose = _worker["pose"]
+    last_sec = 0.0
+    next_report = time.perf_counter() + PROGRESS_INTERVAL
+
+    try:
+        for frame_idx, frame in iter_sampled_frames(cap, step):
+            last_sec = (frame_idx + 1) / fps
+
+            if on_progress and time.perf_counter() >= next_report:
+                next_report = time.perf_counter() + PROGRESS_INTERVAL
+                if on_progress(min(1.0, (frame_idx + 1) / total_frames) if total_frames else 0.0) is False:
+                    return None, None
+
+            rgb = cv2.cvtColor(resize_for_inference(frame, params.get("max_dim")), cv2.COLOR_BGR2RGB)
+            classifier.push(last_sec, _landmarks(pose.process(rgb)))
+    finally:
+        cap.release()
+
+    meta = {
+        "source_fps": fps,
+        "analysis_fps": effective_fps(fps, step),
+        "duration_sec": total_frames / fps if total_frames else last_sec,
+        "inferences": classifier.inference_count,
+    }
+    return classifier.events, meta
+
+
+def run_job(job_id, db_path, video_path, params):
+    """ProcessPoolExecutor 的工作進入點（需可 pickle：模組層級函式）"""
+    store = JobStore(db_path)
+    try:
+        if store.cancel_requested(job_id):
+            store.update(job_id, status="cancelled")
+            return "cancelled"
+        store.update(job_id, status="running")
+
+        def on_progress(progress):
+            if store.cancel_requested(job_id):
+                return False
+            store.update(job_id, progress=progress)
+            return True
+
+        t0 = time.perf_counter()
+        events, meta = analyze_video(video_path, params, on_progress)
+        if events is None:
+            store.update(job_id, status="cancelled")
+            return "cancelled"
+
+        meta["elapsed_sec"] = time.perf_counter() - t0
+        result = dict(meta, params=params, events=[
+            {"time_sec": round(sec, 3), "time": format_timestamp(sec), "label": label}
+            for sec, label in events
+        ])
+        store.update(job_id, status="done", progress=1.0, result=result)
+        return "done"
+    except Exception as e:
+        store.update(job_id, status="failed", error=str(e))
+        return "failed"
+    finally:
+        if not params.get("keep_upload") and os.path.exists(video_path):
+            os.remove(video_path)
+
+
+# =====================================
+# 🧵 主程序：工作管理
+# =====================================
+class JobManager:
+    def __init__(self, config=VIDEO_JOBS):
+        self.config = config
+        self.owner_dir = os.path.join(config["upload_dir"], ".owners")
+        os.makedirs(self.owner_dir, exist_ok=True)
+        self.store = JobStore(config["db_path"])
+        # 每個服務程序一個 owner id；鎖檔保持開啟直到程序結束，其他程序以能否取得鎖判斷 owner 是否存活
+        self.owner = uuid.uuid4().hex
+        self._owner_file = open(os.path.join(self.owner_dir, f"{self.owner}.lock"), "w")
+        if fcntl is not None:
+            fcntl.flock(self._owner_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.recover()
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def _owner_alive(self, owner):
+        if owner == self.owner:
+            return True
+        if owner is None or fcntl is None:
+            # 舊版資料庫沒有 owner；沒有 fcntl（Windows）時視為單一服務程序，其他 owner 都是重啟前留下的
+            return False
+        path = os.path.join(self.owner_dir, f"{owner}.lock")
+        if not os.path.exists(path):
+            return False
+        with open(path, "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return True
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return False
+
+    def recover(self):
+        """把 owner 已結束的排隊 / 執行中工作標記為 failed（其他存活 worker 的工作不受影響）"""
+        for owner in self.store.active_owners():
+            if not self._owner_alive(owner):
+                self.store.fail_owner(owner)
+
+    def get(self, job_id):
+        job = self.store.get(job_id)
+        if job is not None and job["status"] in ACTIVE_STATUSES and not self._owner_alive(job["owner"]):
+            self.store.fail_owner(job["owner"])
+            job = self.store.get(job_id)
+        return job
+
+    def _pool(self):
+        # spawn：不從 uvicorn 主程序 fork（MediaPipe / 執行緒狀態不安全）
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.config["max_workers"],
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return self._executor
+
+    def is_full(self):
+        return self.store.count_active() >= self.config["max_pending"]
+
+    def new_upload_path(self, filename):
+        job_id = uuid.uuid4().hex
+        ext = os.path.splitext(filename or "")[1] or ".mp4"
+        return job_id, os.path.join(self.config["upload_dir"], f"{job_id}{ext}")
+
+    def submit(self, job_id, filename, video_path, overrides=None):
+        params = dict(OFFLINE_ANALYSIS, **(overrides or {}), keep_upload=self.config["keep_uploads"])
+        self.store.create(job_id, filename, video_path, params, owner=self.owner)
+        with self._lock:
+            future = self._pool().submit(run_job, job_id, self.config["db_path"], video_path, params)
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f, job_id=job_id: self._on_done(job_id, f))
+        return job_id
+
+    def _on_done(self, job_id, future):
+        with self._lock:
+            self._futures.pop(job_id, None)
+        if future.cancelled():
+            self.store.update(job_id, status="cancelled")
+        elif future.exception() is not None:
+            # worker 程序異常結束（例如模型載入失敗、程序被殺）
+            self.store.update(job_id, status="failed", error=str(future.exception()))
+        else:
+            return
+        job = self.store.get(job_id)
+        if job and not self.config["keep_uploads"] and os.path.exists(job["video_path"]):
+            os.remove(job["video_path"])
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job["status"] not in ACTIVE_STATUSES:
+            return job
+        self.store.request_cancel(job_id)
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None and future.cancel():
+            self.store.update(job_id, status="cancelled")
+            if os.path.exists(job["video_path"]):
+                os.remove(job["video_path"])
+        return self.store.get(job_id)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_manager = None
+
+
+def get_manager():
+    global _manager
+    if _manager is None:
+        _manager = JobManager(VIDEO_JOBS)
+    return _manager
+
+
+def shutdown():
+    if _manager is not None:
+        _manager.shutdown()
+
+
+def job_response(job):
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "filename": job["filename"],
+        "progress": round(job["progress"] or 0.0, 3),
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "result": job["result"],
+        "error": job["error"],
+    }
+
+
+# =====================================
+# 📡 API
+# =====================================
+router = APIRouter()
+
+try:
+    import multipart  # type: ignore
+    HAVE_MULTIPART = True
+except Exception:
+    HAVE_MULTIPART = False
+
+
+if HAVE_MULTIPART:
+    from fastapi import UploadFile
+
+    @router.post("/jobs")
+    def create_job(file: UploadFile, hop: int = None, target_fps: float = None):
+        """上傳影片並排入分析佇列（同步端點，FastAPI 會在執行緒池中寫檔）"""
+        manager = get_manager()
+        if manager.is_full():
+            return JSONResponse({"success": False, "error": "job queue is full"}, status_code=503,
+                                headers={"Retry-After": "30"})
+
+        job_id, path = manager.new_upload_path(file.filename)
+        limit = VIDEO_JOBS["max_upload_mb"] * 1024 * 1024
+        written = 0
+        with open(path, "wb") as out:
+            while True:
+                chunk = file.file.read(1 << 20)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > limit:
+                    break
+                out.write(chunk)
+        if written > limit or written == 0:
+            os.remove(path)
+            error = "file too large" if written else "empty upload"
+            return JSONResponse({"success": False, "error": error}, status_code=413 if written else 400)
+
+        overrides = {k: v for k, v in {"hop": hop, "target_fps": target_fps}.items() if v is not None}
+        manager.submit(job_id, file.filename, path, overrides)
+        return {"success": True, "job_id": job_id, "status": "queued"}
+else:
+    @router.post("/jobs")
+    def create_job_unavailable():
+        return JSONResponse({"success": False,
+                             "error": "python-multipart is not installed. Install with: pip install python-multipart"})
+
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = get_manager().get(job_id)
+    if job is None:
+        return JSONResponse({"success": False, "error": "job not found"}, status_code=404)
+    return job_response(job)
+
+
+@router.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = get_manager().cancel(job_id)
+    if job is None:
+        return JSONResponse({"success": False, "error": "job not found"}, status_code=404)
+    return job_response(job)
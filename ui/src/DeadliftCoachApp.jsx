@@ -85,6 +85,28 @@ const ML_LABEL_TRANSLATIONS = {
   'good_form': '✅ 姿勢良好',
 };
 
+// ============================================
+// 📉 /predict 差異回應（delta: true）：套用伺服器回傳的變動欄位
+// 與 pose_backend/delta_response.py 的 apply() 相同邏輯
+// ============================================
+const applyDelta = (base, changes, removed = []) => {
+  const out = { ...base };
+  for (const path of removed) {
+    const [key, sub] = path.split('.');
+    if (sub) {
+      const { [sub]: _, ...rest } = out[key];
+      out[key] = rest;
+    } else {
+      delete out[key];
+    }
+  }
+  for (const [key, value] of Object.entries(changes)) {
+    const isObject = v => v && typeof v === 'object' && !Array.isArray(v);
+    out[key] = isObject(value) && isObject(out[key]) ? { ...out[key], ...value } : value;
+  }
+  return out;
+};
+
 export default function DeadliftCoachApp({ onBack }) {
   const videoRef = useRef(null)
   const canvasRef = useRef(null)
@@ -111,7 +133,11 @@ export default function DeadliftCoachApp({ onBack }) {
   
   const sessionId = useRef(`session-${Date.now()}`);
   const lastApiCallTime = useRef(0);
+  // 後端建議的 /predict 呼叫間隔（ms），依伺服器負載與是否正在做硬舉動態調整
+  const apiIntervalMs = useRef(100);
   const isFetching = useRef(false);
+  // 最後套用的 /predict 回應 { seq, data }，作為差異回應的基準
+  const lastPredict = useRef(null);
   const audioContextRef = useRef(null);
   const lastAlertTime = useRef(0);
   
@@ -1727,8 +1753,8 @@ export default function DeadliftCoachApp({ onBack }) {
     if (analysisMode === 'realtime') return;
     
     const now = Date.now();
-    // 🔧 優化：提高 API 呼叫頻率到 100ms，因為圓背偵測需要即時反饋
-    if (now - lastApiCallTime.current > 100 && !isFetching.current) {
+    // 🔧 呼叫間隔預設 100ms（圓背偵測需要即時反饋），之後依後端回傳的 hint.interval_ms 調整
+    if (now - lastApiCallTime.current > apiIntervalMs.current && !isFetching.current) {
       lastApiCallTime.current = now;
       isFetching.current = true;
       
@@ -1739,14 +1765,41 @@ export default function DeadliftCoachApp({ onBack }) {
           session_id: sessionId.current,
           landmarks: landmarks.map(lm => ({
             x: lm.x, y: lm.y, z: lm.z, visibility: lm.visibility
-          }))
+          })),
+          delta: true,
+          ack: lastPredict.current?.seq ?? null
         })
       })
       .then(response => {
         if (response.ok) return response.json();
+        // 🚦 後端滿載（503）：依 Retry-After 延後下一次呼叫，期間使用前端計算
+        const retryAfter = Number(response.headers.get("Retry-After"));
+        if (response.status === 503 && retryAfter > 0) {
+          apiIntervalMs.current = retryAfter * 1000;
+        }
         throw new Error("Network response was not ok.");
       })
+      .then(message => {
+        // 📉 完整快照直接使用；差異回應套用到上一次的結果（基準不符時丟棄，下一次請求取得完整快照）
+        if (message.full) {
+          lastPredict.current = { seq: message.seq, data: message };
+        } else if (lastPredict.current?.seq === message.base) {
+          lastPredict.current = {
+            seq: message.seq,
+            data: applyDelta(lastPredict.current.data, message.changes, message.removed)
+          };
+        } else {
+          lastPredict.current = null;
+          throw new Error("Stale delta response.");
+        }
+        return lastPredict.current.data;
+      })
       .then(data => {
+        // 🚦 依後端負載調整下一次呼叫間隔
+        if (data.hint?.interval_ms) {
+          apiIntervalMs.current = data.hint.interval_ms;
+        }
+
         // 🏥 使用後端的圓背偵測結果
         if (data.spine) {
           const backendSpine = data.spine;
@@ -3034,7 +3087,7 @@ const MlResultPanel = ({ mlReady, mlLabels, mlFrameCount, combinedWarning, showC
           <div className="ml-progress-bar">
             <div 
               className="ml-progress-fill"
-              style={{ width: `${(mlFrameCount / 30) * 100}%` }}
+              style={{ width: `${Math.min(mlFrameCount / 30, 1) * 100}%` }}
             />
           </div>
           <span className="ml-progress-text">收集數據中...</span>
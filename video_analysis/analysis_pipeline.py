@@ -0,0 +1,437 @@
+"""
+analysis_pipeline.py
+
+離線影片分析的共用核心（predict_youtube.py GUI、batch_analysis.py 批次模式與各基準測試共用）：
+特徵萃取、分段分析管線與結果快取的讀寫。取樣與 30 幀視窗分類器 (WindowClassifier) 來自
+pose_backend/offline_analysis.py，與後端 /jobs 共用同一份實作，這裡一併匯出。
+
+只依賴 OpenCV / MediaPipe / 模型檔，不 import Tkinter 與 yt_dlp，無介面或精簡環境也能使用。
+"""
+import os
+import sys
+import cv2
+import numpy as np
+import mediapipe as mp
+import json
+import warnings
+import threading
+import queue
+import time
+from progressive_source import open_progressive_source
+from result_cache import ResultCache, model_fingerprint
+
+# 取樣與視窗分類器以後端為準（pose_backend 單獨部署，不能反過來依賴 video_analysis）
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pose_backend"))
+from offline_analysis import (
+    TARGET_FPS, MAX_INFERENCE_DIM, WINDOW_SIZE, COOLDOWN_SECONDS, INFERENCE_HOP, RECHECK_MARGIN,
+    sampling_step, effective_fps, resize_for_inference, iter_sampled_frames,
+    format_timestamp, positive_proba, WindowClassifier,
+)
+
+# ==========================================
+# 0. 基礎設定
+# ==========================================
+warnings.filterwarnings("ignore", category=UserWarning, module='google.protobuf')
+MODEL_PATH = 'deadlift_rf_model.pkl'
+LABEL_BINARIZER_PATH = 'label_binarizer.pkl'
+ANALYSIS_META_PATH = 'analysis_meta.json'  # train_local.py 輸出的取樣設定
+
+# 取樣 (TARGET_FPS / MAX_INFERENCE_DIM) 與視窗 (WINDOW_SIZE / COOLDOWN_SECONDS / INFERENCE_HOP / RECHECK_MARGIN)
+# 的預設值見 offline_analysis.py；若有 analysis_meta.json 則取樣沿用訓練設定
+PIPELINE_QUEUE_SIZE = 32      # 各階段之間的佇列上限（背壓）
+PREVIEW_MAX_FPS = 15          # 預覽畫面最高更新率，落後時直接丟幀
+RESULT_CACHE_ENABLED = True   # 以影片內容雜湊快取 landmarks 與結果（見 result_cache.py）
+
+
+def load_analysis_config():
+    """讀取訓練時的取樣設定，讓 30 幀視窗涵蓋的秒數與訓練一致"""
+    config = {"target_fps": TARGET_FPS, "max_dim": MAX_INFERENCE_DIM}
+    if os.path.exists(ANALYSIS_META_PATH):
+        try:
+            with open(ANALYSIS_META_PATH, encoding="utf-8") as f:
+                meta = json.load(f)
+            config["target_fps"] = meta.get("target_fps", TARGET_FPS)
+            config["max_dim"] = meta.get("max_dim", MAX_INFERENCE_DIM)
+        except Exception:
+            pass
+    return config
+
+
+# ==========================================
+# 1. 特徵萃取邏輯 (保持不變)
+# ==========================================
+class DeadliftFeatureExtractor:
+    def __init__(self, load_pose=True):
+        # 只重播快取的 landmarks 時不需要 Pose
+        self.pose = mp.solutions.pose.Pose(
+            static_image_mode=False, model_complexity=1,
+            min_detection_confidence=0.5, min_tracking_confidence=0.5
+        ) if load_pose else None
+
+    def dist(self, a, b):
+        return np.sqrt((a[0]-b[0])**2 + (a[1]-b[1])**2)
+
+    def calculate_angle(self, a, b, c):
+        a, b, c = np.array(a), np.array(b), np.array(c)
+        ba, bc = a - b, c - b
+        cos_angle = np.dot(ba, bc) / ((np.linalg.norm(ba) * np.linalg.norm(bc)) + 1e-7)
+        return np.degrees(np.arccos(np.clip(cos_angle, -1.0, 1.0)))
+
+    def get_landmarks(self, results):
+        if not results.pose_landmarks: return None
+        lm = results.pose_landmarks.landmark
+        return {
+            'left_ear': [lm[7].x, lm[7].y], 'right_ear': [lm[8].x, lm[8].y],
+            'left_shoulder': [lm[11].x, lm[11].y], 'right_shoulder': [lm[12].x, lm[12].y],
+            'left_hip': [lm[23].x, lm[23].y], 'right_hip': [lm[24].x, lm[24].y],
+            'left_knee': [lm[25].x, lm[25].y], 'right_knee': [lm[26].x, lm[26].y],
+            'left_ankle': [lm[27].x, lm[27].y], 'right_ankle': [lm[28].x, lm[28].y],
+            'left_wrist': [lm[15].x, lm[15].y], 'right_wrist': [lm[16].x, lm[16].y]
+        }
+
+    def extract_frame_features(self, lm):
+        # 計算單一幀的特徵 (不進行聚合)
+        shoulder_c = np.mean([lm['left_shoulder'], lm['right_shoulder']], axis=0)
+        hip_c = np.mean([lm['left_hip'], lm['right_hip']], axis=0)
+        knee_c = np.mean([lm['left_knee'], lm['right_knee']], axis=0)
+        ankle_c = np.mean([lm['left_ankle'], lm['right_ankle']], axis=0)
+        wrist_c = np.mean([lm['left_wrist'], lm['right_wrist']], axis=0)
+
+        spine_angle = self.calculate_angle(lm['left_ear'], shoulder_c, hip_c)
+        hip_angle = self.calculate_angle(shoulder_c, hip_c, knee_c)
+        knee_angle = self.calculate_angle(hip_c, knee_c, ankle_c)
+        torso_angle = self.calculate_angle([hip_c[0], hip_c[1]-0.5], hip_c, shoulder_c)
+        
+        head_shoulder_dist = self.dist(lm['left_ear'], shoulder_c)
+        shoulder_hip_dist = self.dist(shoulder_c, hip_c)
+        
+        vec_sh_hip = shoulder_c - hip_c
+        vec_hip_knee = hip_c - knee_c
+        vec_ear_sh = lm['left_ear'] - shoulder_c
+        vec_wrist_ankle = wrist_c - ankle_c
+
+        return [
+            spine_angle, hip_angle, knee_angle, torso_angle,
+            head_shoulder_dist, shoulder_hip_dist,
+            vec_sh_hip[0], vec_sh_hip[1],
+            vec_hip_knee[0], vec_hip_knee[1],
+            vec_ear_sh[0], vec_ear_sh[1],
+            vec_wrist_ankle[0], vec_wrist_ankle[1]
+        ]
+
+# ==========================================
+# 2. 分段分析管線：解碼 → Pose → 分類/記錄（+ 預覽）
+# ==========================================
+_END = object()
+
+
+class StageStats:
+    """單一階段的處理幀數與 fps（只由該階段的執行緒更新）"""
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.start = None
+
+    def tick(self):
+        if self.start is None:
+            self.start = time.perf_counter()
+        self.count += 1
+
+    def fps(self):
+        if self.start is None:
+            return 0.0
+        elapsed = time.perf_counter() - self.start
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+
+class AnalysisPipeline:
+    """
+    各階段各自一條執行緒，以有上限的佇列串接：
+        decode  : cap.grab()/read() 取樣解碼
+        pose    : 縮圖 + cvtColor + pose.process
+        classify: 特徵 → 30 幀視窗 → 每 hop 幀推論 (WindowClassifier) → 冷卻機制 → on_label 回呼
+        preview : 以 PREVIEW_MAX_FPS 上限顯示最新一幀，來不及就丟幀
+    吞吐量受限於最慢的階段，而不是各階段耗時的總和。
+
+    download_done 給定時，video_path 視為仍在寫入中的檔案 (見 progressive_source.py)，
+    收到第一段可解碼的影像就開始分析；video_path 也可以是 http(s) URL 或 "-" (stdin)。
+    """
+    STAGES = ("decode", "pose", "classify", "preview")
+    STAGE_NAMES = {"decode": "解碼", "pose": "Pose", "classify": "分類", "preview": "預覽"}
+
+    def __init__(self, video_path, model, mlb, on_label=None, show_preview=False,
+                 target_fps=None, max_dim=None, queue_size=PIPELINE_QUEUE_SIZE, preview_fps=PREVIEW_MAX_FPS,
+                 download_done=None, hop=INFERENCE_HOP, recheck_margin=RECHECK_MARGIN, record_landmarks=False):
+        self.video_path = video_path
+        self.download_done = download_done
+        self.model = model
+        self.mlb = mlb
+        self.on_label = on_label
+        self.show_preview = show_preview
+        self.target_fps = target_fps
+        self.max_dim = max_dim
+        self.hop = hop
+        self.recheck_margin = recheck_margin
+        self.record_landmarks = record_landmarks
+        self.posed_log = []        # record_landmarks 時保存 [(秒數, lm)]，供結果快取重播
+        self.preview_interval = 1.0 / preview_fps if preview_fps else 0.0
+
+        self.decoded = queue.Queue(maxsize=queue_size)
+        self.posed = queue.Queue(maxsize=queue_size)
+        self.preview_slot = queue.Queue(maxsize=1)
+        self.stop_event = threading.Event()
+        self.pose_done = threading.Event()
+        self.stats = {name: StageStats(name) for name in self.STAGES}
+        self.events = []           # [(秒數, 標籤)]
+        self.classifier = None
+        self.error = None
+        self.completed = False     # 分類階段讀到影片結尾（不是被停止或出錯中斷）
+        self.src_fps = 30.0
+        self.analysis_fps = 30.0
+        self.total_frames = 0
+        self.last_sec = 0.0
+        self.started_at = None
+        self.first_frame_latency = None   # 從 start() 到第一幀解碼完成的秒數
+        self._cap = None
+        self._threads = []
+
+    # ---------- 控制 ----------
+    def start(self):
+        self.started_at = time.perf_counter()
+        cap = self._cap = open_progressive_source(self.video_path, self.download_done)
+        if not cap.isOpened():
+            cap.release()
+            raise RuntimeError(f"無法開啟影片：{self.video_path}")
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        self.src_fps = fps if fps > 0 else 30.0
+        self.total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        step = sampling_step(self.src_fps, self.target_fps)
+        self.analysis_fps = effective_fps(self.src_fps, step)
+
+        # Pose 只在 pose 階段使用；特徵計算是純函式，分類階段共用同一個物件
+        self.extractor = DeadliftFeatureExtractor()
+        self.classifier = WindowClassifier(self.model, self.mlb, self.extractor, self.hop, self.recheck_margin)
+        self.events = self.classifier.events
+
+        targets = [(self._decode_stage, (cap, step)), (self._pose_stage, ()), (self._classify_stage, ())]
+        if self.show_preview:
+            targets.append((self._preview_stage, ()))
+        for target, args in targets:
+            t = threading.Thread(target=self._guard, args=(target,) + args, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def join(self, timeout=None):
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        for t in self._threads:
+            remaining = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            t.join(remaining)
+
+    def is_alive(self):
+        return any(t.is_alive() for t in self._threads)
+
+    def stop(self):
+        self.stop_event.set()
+        cancel = getattr(self._cap, "cancel", None)
+        if cancel:
+            cancel()
+
+    def run(self):
+        self.start()
+        self.join()
+        if self.error:
+            raise self.error
+        return self.events
+
+    def stats_text(self):
+        text = "｜".join(
+            f"{self.STAGE_NAMES[name]} {self.stats[name].fps():.1f} fps"
+            for name in self.STAGES if name != "preview" or self.show_preview
+        )
+        if self.classifier is not None:
+            text += f"｜推論 {self.classifier.inference_count} 次"
+        return text
+
+    def progress(self):
+        if not self.total_frames:
+            return None
+        return min(1.0, self.last_sec * self.src_fps / self.total_frames)
+
+    def meta(self):
+        duration = self.total_frames / self.src_fps if self.total_frames else self.last_sec
+        return {"source_fps": self.src_fps, "analysis_fps": self.analysis_fps, "duration_sec": duration}
+
+    # ---------- 工具 ----------
+    def _guard(self, target, *args):
+        try:
+            target(*args)
+        except Exception as e:
+            self.error = e
+            self.stop()
+
+    def _put(self, q, item):
+        # 佇列滿時阻塞（背壓），但仍定期檢查是否被要求停止
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self.stop_event.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    # ---------- 階段 ----------
+    def _decode_stage(self, cap, step):
+        try:
+            # 非取樣幀只 grab()，不做色彩轉換與 Pose
+            for frame_idx, frame in iter_sampled_frames(cap, step):
+                if self.stop_event.is_set():
+                    break
+                if not self._put(self.decoded, ((frame_idx + 1) / self.src_fps, frame)):
+                    break
+                if self.first_frame_latency is None:
+                    self.first_frame_latency = time.perf_counter() - self.started_at
+                self.stats["decode"].tick()
+        finally:
+            cap.release()
+            self._put(self.decoded, _END)
+
+    def _pose_stage(self):
+        try:
+            while True:
+                item = self._get(self.decoded)
+                if item is _END:
+                    break
+                sec, frame = item
+                # 影像處理（超過最大解析度先縮圖）
+                rgb = cv2.cvtColor(resize_for_inference(frame, self.max_dim), cv2.COLOR_BGR2RGB)
+                results = self.extractor.pose.process(rgb)
+                lm = self.extractor.get_landmarks(results)
+                if not self._put(self.posed, (sec, lm)):
+                    break
+                if self.show_preview:
+                    self._offer_preview((sec, frame, results.pose_landmarks))
+                self.stats["pose"].tick()
+        finally:
+            self.pose_done.set()
+            self._put(self.posed, _END)
+
+    def _offer_preview(self, item):
+        # 只保留最新一幀：舊的還沒顯示就丟掉
+        try:
+            self.preview_slot.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            self.preview_slot.put_nowait(item)
+        except queue.Full:
+            pass
+
+    def _classify_stage(self):
+        while True:
+            item = self._get(self.posed)
+            if item is _END:
+                self.completed = not self.stop_event.is_set()
+                break
+            current_sec, lm = item
+            self.last_sec = current_sec
+            self.stats["classify"].tick()
+            if self.record_landmarks:
+                self.posed_log.append(item)
+            for sec, label in self.classifier.push(current_sec, lm):
+                if self.on_label:
+                    self.on_label(sec, label)
+
+    def _preview_stage(self):
+        mp_drawing = mp.solutions.drawing_utils
+        next_show = 0.0
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    sec, frame, pose_landmarks = self.preview_slot.get(timeout=0.1)
+                except queue.Empty:
+                    if self.pose_done.is_set():
+                        break
+                    continue
+
+                # 繪製骨架
+                if pose_landmarks:
+                    mp_drawing.draw_landmarks(frame, pose_landmarks, mp.solutions.pose.POSE_CONNECTIONS)
+                # 在畫面上顯示時間
+                cv2.putText(frame, f"Time: {sec:.1f}s", (10, 30),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+                cv2.imshow('Analysis Preview', cv2.resize(frame, (0, 0), fx=0.6, fy=0.6))
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    self.stop_event.set()
+                    break
+                self.stats["preview"].tick()
+
+                # 顯示上限：等待期間新到的幀會覆蓋舊幀（丟幀）
+                next_show = max(next_show + self.preview_interval, time.perf_counter())
+                delay = next_show - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        finally:
+            cv2.destroyAllWindows()
+
+
+def analysis_options(target_fps=None, max_dim=None, hop=INFERENCE_HOP, recheck_margin=RECHECK_MARGIN):
+    """影響分析結果的所有參數（也是結果快取的鍵）"""
+    return {"target_fps": target_fps, "max_dim": max_dim, "hop": hop, "recheck_margin": recheck_margin,
+            "window_size": WINDOW_SIZE, "cooldown": COOLDOWN_SECONDS}
+
+
+def open_result_cache():
+    """以目前模型檔的內容雜湊建立快取；停用或模型不存在時回傳 None"""
+    if not RESULT_CACHE_ENABLED:
+        return None
+    try:
+        return ResultCache(model_fingerprint(MODEL_PATH, LABEL_BINARIZER_PATH))
+    except OSError:
+        return None
+
+
+def cached_analysis(cache, video_hash, model, mlb, options, on_label=None):
+    """
+    完整命中 → 直接回傳結果；部分命中 (同影片同取樣，但模型或分類參數不同) → 略過 Pose，只重跑分類器
+    回傳 (events, meta, "result" | "landmarks")，未命中回傳 None
+    """
+    result = cache.load_result(video_hash, options)
+    if result is not None:
+        events = [(sec, label) for sec, label in result.pop("events")]
+        hit = "result"
+    else:
+        cached = cache.load_landmarks(video_hash, options)
+        if cached is None:
+            return None
+        posed, meta = cached
+        classifier = WindowClassifier(model, mlb, DeadliftFeatureExtractor(load_pose=False),
+                                      options["hop"], options["recheck_margin"])
+        for sec, lm in posed:
+            classifier.push(sec, lm)
+        events, hit = classifier.events, "landmarks"
+        result = dict(meta, inferences=classifier.inference_count)
+        cache.save_result(video_hash, options, events, result)
+
+    if on_label:
+        for sec, label in events:
+            on_label(sec, label)
+    return events, result, hit
+
+
+def store_analysis(cache, video_hash, pipeline, options):
+    """只快取完整跑完的分析；被停止（預覽按 q）或出錯中斷的結果不完整，回傳 False"""
+    if not pipeline.completed or pipeline.error:
+        return False
+    meta = pipeline.meta()
+    cache.save_landmarks(video_hash, options, pipeline.posed_log, meta)
+    cache.save_result(video_hash, options, pipeline.events, dict(meta, inferences=pipeline.classifier.inference_count))
+    return True
@@ -0,0 +1,212 @@
+"""
+batch_analysis.py
+
+predict_youtube.py 的無介面批次模式：多部本機影片以多個 worker 程序平行分析，
+每部影片輸出一份 JSON + CSV 報告（時間點 / 標籤），冷卻機制與 GUI 相同 (COOLDOWN_SECONDS)。
+
+不需要網路，也不需要 Tkinter / yt_dlp（只 import analysis_pipeline.py）；適合整夜批次評分大量上傳的影片。
+
+用法：
+    uv run python video_analysis/batch_analysis.py a.mp4 b.mp4 --out-dir reports --workers 4
+    uv run python video_analysis/batch_analysis.py --manifest clips.txt --out-dir reports
+    （predict_youtube.py 帶相同參數時也會轉到這裡）
+"""
+import os
+import csv
+import json
+import time
+import hashlib
+import joblib
+import cv2
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from analysis_pipeline import (
+    AnalysisPipeline, MODEL_PATH, LABEL_BINARIZER_PATH, WINDOW_SIZE, COOLDOWN_SECONDS,
+    INFERENCE_HOP, RECHECK_MARGIN, RESULT_CACHE_ENABLED, load_analysis_config, format_timestamp,
+    analysis_options, cached_analysis, store_analysis,
+)
+from result_cache import ResultCache, file_digest, model_fingerprint
+
+# 每個 worker 程序只載入一次模型
+_worker = {}
+
+# worker 程序異常結束（OOM、解碼器崩潰）時，受影響的影片以新的程序池重跑幾次；仍失敗則記為錯誤
+POOL_RETRIES = int(os.environ.get("BATCH_POOL_RETRIES", "1"))
+
+
+def read_manifest(path):
+    """清單檔：.csv 取 path 欄（沒有則取第一欄），其他格式每行一個路徑；相對路徑以清單檔所在目錄為準"""
+    base = os.path.dirname(os.path.abspath(path))
+    videos = []
+    with open(path, encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            reader = csv.reader(f)
+            header = next(reader, [])
+            col = header.index("path") if "path" in header else 0
+            if "path" not in header and header:
+                videos.append(header[col])
+            videos.extend(row[col] for row in reader if row)
+        else:
+            videos.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    return [v if os.path.isabs(v) else os.path.join(base, v) for v in videos]
+
+
+def report_name(video_path):
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    digest = hashlib.sha1(os.path.abspath(video_path).encode("utf-8")).hexdigest()[:6]
+    return f"{stem}_{digest}"
+
+
+def write_report(report, out_dir, name):
+    json_path = os.path.join(out_dir, f"{name}.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(out_dir, f"{name}.csv"), "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["time_sec", "time", "label"])
+        for e in report["events"]:
+            writer.writerow([e["time_sec"], e["time"], e["label"]])
+    return json_path
+
+
+# ==========================================
+# Worker
+# ==========================================
+def _init_worker(model_path, mlb_path, use_cache):
+    # 多程序平行時，每個程序的 OpenCV 只用 1 條執行緒，避免超額訂閱 CPU
+    cv2.setNumThreads(1)
+    _worker["model"] = joblib.load(model_path)
+    _worker["mlb"] = joblib.load(mlb_path)
+    _worker["cache"] = ResultCache(model_fingerprint(model_path, mlb_path)) if use_cache else None
+
+
+def analyze_video(video_path, out_dir, target_fps=None, max_dim=None, hop=INFERENCE_HOP, recheck_margin=RECHECK_MARGIN):
+    """分析單一影片並寫出報告；回傳摘要 dict（失敗時 status = error）"""
+    t0 = time.perf_counter()
+    try:
+        if not os.path.exists(video_path):
+            raise FileNotFoundError(f"找不到影片：{video_path}")
+        options = analysis_options(target_fps, max_dim, hop, recheck_margin)
+        cache = _worker.get("cache")
+        video_hash = file_digest(video_path) if cache else None
+        hit = cached_analysis(cache, video_hash, _worker["model"], _worker["mlb"], options) if cache else None
+        if hit:
+            events, meta, cache_status = hit
+        else:
+            pipeline = AnalysisPipeline(video_path, _worker["model"], _worker["mlb"],
+                                        show_preview=False, target_fps=target_fps, max_dim=max_dim,
+                                        hop=hop, recheck_margin=recheck_margin, record_landmarks=cache is not None)
+            events = pipeline.run()
+            meta = dict(pipeline.meta(), inferences=pipeline.classifier.inference_count)
+            cache_status = "miss" if cache else None
+            if cache:
+                store_analysis(cache, video_hash, pipeline, options)
+        report = {
+            "video": video_path,
+            "source_fps": meta["source_fps"],
+            "analysis_fps": meta["analysis_fps"],
+            "duration_sec": meta["duration_sec"],
+            "window_size": WINDOW_SIZE,
+            "cooldown_seconds": COOLDOWN_SECONDS,
+            "inference_hop": hop,
+            "recheck_margin": recheck_margin,
+            "inferences": meta.get("inferences"),
+            "cache": cache_status,
+            "elapsed_sec": time.perf_counter() - t0,
+            "events": [
+                {"time_sec": round(sec, 3), "time": format_timestamp(sec), "label": label}
+                for sec, label in events
+            ],
+        }
+        json_path = write_report(report, out_dir, report_name(video_path))
+        return {"video": video_path, "status": "ok", "events": len(events), "cache": cache_status,
+                "elapsed_sec": report["elapsed_sec"], "report": json_path}
+    except Exception as e:
+        return {"video": video_path, "status": "error", "error": str(e),
+                "elapsed_sec": time.perf_counter() - t0}
+
+
+def run_batch(videos, out_dir, workers=None, target_fps=None, max_dim=None,
+              model_path=MODEL_PATH, mlb_path=LABEL_BINARIZER_PATH, hop=INFERENCE_HOP, recheck_margin=RECHECK_MARGIN,
+              use_cache=RESULT_CACHE_ENABLED):
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or max(1, (os.cpu_count() or 2) // 2)
+    config = load_analysis_config()
+    target_fps = target_fps if target_fps is not None else config["target_fps"]
+    max_dim = max_dim if max_dim is not None else config["max_dim"]
+
+    print(f"🎬 批次分析 {len(videos)} 部影片，worker = {workers}，輸出 → {out_dir}")
+    t0 = time.perf_counter()
+    results = []
+    attempts = {}
+    pending = list(videos)
+    while pending:
+        # 程序池壞掉後，其餘尚未完成的 future 也都會拋 BrokenProcessPool，無法分辨是哪部影片造成的
+        broken = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model_path, mlb_path, use_cache)) as pool:
+            futures = {pool.submit(analyze_video, v, out_dir, target_fps, max_dim, hop, recheck_margin): v
+                       for v in pending}
+            for future in as_completed(futures):
+                video = futures[future]
+                try:
+                    r = future.result()
+                except BrokenProcessPool as e:
+                    attempts[video] = attempts.get(video, 0) + 1
+                    if attempts[video] <= POOL_RETRIES:
+                        broken.append(video)
+                        continue
+                    r = {"video": video, "status": "error", "error": f"worker 程序異常結束：{e}", "elapsed_sec": 0.0}
+                results.append(r)
+                i = len(results)
+                if r["status"] == "ok":
+                    cached = "，快取命中" if r["cache"] in ("result", "landmarks") else ""
+                    print(f"[{i}/{len(videos)}] ✅ {r['video']}：{r['events']} 筆問題（{r['elapsed_sec']:.1f}s{cached}）")
+                else:
+                    print(f"[{i}/{len(videos)}] ✖ {r['video']}：{r['error']}")
+        if broken:
+            print(f"⚠️ worker 程序異常結束，以新的程序池重跑 {len(broken)} 部影片")
+        pending = broken
+
+    summary = {
+        "videos": len(videos),
+        "ok": sum(r["status"] == "ok" for r in results),
+        "failed": sum(r["status"] != "ok" for r in results),
+        "elapsed_sec": time.perf_counter() - t0,
+        "results": results,
+    }
+    with open(os.path.join(out_dir, "batch_summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"\n📄 完成 {summary['ok']}/{len(videos)}，總耗時 {summary['elapsed_sec']:.1f}s")
+    return summary
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="硬舉影片無介面批次分析（predict_youtube.py 不帶參數則開啟 GUI）")
+    parser.add_argument("videos", nargs="*", help="本機影片檔")
+    parser.add_argument("--manifest", help="影片清單（.txt 每行一個路徑，或含 path 欄的 .csv）")
+    parser.add_argument("--out-dir", default="reports", help="JSON/CSV 報告輸出目錄")
+    parser.add_argument("--workers", type=int, default=None, help="平行 worker 程序數（預設 CPU 數的一半）")
+    parser.add_argument("--target-fps", type=float, default=None)
+    parser.add_argument("--max-dim", type=int, default=None)
+    parser.add_argument("--hop", type=int, default=INFERENCE_HOP, help="視窗滿後每隔幾幀推論一次（1 = 每幀）")
+    parser.add_argument("--recheck-margin", type=float, default=RECHECK_MARGIN,
+                        help="機率距 0.5 小於此值時下一幀立即再推論（負數 = 關閉）")
+    parser.add_argument("--no-cache", action="store_true", help="不讀寫結果快取")
+    args = parser.parse_args()
+
+    videos = list(args.videos)
+    if args.manifest:
+        videos.extend(read_manifest(args.manifest))
+    if not videos:
+        parser.error("請指定影片檔或 --manifest")
+    recheck_margin = args.recheck_margin if args.recheck_margin is not None and args.recheck_margin >= 0 else None
+    summary = run_batch(videos, args.out_dir, args.workers, args.target_fps, args.max_dim,
+                        hop=args.hop, recheck_margin=recheck_margin, use_cache=not args.no_cache)
+    raise SystemExit(0 if summary["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+bench_frame_stride.py
+
+取樣間隔 (stride) 的速度 vs. 標籤一致性基準測試。
+
+對每個 stride 跑一次完整的離線分析（Pose → 特徵 → 30 幀視窗 → 模型），
+以 stride=1（每幀分析）為基準，逐秒比較偵測到的標籤集合。
+
+用法：
+    uv run python video_analysis/bench_frame_stride.py video.mp4 [video2.mp4 ...] --strides 1 2 3 4 --max-dim 640
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+import joblib
+from collections import deque
+
+from analysis_pipeline import (
+    DeadliftFeatureExtractor, MODEL_PATH, LABEL_BINARIZER_PATH,
+    effective_fps, resize_for_inference, iter_sampled_frames,
+)
+
+
+def analyze(video_path, model, mlb, step, max_dim=None, window_size=30):
+    """回傳 ({秒數: 標籤集合}, 統計資訊)"""
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if fps <= 0: fps = 30
+    extractor = DeadliftFeatureExtractor()
+    window = deque(maxlen=window_size)
+    per_second = {}
+    analyzed = 0
+
+    t0 = time.perf_counter()
+    for frame_idx, frame in iter_sampled_frames(cap, step):
+        analyzed += 1
+        rgb = cv2.cvtColor(resize_for_inference(frame, max_dim), cv2.COLOR_BGR2RGB)
+        results = extractor.pose.process(rgb)
+        lm = extractor.get_landmarks(results)
+        if not lm:
+            continue
+        window.append(extractor.extract_frame_features(lm))
+        if len(window) < window_size:
+            continue
+
+        data = np.array(window)
+        input_vec = np.concatenate([
+            np.mean(data, axis=0), np.max(data, axis=0),
+            np.min(data, axis=0), np.std(data, axis=0)
+        ]).reshape(1, -1)
+        labels = mlb.inverse_transform(model.predict(input_vec))[0]
+        per_second.setdefault(int((frame_idx + 1) / fps), set()).update(labels)
+    elapsed = time.perf_counter() - t0
+    cap.release()
+
+    return per_second, {
+        "elapsed": elapsed,
+        "analyzed_frames": analyzed,
+        "effective_fps": effective_fps(fps, step),
+    }
+
+
+def agreement(baseline, candidate):
+    """逐秒比較：回傳 (完全一致比例, 平均 Jaccard)"""
+    seconds = sorted(set(baseline) | set(candidate))
+    if not seconds:
+        return 1.0, 1.0
+    exact, jaccard = 0, 0.0
+    for sec in seconds:
+        a, b = baseline.get(sec, set()), candidate.get(sec, set())
+        exact += a == b
+        union = a | b
+        jaccard += len(a & b) / len(union) if union else 1.0
+    return exact / len(seconds), jaccard / len(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="stride 速度 vs. 標籤一致性基準測試")
+    parser.add_argument("videos", nargs="+")
+    parser.add_argument("--strides", nargs="+", type=int, default=[1, 2, 3, 4])
+    parser.add_argument("--max-dim", type=int, default=None)
+    args = parser.parse_args()
+
+    model = joblib.load(MODEL_PATH)
+    mlb = joblib.load(LABEL_BINARIZER_PATH)
+    strides = sorted(set([1] + args.strides))
+
+    print(f"{'video':<30} {'stride':>6} {'fps':>7} {'frames':>7} {'sec':>8} {'x':>6} {'exact':>7} {'jaccard':>8}")
+    for video in args.videos:
+        baseline, base_stats = None, None
+        for step in strides:
+            per_second, stats = analyze(video, model, mlb, step, args.max_dim)
+            if baseline is None:
+                baseline, base_stats = per_second, stats
+            exact, jac = agreement(baseline, per_second)
+            speedup = base_stats["elapsed"] / stats["elapsed"] if stats["elapsed"] else float("inf")
+            print(f"{video[-30:]:<30} {step:>6} {stats['effective_fps']:>7.1f} {stats['analyzed_frames']:>7} "
+                  f"{stats['elapsed']:>8.2f} {speedup:>6.2f} {exact:>7.1%} {jac:>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
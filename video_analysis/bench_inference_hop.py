@@ -0,0 +1,102 @@
+"""
+bench_inference_hop.py
+
+推論間隔 (hop) 與信心重檢的成本 vs. 事件一致性基準測試。
+
+每部影片只跑一次 Pose，把逐幀 landmarks 存起來；再以不同 (hop, recheck_margin) 重播
+WindowClassifier，以 hop=1（視窗滿後每幀推論，舊行為）為基準比較：
+- 推論次數與分類階段耗時
+- 事件一致性：同標籤、時間差在 --tolerance 秒內視為同一事件，計算 recall / precision
+
+用法：
+    uv run python video_analysis/bench_inference_hop.py video.mp4 [video2.mp4 ...] --hops 1 3 5 10 15 --margins none 0.15
+"""
+import argparse
+import time
+import cv2
+import joblib
+
+from analysis_pipeline import (
+    DeadliftFeatureExtractor, WindowClassifier, MODEL_PATH, LABEL_BINARIZER_PATH, COOLDOWN_SECONDS,
+    sampling_step, resize_for_inference, iter_sampled_frames,
+)
+
+
+def collect_landmarks(video_path, target_fps=None, max_dim=None):
+    """回傳 ([(秒數, landmarks 或 None)], extractor)"""
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if fps <= 0: fps = 30
+    extractor = DeadliftFeatureExtractor()
+    posed = []
+    for frame_idx, frame in iter_sampled_frames(cap, sampling_step(fps, target_fps)):
+        rgb = cv2.cvtColor(resize_for_inference(frame, max_dim), cv2.COLOR_BGR2RGB)
+        posed.append(((frame_idx + 1) / fps, extractor.get_landmarks(extractor.pose.process(rgb))))
+    cap.release()
+    return posed, extractor
+
+
+def replay(posed, model, mlb, extractor, hop, margin):
+    classifier = WindowClassifier(model, mlb, extractor, hop=hop, recheck_margin=margin)
+    t0 = time.perf_counter()
+    for sec, lm in posed:
+        classifier.push(sec, lm)
+    return classifier, time.perf_counter() - t0
+
+
+def match_events(baseline, candidate, tolerance):
+    """貪婪配對同標籤且時間差 ≤ tolerance 的事件，回傳配對數"""
+    used = set()
+    matched = 0
+    for sec, label in baseline:
+        best = None
+        for i, (c_sec, c_label) in enumerate(candidate):
+            if i in used or c_label != label or abs(c_sec - sec) > tolerance:
+                continue
+            if best is None or abs(c_sec - sec) < abs(candidate[best][0] - sec):
+                best = i
+        if best is not None:
+            used.add(best)
+            matched += 1
+    return matched
+
+
+def parse_margin(text):
+    return None if text.lower() == "none" else float(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推論間隔成本 vs. 事件一致性基準測試")
+    parser.add_argument("videos", nargs="+")
+    parser.add_argument("--hops", nargs="+", type=int, default=[1, 3, 5, 10, 15])
+    parser.add_argument("--margins", nargs="+", default=["none", "0.15"], help="信心重檢範圍，none = 關閉")
+    parser.add_argument("--tolerance", type=float, default=COOLDOWN_SECONDS, help="事件配對的時間容許誤差 (秒)")
+    parser.add_argument("--target-fps", type=float, default=None)
+    parser.add_argument("--max-dim", type=int, default=None)
+    args = parser.parse_args()
+
+    model = joblib.load(MODEL_PATH)
+    mlb = joblib.load(LABEL_BINARIZER_PATH)
+    margins = [parse_margin(m) for m in args.margins]
+    configs = [(1, None)] + [(h, m) for h in sorted(set(args.hops)) for m in margins if h > 1]
+
+    print(f"{'video':<24} {'hop':>4} {'margin':>7} {'infer':>7} {'recheck':>8} {'sec':>7} {'x':>6} "
+          f"{'events':>7} {'recall':>7} {'prec':>7}")
+    for video in args.videos:
+        posed, extractor = collect_landmarks(video, args.target_fps, args.max_dim)
+        base, base_elapsed = None, None
+        for hop, margin in configs:
+            clf, elapsed = replay(posed, model, mlb, extractor, hop, margin)
+            if base is None:
+                base, base_elapsed = clf, elapsed
+            matched = match_events(base.events, clf.events, args.tolerance)
+            recall = matched / len(base.events) if base.events else 1.0
+            precision = matched / len(clf.events) if clf.events else 1.0
+            speedup = base_elapsed / elapsed if elapsed else float("inf")
+            margin_text = "-" if margin is None else f"{margin:.2f}"
+            print(f"{video[-24:]:<24} {hop:>4} {margin_text:>7} {clf.inference_count:>7} {clf.recheck_count:>8} "
+                  f"{elapsed:>7.2f} {speedup:>6.1f} {len(clf.events):>7} {recall:>7.1%} {precision:>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+bench_progressive.py
+
+模擬「邊下載邊分析」，比較首幀延遲 (time-to-first-frame) 與總耗時：
+    full     — 等檔案完整寫完才開始分析（舊流程）
+    growing  — 以固定速率逐段寫入檔案，同時用 GrowingVideoCapture 追著讀
+    http     — 本機 HTTP 伺服器以 chunked body 慢速送出，OpenCV 直接串流讀取
+
+不需要網路；模型使用 deadlift_rf_model.pkl / label_binarizer.pkl。
+影片請使用可漸進讀取的容器（faststart MP4、MKV、WebM、AVI）。
+
+用法：
+    uv run python video_analysis/bench_progressive.py clip.mkv --rate 2000000
+"""
+import os
+import time
+import shutil
+import tempfile
+import argparse
+import threading
+import joblib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from analysis_pipeline import AnalysisPipeline, MODEL_PATH, LABEL_BINARIZER_PATH
+
+CHUNK = 64 * 1024
+
+
+def trickle_copy(src, dst, rate, done):
+    """以 rate bytes/s 把 src 逐段寫入 dst，寫完設定 done"""
+    try:
+        with open(src, "rb") as fin, open(dst, "wb") as fout:
+            while True:
+                data = fin.read(CHUNK)
+                if not data:
+                    break
+                fout.write(data)
+                fout.flush()
+                time.sleep(len(data) / rate)
+    finally:
+        done.set()
+
+
+def serve_slowly(path, rate):
+    """回傳 (server, url)；每個請求以 chunked transfer 慢速送出整個檔案"""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "video/octet-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                with open(path, "rb") as f:
+                    while True:
+                        data = f.read(CHUNK)
+                        if not data:
+                            break
+                        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                        self.wfile.flush()
+                        time.sleep(len(data) / rate)
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/{os.path.basename(path)}"
+
+
+def run_case(name, source, model, mlb, download_done=None, prepare=None):
+    t0 = time.perf_counter()
+    if prepare:
+        prepare()
+    pipeline = AnalysisPipeline(source, model, mlb, download_done=download_done)
+    events = pipeline.run()
+    total = time.perf_counter() - t0
+    first = (pipeline.started_at - t0) + (pipeline.first_frame_latency or 0.0)
+    frames = pipeline.stats["classify"].count
+    print(f"{name:<8} 首幀 {first:6.2f}s  總耗時 {total:6.2f}s  幀數 {frames:5d}  事件 {len(events)}")
+    return events
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="邊下載邊分析的首幀延遲基準測試")
+    parser.add_argument("video")
+    parser.add_argument("--rate", type=float, default=2_000_000, help="模擬下載速度 (bytes/s)")
+    parser.add_argument("--cases", nargs="+", default=["full", "growing", "http"])
+    args = parser.parse_args()
+
+    model = joblib.load(MODEL_PATH)
+    mlb = joblib.load(LABEL_BINARIZER_PATH)
+    size = os.path.getsize(args.video)
+    print(f"🎬 {args.video}：{size / 1e6:.1f}MB，模擬下載 {args.rate / 1e6:.1f}MB/s（約 {size / args.rate:.1f}s）\n")
+
+    tmp = tempfile.mkdtemp()
+    ext = os.path.splitext(args.video)[1]
+    results = {}
+    try:
+        if "full" in args.cases:
+            dst = os.path.join(tmp, "full" + ext)
+            results["full"] = run_case("full", dst, model, mlb,
+                                       prepare=lambda: trickle_copy(args.video, dst, args.rate, threading.Event()))
+        if "growing" in args.cases:
+            dst = os.path.join(tmp, "growing" + ext)
+            done = threading.Event()
+            start_writer = lambda: threading.Thread(target=trickle_copy, args=(args.video, dst, args.rate, done),
+                                                    daemon=True).start()
+            results["growing"] = run_case("growing", dst, model, mlb, download_done=done, prepare=start_writer)
+        if "http" in args.cases:
+            server, url = serve_slowly(args.video, args.rate)
+            try:
+                results["http"] = run_case("http", url, model, mlb)
+            finally:
+                server.shutdown()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if "full" in results:
+        base = results["full"]
+        for name, events in results.items():
+            if name != "full":
+                print(f"\n{name} 與 full 的事件是否一致：{'✅' if events == base else '⚠️ 不同'}")
@@ -0,0 +1,233 @@
+"""
+dataset_planner.py
+
+訓練資料規劃器：
+1. 影片資料夾只掃描一次，建立 video_id → 檔案路徑索引
+2. 相同 (影片, 起始秒, 結束秒) 的多筆標註合併成一個多標籤樣本
+3. 每部來源影片只解碼一次（單向前進），每一幀同時分配給所有重疊的片段
+
+原本每筆標註都會重新開檔、seek、跑一次 Pose，
+同一部 Bilibili 影片 (BV1z7411z7FK) 的幾十個片段因此被重複解碼。
+"""
+import os
+import re
+import sys
+import cv2
+import numpy as np
+import pandas as pd
+
+from train_local import is_bilibili_id, parse_youtube_id, URL_COL, LABEL_COL
+# 取樣控制與後端共用（見 pose_backend/offline_analysis.py）
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pose_backend"))
+from offline_analysis import sampling_step, effective_fps
+
+# 片段之間的空檔超過此幀數時直接 seek，否則用 grab() 略過（不做 retrieve/色彩轉換）
+SEEK_GAP_FRAMES = 90
+
+
+# ==========================================
+# 影片資料夾索引（只掃描一次）
+# ==========================================
+def index_video_folder(folder):
+    """回傳 { video_id: 檔案路徑 }，支援 `xxx [ID].mp4` 與 `ID.mp4` 兩種檔名"""
+    index = {}
+    if not os.path.isdir(folder):
+        return index
+
+    for fname in os.listdir(folder):
+        if not fname.lower().endswith(".mp4"):
+            continue
+        path = os.path.join(folder, fname)
+        match = re.search(r"\[(.*?)\]", fname)
+        if match:
+            index.setdefault(match.group(1), path)
+        index.setdefault(os.path.splitext(fname)[0], path)
+    return index
+
+
+# ==========================================
+# 從標註列解析影片 ID 與片段範圍
+# ==========================================
+def resolve_video_id(row):
+    """回傳 (video_id, is_bilibili)；無法解析時 video_id 為 None"""
+    candidates = [row.get('video_id'), row.get(URL_COL)]
+    for value in candidates:
+        if value is None or pd.isna(value):
+            continue
+        value = str(value).strip()
+        if is_bilibili_id(value):
+            return value, True
+        if value.startswith("http") and "bilibili" in value:
+            match = re.search(r"(BV[0-9A-Za-z]+)", value)
+            if match:
+                return match.group(1), True
+        if value.startswith("http"):
+            return parse_youtube_id(value), False
+    return None, False
+
+
+def _segment_bound(row, col):
+    value = row.get(col)
+    if value is None or pd.isna(value):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def split_labels(value):
+    return [l.strip() for l in str(value).split(';') if l.strip()]
+
+
+# ==========================================
+# 建立資料集計畫
+# ==========================================
+def plan_dataset(df, video_folder):
+    """
+    將標註列分組成樣本，並依來源影片歸類
+
+    Returns:
+        plan: { video_path: [sample, ...] }，sample 為 dict：
+              video_id / start_sec / end_sec / labels / rows
+        skipped: [(row_index, reason), ...]
+    """
+    video_index = index_video_folder(video_folder)
+    samples = {}
+    skipped = []
+
+    for idx, row in df.iterrows():
+        vid, bilibili = resolve_video_id(row)
+        if not vid:
+            skipped.append((idx, "BadVideoId"))
+            continue
+
+        video_path = video_index.get(vid)
+        if not video_path:
+            skipped.append((idx, "VideoNotFound"))
+            continue
+
+        # Bilibili 使用 start_seconds / end_seconds；YouTube 維持整部影片
+        start_sec = end_sec = None
+        if bilibili:
+            start_sec = _segment_bound(row, 'start_seconds')
+            end_sec = _segment_bound(row, 'end_seconds')
+
+        key = (video_path, start_sec, end_sec)
+        if key not in samples:
+            samples[key] = {
+                "video_id": vid,
+                "start_sec": start_sec,
+                "end_sec": end_sec,
+                "labels": [],
+                "rows": [],
+            }
+        sample = samples[key]
+        for label in split_labels(row[LABEL_COL]):
+            if label not in sample["labels"]:
+                sample["labels"].append(label)
+        sample["rows"].append(idx)
+
+    plan = {}
+    for (video_path, _, _), sample in samples.items():
+        plan.setdefault(video_path, []).append(sample)
+    return plan, skipped
+
+
+# ==========================================
+# 單次解碼：一部影片 → 所有片段的逐幀特徵
+# ==========================================
+def extract_video_segments(extractor, video_path, samples):
+    """
+    依序解碼 video_path 一次，將每一幀的特徵分配給所有涵蓋該幀的片段
+
+    取樣幀以絕對幀號對齊 (frame_idx % step == 0)，重疊片段共用同一組取樣幀
+
+    Returns:
+        (frames_list, effective_fps)
+        frames_list 與 samples 順序對應，每個元素為 (n, 14) 幀特徵或 None
+    """
+    results = [None] * len(samples)
+    if not os.path.exists(video_path):
+        return results, None
+
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if fps <= 0:
+        fps = 30  # 預設 FPS
+    step = sampling_step(fps, getattr(extractor, "target_fps", None))
+
+    ranges = []
+    for sample in samples:
+        start_frame = 0 if sample["start_sec"] is None else int(sample["start_sec"] * fps)
+        end_frame = total_frames if sample["end_sec"] is None else int(sample["end_sec"] * fps)
+        ranges.append((max(0, start_frame), min(total_frames, end_frame)))
+
+    starts = np.array([r[0] for r in ranges])
+    ends = np.array([r[1] for r in ranges])
+    first_frame, last_frame = int(starts.min()), int(ends.max())
+
+    print(f"   [Debug] FPS={fps:.2f}, 分析 FPS={effective_fps(fps, step):.2f}, 總幀數={total_frames}, "
+          f"片段數={len(samples)}, 解碼範圍={first_frame}~{last_frame}")
+
+    if first_frame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, first_frame)
+
+    collected = [[] for _ in samples]
+    current_frame = first_frame
+
+    while cap.isOpened() and current_frame < last_frame:
+        active = np.nonzero((starts <= current_frame) & (current_frame < ends))[0]
+
+        if len(active) == 0:
+            # 片段之間的空檔：距離遠就 seek，近就 grab() 略過
+            upcoming = starts[starts > current_frame]
+            if len(upcoming) == 0:
+                break
+            next_start = int(upcoming.min())
+            if next_start - current_frame > SEEK_GAP_FRAMES:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, next_start)
+                current_frame = next_start
+                continue
+            if not cap.grab():
+                break
+            current_frame += 1
+            continue
+
+        if current_frame % step:
+            if not cap.grab():
+                break
+            current_frame += 1
+            continue
+
+        ret, frame = cap.read()
+        if not ret:
+            break
+        current_frame += 1
+
+        features = extractor.process_frame(frame)
+        if features is None:
+            continue
+        for i in active:
+            collected[i].append(features)
+
+    cap.release()
+
+    for i, frames in enumerate(collected):
+        if frames:
+            results[i] = np.array(frames)
+    return results, effective_fps(fps, step)
+
+
+def extract_planned_features(extractor, plan):
+    """逐部影片解碼，yield (sample, frames, reason)"""
+    for v_idx, (video_path, samples) in enumerate(plan.items()):
+        print(f"\n[{v_idx+1}/{len(plan)}] ➤ 使用影片：{video_path}（{len(samples)} 個樣本）")
+        segment_frames, eff_fps = extract_video_segments(extractor, video_path, samples)
+        for sample, frames in zip(samples, segment_frames):
+            sample["effective_fps"] = eff_fps
+            if frames is None:
+                yield sample, None, "NoFeatures"
+            else:
+                yield sample, frames, "Success"
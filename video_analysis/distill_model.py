@@ -0,0 +1,178 @@
+"""
+distill_model.py
+
+將 train_local.py 訓練好的 Random Forest（teacher）蒸餾成精簡模型（student），
+讓 /predict 以些微準確率換取數量級更低的記憶體與單次推論延遲。
+
+- 訓練資料：window_dataset.py 的視窗特徵（與線上 30 幀視窗一致），或逐幀快取的整段聚合特徵；
+  先切出保留資料，再只對訓練部分加上高斯擾動樣本，擴充 teacher 的覆蓋範圍
+- 目標：teacher 每個標籤的機率 (predict_proba)
+- student：
+    linear — 標準化後對 logit(p) 做 Ridge 迴歸，推論只需一次 56×K 矩陣乘法
+    tree   — 單棵多輸出迴歸樹 (max_depth 可調)
+- 報告：保留資料上與 teacher 的各標籤一致率、完全一致率、延遲與檔案大小
+- 匯出：deadlift_compact_model.pkl（純 numpy 陣列 dict），由 pose_backend/compact_model.py 載入，
+  後端會優先使用它取代 deadlift_rf_model.pkl；這裡的評估也直接使用該模組的推論，只維護一份實作
+
+用法：
+    uv run python video_analysis/distill_model.py --student linear
+    uv run python video_analysis/distill_model.py --student tree --max-depth 8 --windows window_dataset
+"""
+import io
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import joblib
+from sklearn.linear_model import Ridge
+from sklearn.tree import DecisionTreeRegressor
+from sklearn.model_selection import train_test_split
+
+from window_dataset import FRAME_CACHE_DIR, load_window_dataset
+
+# 精簡模型的格式與推論以後端為準（pose_backend 單獨部署，不能反過來依賴 video_analysis）
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pose_backend"))
+from compact_model import COMPACT_FORMAT, CompactDeadliftModel
+
+MODEL_PATH = 'deadlift_rf_model.pkl'
+LABEL_BINARIZER_PATH = 'label_binarizer.pkl'
+COMPACT_MODEL_PATH = 'deadlift_compact_model.pkl'
+PROBA_CLIP = 0.02                        # logit 目標的機率截斷，避免 ±inf
+
+
+# ==========================================
+# Teacher 機率
+# ==========================================
+def teacher_label_proba(clf, X):
+    """RandomForest 多輸出 predict_proba → (n, 標籤數) 正類機率"""
+    probas = clf.predict_proba(X)
+    classes_per_output = clf.classes_
+    if not isinstance(probas, list):
+        # 單一輸出（只有一個標籤）：predict_proba 回傳單一陣列，classes_ 也不是逐輸出的 list
+        probas, classes_per_output = [probas], [clf.classes_]
+    out = np.zeros((len(X), len(probas)))
+    for k, (p, classes) in enumerate(zip(probas, classes_per_output)):
+        positive = np.nonzero(np.asarray(classes) == 1)[0]
+        if len(positive):
+            out[:, k] = p[:, positive[0]]
+    return out
+
+
+# ==========================================
+# Student 訓練與匯出
+# ==========================================
+def fit_student(kind, X, P, classes, max_depth=8, alpha=1.0):
+    """回傳精簡模型 artifact（純 numpy dict）"""
+    artifact = {"format": COMPACT_FORMAT, "kind": kind, "n_features": X.shape[1], "threshold": 0.5,
+                "classes": list(classes)}
+
+    if kind == "linear":
+        mean = X.mean(axis=0)
+        scale = X.std(axis=0)
+        scale[scale == 0] = 1.0
+        Z = (X - mean) / scale
+        p = np.clip(P, PROBA_CLIP, 1 - PROBA_CLIP)
+        ridge = Ridge(alpha=alpha).fit(Z, np.log(p / (1 - p)))
+        artifact.update(mean=mean, scale=scale,
+                        coef=np.ascontiguousarray(ridge.coef_.T), intercept=ridge.intercept_.copy())
+    elif kind == "tree":
+        tree = DecisionTreeRegressor(max_depth=max_depth, random_state=42).fit(X, P).tree_
+        artifact.update(
+            children_left=tree.children_left.astype(np.int32),
+            children_right=tree.children_right.astype(np.int32),
+            feature=tree.feature.astype(np.int32),
+            split_threshold=tree.threshold.astype(np.float64),
+            value=tree.value[:, :, 0].astype(np.float64),
+            max_depth=int(tree.max_depth),
+        )
+    else:
+        raise ValueError(f"unknown student kind: {kind}")
+    return artifact
+
+
+# ==========================================
+# 評估
+# ==========================================
+def single_row_latency_ms(fn, row, repeats=300):
+    fn(row)
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn(row)
+        samples.append(time.perf_counter() - t0)
+    return float(np.median(samples) * 1000)
+
+
+def serialized_size(obj):
+    buf = io.BytesIO()
+    joblib.dump(obj, buf)
+    return buf.tell()
+
+
+def report(teacher, artifact, X_test, classes):
+    student = CompactDeadliftModel(artifact)
+    t_pred = teacher.predict(X_test).astype(int).reshape(len(X_test), -1)
+    s_pred = student.predict(X_test)
+
+    per_label = np.mean(t_pred == s_pred, axis=0)
+    row = X_test[:1]
+    t_ms = single_row_latency_ms(teacher.predict, row)
+    s_ms = single_row_latency_ms(student.label_proba, row)
+    t_bytes, s_bytes = serialized_size(teacher), serialized_size(artifact)
+
+    print("\n📊 與 teacher 的一致率（保留資料）")
+    for name, acc in zip(classes, per_label):
+        print(f"   {name:<12} {acc:.1%}")
+    print(f"   完全一致率   {np.mean(np.all(t_pred == s_pred, axis=1)):.1%}")
+    print(f"\n⏱️ 單筆推論：teacher {t_ms:.3f}ms → student {s_ms:.3f}ms（{t_ms / max(s_ms, 1e-9):.0f}x）")
+    print(f"💾 模型大小：teacher {t_bytes/1024:.0f}KB → student {s_bytes/1024:.1f}KB（{t_bytes / max(s_bytes, 1):.0f}x）")
+
+
+def load_transfer_set(windows_dir=None, cache_dir=FRAME_CACHE_DIR):
+    if windows_dir:
+        X, _, _, _ = load_window_dataset(windows_dir)
+        return np.asarray(X, dtype=np.float64)
+    from model_selection import load_cached_samples
+    X, _, _ = load_cached_samples(cache_dir)
+    return X
+
+
+def augment(X, copies, noise=0.05, seed=42):
+    """每筆資料加上 copies 份高斯擾動（標準差 = noise × 特徵標準差），擴充蒸餾用的轉移資料"""
+    if copies <= 0:
+        return X
+    rng = np.random.default_rng(seed)
+    std = X.std(axis=0)
+    jitter = [X + rng.normal(size=X.shape) * std * noise for _ in range(copies)]
+    return np.concatenate([X] + jitter)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Random Forest → 精簡模型蒸餾")
+    parser.add_argument("--student", choices=["linear", "tree"], default="linear")
+    parser.add_argument("--max-depth", type=int, default=8, help="tree student 的最大深度")
+    parser.add_argument("--alpha", type=float, default=1.0, help="linear student 的 Ridge 正則化")
+    parser.add_argument("--windows", default=None, help="使用 window_dataset.py 的視窗資料集作為轉移資料")
+    parser.add_argument("--cache", default=FRAME_CACHE_DIR)
+    parser.add_argument("--augment", type=int, default=4, help="每筆資料的擾動複本數")
+    parser.add_argument("--out", default=COMPACT_MODEL_PATH)
+    args = parser.parse_args()
+
+    teacher = joblib.load(MODEL_PATH)
+    mlb = joblib.load(LABEL_BINARIZER_PATH)
+    classes = [str(c) for c in mlb.classes_]
+
+    X = load_transfer_set(args.windows, args.cache)
+    # 先切保留資料再擴充：同一筆的擾動複本不會同時出現在訓練與保留資料
+    X_train, X_test = train_test_split(X, test_size=0.2, random_state=42)
+    X_train = augment(X_train, args.augment)
+    print(f"🧪 轉移資料 {len(X)} 筆（訓練含擾動 {len(X_train)} / 保留 {len(X_test)}），student = {args.student}")
+
+    artifact = fit_student(args.student, X_train, teacher_label_proba(teacher, X_train), classes,
+                           max_depth=args.max_depth, alpha=args.alpha)
+    report(teacher, artifact, X_test, classes)
+
+    joblib.dump(artifact, args.out)
+    print(f"\n✅ 已匯出 {args.out}；複製到 pose_backend/ 後 /predict 會優先載入")
+    print(f"   （保留 deadlift_rf_model.pkl 可回退；設定 ML_MODEL_FILE=deadlift_rf_model.pkl 強制使用 RF）")
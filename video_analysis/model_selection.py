@@ -0,0 +1,255 @@
+"""
+model_selection.py
+
+延遲感知的模型選擇：掃描 RandomForest 的樹數量 × 深度，
+在快取的特徵上平行跑交叉驗證，並量測每個候選模型的服務成本：
+- 各標籤準確率 / micro-F1 / 完全一致率（out-of-fold 預測）
+- 單筆推論延遲（/predict 每次只推論 1 列）與批次推論的每列延遲
+- 序列化後的模型大小
+
+輸出 model_selection_report.json / .csv，標記 Pareto 前緣（F1 高、延遲低、檔案小），
+再以 --export 匯出選定的候選模型取代 deadlift_rf_model.pkl。
+
+用法：
+    uv run python video_analysis/model_selection.py --jobs -1
+    uv run python video_analysis/model_selection.py --export --min-f1 0.80
+    uv run python video_analysis/model_selection.py --export --candidate rf_100_12
+"""
+import io
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import joblib
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import f1_score
+from sklearn.model_selection import KFold, GroupKFold
+from sklearn.preprocessing import MultiLabelBinarizer
+
+from window_dataset import FRAME_CACHE_DIR, open_frame_cache, load_window_dataset
+
+N_ESTIMATORS_GRID = [25, 50, 100, 200, 300]
+MAX_DEPTH_GRID = [4, 8, 12, 15, None]
+CV_FOLDS = 5
+LATENCY_REPEATS = 200        # 單筆延遲取中位數的呼叫次數
+LATENCY_BATCH = 256          # 批次延遲的每批列數
+REPORT_PATH = 'model_selection_report'
+MODEL_PATH = 'deadlift_rf_model.pkl'
+LABEL_BINARIZER_PATH = 'label_binarizer.pkl'
+
+
+def candidate_id(n_estimators, max_depth):
+    return f"rf_{n_estimators}_{max_depth or 'none'}"
+
+
+def make_model(n_estimators, max_depth):
+    # 與 train_local.py 相同設定；n_jobs=1 與 /predict 的服務方式一致
+    return RandomForestClassifier(
+        n_estimators=n_estimators,
+        max_depth=max_depth,
+        class_weight='balanced_subsample',
+        random_state=42,
+        n_jobs=1
+    )
+
+
+# ==========================================
+# 讀取快取特徵
+# ==========================================
+def load_cached_samples(cache_dir=FRAME_CACHE_DIR):
+    """逐幀快取 → 每個樣本的整段聚合特徵（與 train_local.py 訓練方式相同）"""
+    from train_local import aggregate_features
+
+    frames, samples = open_frame_cache(cache_dir)
+    X = np.array([aggregate_features(frames[s["offset"]:s["offset"] + s["length"]]) for s in samples])
+    labels = [s["labels"] for s in samples]
+    fps_used = [s.get("effective_fps") for s in samples]
+    return X, labels, fps_used
+
+
+# ==========================================
+# 交叉驗證（平行）
+# ==========================================
+def _fit_fold(params, X, Y, train_idx, test_idx):
+    clf = make_model(*params)
+    clf.fit(X[train_idx], Y[train_idx])
+    return params, test_idx, clf.predict(X[test_idx])
+
+
+def measure_latency(clf, X):
+    """回傳 (單筆延遲中位數 ms, 批次每列延遲 ms)"""
+    row = X[:1]
+    clf.predict(row)  # warm-up
+    samples = []
+    for _ in range(LATENCY_REPEATS):
+        t0 = time.perf_counter()
+        clf.predict(row)
+        samples.append(time.perf_counter() - t0)
+
+    batch = X[np.arange(LATENCY_BATCH) % len(X)]
+    t0 = time.perf_counter()
+    clf.predict(batch)
+    batch_ms = (time.perf_counter() - t0) * 1000 / len(batch)
+    return float(np.median(samples) * 1000), float(batch_ms)
+
+
+def serialized_size(obj):
+    buf = io.BytesIO()
+    joblib.dump(obj, buf)
+    return buf.tell()
+
+
+def pareto_front(rows):
+    """F1 越高越好，單筆延遲與檔案大小越小越好；回傳非支配候選的 id"""
+    front = set()
+    for a in rows:
+        dominated = False
+        for b in rows:
+            if b is a:
+                continue
+            no_worse = (b["micro_f1"] >= a["micro_f1"] and b["latency_single_ms"] <= a["latency_single_ms"]
+                        and b["model_bytes"] <= a["model_bytes"])
+            better = (b["micro_f1"] > a["micro_f1"] or b["latency_single_ms"] < a["latency_single_ms"]
+                      or b["model_bytes"] < a["model_bytes"])
+            if no_worse and better:
+                dominated = True
+                break
+        if not dominated:
+            front.add(a["id"])
+    return front
+
+
+def binarize(labels, classes=None):
+    """標籤列表或已編碼的 0/1 矩陣 → (Y, mlb)"""
+    if isinstance(labels, np.ndarray):
+        mlb = MultiLabelBinarizer(classes=classes)
+        mlb.fit([])
+        return labels, mlb
+    mlb = MultiLabelBinarizer()
+    return mlb.fit_transform(labels), mlb
+
+
+def run_selection(X, labels, groups=None, n_jobs=-1, classes=None, report_path=REPORT_PATH):
+    """
+    掃描 N_ESTIMATORS_GRID × MAX_DEPTH_GRID，寫出報告並回傳候選列表
+
+    groups 給定時（例如視窗資料集的來源樣本編號）改用 GroupKFold，避免同一段影片同時出現在訓練/驗證
+    """
+    X = np.asarray(X)
+    Y, mlb = binarize(labels, classes)
+    classes = [str(c) for c in mlb.classes_]
+
+    n_splits = min(CV_FOLDS, len(X))
+    if groups is not None:
+        n_splits = min(n_splits, len(np.unique(groups)))
+        splits = list(GroupKFold(n_splits=n_splits).split(X, Y, groups))
+    else:
+        splits = list(KFold(n_splits=n_splits, shuffle=True, random_state=42).split(X))
+
+    grid = [(n, d) for n in N_ESTIMATORS_GRID for d in MAX_DEPTH_GRID]
+    print(f"🔍 候選模型 {len(grid)} 個 × {n_splits} folds，樣本 {len(X)} 筆")
+
+    # 1. 交叉驗證：所有 (候選, fold) 平行訓練
+    fold_results = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_fold)(params, X, Y, tr, te) for params in grid for tr, te in splits
+    )
+    oof = {params: np.zeros_like(Y) for params in grid}
+    for params, test_idx, pred in fold_results:
+        oof[params][test_idx] = pred
+
+    # 2. 逐一以全資料訓練（樹之間平行），訓練完才量測延遲，避免與其他訓練互相干擾
+    rows = []
+    for params in grid:
+        pred = oof[params]
+        clf = make_model(*params)
+        clf.set_params(n_jobs=n_jobs)
+        clf.fit(X, Y)
+        clf.set_params(n_jobs=1)
+        single_ms, batch_ms = measure_latency(clf, X)
+        row = {
+            "id": candidate_id(*params),
+            "n_estimators": params[0],
+            "max_depth": params[1],
+            "micro_f1": float(f1_score(Y, pred, average="micro", zero_division=0)),
+            "macro_f1": float(f1_score(Y, pred, average="macro", zero_division=0)),
+            "subset_accuracy": float(np.mean(np.all(pred == Y, axis=1))),
+            "latency_single_ms": single_ms,
+            "latency_batch_row_ms": batch_ms,
+            "model_bytes": serialized_size(clf),
+        }
+        per_label = np.mean(pred == Y, axis=0)
+        row["per_label_accuracy"] = {classes[i]: float(acc) for i, acc in enumerate(per_label)}
+        rows.append(row)
+        del clf
+        print(f"   {row['id']:<14} F1={row['micro_f1']:.3f} 單筆={single_ms:.2f}ms "
+              f"批次={batch_ms:.3f}ms/列 大小={row['model_bytes']/1024:.0f}KB")
+
+    front = pareto_front(rows)
+    for row in rows:
+        row["pareto"] = row["id"] in front
+
+    with open(f"{report_path}.json", "w", encoding="utf-8") as f:
+        json.dump({"classes": classes, "folds": n_splits, "samples": len(X), "candidates": rows},
+                  f, ensure_ascii=False, indent=2)
+    flat = pd.DataFrame([{k: v for k, v in r.items() if k != "per_label_accuracy"} for r in rows])
+    flat.sort_values(["pareto", "micro_f1"], ascending=[False, False]).to_csv(f"{report_path}.csv", index=False)
+
+    print(f"\n📈 Pareto 前緣：{', '.join(sorted(front))}")
+    print(f"📄 報告已寫入 {report_path}.json / {report_path}.csv")
+    return rows
+
+
+# ==========================================
+# 匯出選定的候選模型
+# ==========================================
+def choose_candidate(rows, candidate=None, min_f1=None):
+    """指定 id，或在達到 min_f1 的候選中挑單筆延遲最低（同延遲取較小檔案）者"""
+    if candidate:
+        match = [r for r in rows if r["id"] == candidate]
+        return match[0] if match else None
+    eligible = [r for r in rows if min_f1 is None or r["micro_f1"] >= min_f1]
+    if not eligible:
+        return None
+    return min(eligible, key=lambda r: (r["latency_single_ms"], r["model_bytes"]))
+
+
+def export_candidate(row, X, labels, classes=None):
+    Y, mlb = binarize(labels, classes)
+    clf = make_model(row["n_estimators"], row["max_depth"])
+    clf.fit(X, Y)
+    joblib.dump(clf, MODEL_PATH)
+    joblib.dump(mlb, LABEL_BINARIZER_PATH)
+    print(f"✅ 已匯出 {row['id']} → {MODEL_PATH}（F1={row['micro_f1']:.3f}, 單筆 {row['latency_single_ms']:.2f}ms）")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="延遲感知的 RandomForest 模型選擇")
+    parser.add_argument("--cache", default=FRAME_CACHE_DIR, help="train_local.py 產生的逐幀特徵快取")
+    parser.add_argument("--windows", default=None, help="改用 window_dataset.py 產生的視窗資料集")
+    parser.add_argument("--jobs", type=int, default=-1)
+    parser.add_argument("--export", action="store_true", help="依報告匯出選定的候選模型")
+    parser.add_argument("--candidate", default=None, help="指定候選 id，例如 rf_100_12")
+    parser.add_argument("--min-f1", type=float, default=None, help="挑選達到此 micro-F1 的最便宜模型")
+    args = parser.parse_args()
+
+    if args.export:
+        with open(f"{REPORT_PATH}.json", encoding="utf-8") as f:
+            rows = json.load(f)["candidates"]
+        row = choose_candidate(rows, args.candidate, args.min_f1)
+        if row is None:
+            print("❌ 沒有符合條件的候選模型")
+            raise SystemExit(1)
+        if args.windows:
+            X, Y, _, classes = load_window_dataset(args.windows)
+            export_candidate(row, X, np.asarray(Y), classes)
+        else:
+            X, labels, _ = load_cached_samples(args.cache)
+            export_candidate(row, X, labels)
+    elif args.windows:
+        X, Y, G, classes = load_window_dataset(args.windows)
+        run_selection(X, np.asarray(Y), groups=G, n_jobs=args.jobs, classes=classes)
+    else:
+        X, labels, _ = load_cached_samples(args.cache)
+        run_selection(X, labels, n_jobs=args.jobs)
@@ -1,88 +1,20 @@
 import os
-import cv2
-import numpy as np
-import mediapipe as mp
 import joblib
-import warnings
 import yt_dlp
 import threading
-import time
 import tkinter as tk
 from tkinter import ttk, messagebox
-from collections import deque
-from datetime import timedelta
+from analysis_pipeline import (
+    MODEL_PATH, LABEL_BINARIZER_PATH, INFERENCE_HOP, RECHECK_MARGIN,
+    load_analysis_config, format_timestamp, AnalysisPipeline,
+    analysis_options, open_result_cache, cached_analysis, store_analysis,
+)
+from result_cache import file_digest
 
-# ==========================================
-# 0. 基礎設定
-# ==========================================
-warnings.filterwarnings("ignore", category=UserWarning, module='google.protobuf')
-MODEL_PATH = 'deadlift_rf_model.pkl'
-LABEL_BINARIZER_PATH = 'label_binarizer.pkl'
 TEMP_VIDEO_PATH = 'temp_video_analysis.mp4'
 
 # ==========================================
-# 1. 特徵萃取邏輯 (保持不變)
-# ==========================================
-class DeadliftFeatureExtractor:
-    def __init__(self): 
-        self.pose = mp.solutions.pose.Pose(
-            static_image_mode=False, model_complexity=1,
-            min_detection_confidence=0.5, min_tracking_confidence=0.5
-        )
-
-    def dist(self, a, b):
-        return np.sqrt((a[0]-b[0])**2 + (a[1]-b[1])**2)
-
-    def calculate_angle(self, a, b, c):
-        a, b, c = np.array(a), np.array(b), np.array(c)
-        ba, bc = a - b, c - b
-        cos_angle = np.dot(ba, bc) / ((np.linalg.norm(ba) * np.linalg.norm(bc)) + 1e-7)
-        return np.degrees(np.arccos(np.clip(cos_angle, -1.0, 1.0)))
-
-    def get_landmarks(self, results):
-        if not results.pose_landmarks: return None
-        lm = results.pose_landmarks.landmark
-        return {
-            'left_ear': [lm[7].x, lm[7].y], 'right_ear': [lm[8].x, lm[8].y],
-            'left_shoulder': [lm[11].x, lm[11].y], 'right_shoulder': [lm[12].x, lm[12].y],
-            'left_hip': [lm[23].x, lm[23].y], 'right_hip': [lm[24].x, lm[24].y],
-            'left_knee': [lm[25].x, lm[25].y], 'right_knee': [lm[26].x, lm[26].y],
-            'left_ankle': [lm[27].x, lm[27].y], 'right_ankle': [lm[28].x, lm[28].y],
-            'left_wrist': [lm[15].x, lm[15].y], 'right_wrist': [lm[16].x, lm[16].y]
-        }
-
-    def extract_frame_features(self, lm):
-        # 計算單一幀的特徵 (不進行聚合)
-        shoulder_c = np.mean([lm['left_shoulder'], lm['right_shoulder']], axis=0)
-        hip_c = np.mean([lm['left_hip'], lm['right_hip']], axis=0)
-        knee_c = np.mean([lm['left_knee'], lm['right_knee']], axis=0)
-        ankle_c = np.mean([lm['left_ankle'], lm['right_ankle']], axis=0)
-        wrist_c = np.mean([lm['left_wrist'], lm['right_wrist']], axis=0)
-
-        spine_angle = self.calculate_angle(lm['left_ear'], shoulder_c, hip_c)
-        hip_angle = self.calculate_angle(shoulder_c, hip_c, knee_c)
-        knee_angle = self.calculate_angle(hip_c, knee_c, ankle_c)
-        torso_angle = self.calculate_angle([hip_c[0], hip_c[1]-0.5], hip_c, shoulder_c)
-        
-        head_shoulder_dist = self.dist(lm['left_ear'], shoulder_c)
-        shoulder_hip_dist = self.dist(shoulder_c, hip_c)
-        
-        vec_sh_hip = shoulder_c - hip_c
-        vec_hip_knee = hip_c - knee_c
-        vec_ear_sh = lm['left_ear'] - shoulder_c
-        vec_wrist_ankle = wrist_c - ankle_c
-
-        return [
-            spine_angle, hip_angle, knee_angle, torso_angle,
-            head_shoulder_dist, shoulder_hip_dist,
-            vec_sh_hip[0], vec_sh_hip[1],
-            vec_hip_knee[0], vec_hip_knee[1],
-            vec_ear_sh[0], vec_ear_sh[1],
-            vec_wrist_ankle[0], vec_wrist_ankle[1]
-        ]
-
-# ==========================================
-# 2. GUI 應用程式
+# 3. GUI 應用程式
 # ==========================================
 class DeadliftApp:
     def __init__(self, root):
@@ -113,6 +45,23 @@ class DeadliftApp:
         self.show_video_var = tk.BooleanVar(value=True)
         tk.Checkbutton(input_frame, text="同步顯示骨架分析畫面", variable=self.show_video_var, font=("微軟正黑體", 9)).pack(anchor="w")
 
+        # 取樣控制（空白 = 每幀 / 原始解析度）
+        config = load_analysis_config()
+        option_frame = tk.Frame(input_frame)
+        option_frame.pack(anchor="w", pady=2)
+        tk.Label(option_frame, text="分析 FPS:", font=("微軟正黑體", 9)).pack(side="left")
+        self.target_fps_entry = tk.Entry(option_frame, width=6)
+        self.target_fps_entry.insert(0, "" if config["target_fps"] is None else str(config["target_fps"]))
+        self.target_fps_entry.pack(side="left", padx=(2, 10))
+        tk.Label(option_frame, text="最大解析度:", font=("微軟正黑體", 9)).pack(side="left")
+        self.max_dim_entry = tk.Entry(option_frame, width=6)
+        self.max_dim_entry.insert(0, "" if config["max_dim"] is None else str(config["max_dim"]))
+        self.max_dim_entry.pack(side="left", padx=(2, 10))
+        tk.Label(option_frame, text="推論間隔(幀):", font=("微軟正黑體", 9)).pack(side="left")
+        self.hop_entry = tk.Entry(option_frame, width=4)
+        self.hop_entry.insert(0, str(INFERENCE_HOP))
+        self.hop_entry.pack(side="left", padx=2)
+
         # 按鈕
         self.btn_analyze = tk.Button(self.root, text="🚀 開始即時分析", font=("微軟正黑體", 12), bg="#4CAF50", fg="white", command=self.start_thread)
         self.btn_analyze.pack(pady=10, ipadx=20)
@@ -149,6 +98,15 @@ class DeadliftApp:
         except Exception as e:
             messagebox.showerror("錯誤", f"載入模型失敗: {e}")
 
+    def read_sampling_options(self):
+        def parse(entry, cast):
+            text = entry.get().strip()
+            try:
+                return cast(text) if text else None
+            except ValueError:
+                return None
+        return parse(self.target_fps_entry, float), parse(self.max_dim_entry, int), parse(self.hop_entry, int) or INFERENCE_HOP
+
     def start_thread(self):
         url = self.url_entry.get().strip()
         if not url: return
@@ -164,91 +122,84 @@ class DeadliftApp:
         thread.start()
 
     def add_log(self, timestamp_sec, error_msg):
-        # 將秒數轉為 00:00 格式
-        time_str = str(timedelta(seconds=int(timestamp_sec)))
-        if time_str.startswith("0:"): time_str = time_str[2:] # 去掉前面的 0:
-        
         # 插入表格最上方
-        self.tree.insert("", 0, values=(time_str, error_msg))
+        self.tree.insert("", 0, values=(format_timestamp(timestamp_sec), error_msg))
 
     def run_analysis(self, url):
         try:
-            # 1. 下載
-            self.update_status("📥 正在下載影片...", "blue")
+            target_fps, max_dim, hop = self.read_sampling_options()
+            options = analysis_options(target_fps, max_dim, hop, RECHECK_MARGIN)
+            on_label = lambda sec, label: self.root.after(0, self.add_log, sec, f"⚠️ {label}")
+
+            # 0. 結果快取：同一連結分析過就不必重新下載
+            cache = open_result_cache()
+            video_hash = cache.lookup_url(url) if cache else None
+            hit = cached_analysis(cache, video_hash, self.model, self.mlb, options, on_label) if video_hash else None
+            if hit:
+                events, _, source = hit
+                source_text = "結果" if source == "result" else "landmarks，已略過 Pose"
+                self.root.after(0, self.update_status, f"⚡ 快取命中（{source_text}）：{len(events)} 筆", "black")
+                return
+
+            # 1. 背景下載（nopart：直接寫入目標檔，分析端可以邊下載邊讀）
+            self.update_status("📥 正在下載影片，收到第一段影像就開始分析...", "blue")
             if os.path.exists(TEMP_VIDEO_PATH): os.remove(TEMP_VIDEO_PATH)
-            ydl_opts = {'format': 'best[ext=mp4]/best', 'outtmpl': TEMP_VIDEO_PATH, 'quiet': True}
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-
-            # 2. 準備分析
-            self.update_status("👀 正在分析中...", "green")
-            cap = cv2.VideoCapture(TEMP_VIDEO_PATH)
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            extractor = DeadliftFeatureExtractor()
-            mp_drawing = mp.solutions.drawing_utils
-
-            # 滑動視窗 (30 frames)
-            window = deque(maxlen=30)
-            
-            # 冷卻機制 (避免同一秒內重複刷同樣的錯誤)
-            last_error_time = {} # { "錯誤名稱": 上次出現的秒數 }
-            COOLDOWN_SECONDS = 1.5 # 相同錯誤至少間隔 1.5 秒才顯示一次
-
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret: break
-
-                current_sec = cap.get(cv2.CAP_PROP_POS_FRAMES) / fps
-                
-                # 影像處理
-                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                results = extractor.pose.process(rgb)
-                
-                # 繪製骨架
-                if self.show_video_var.get():
-                    if results.pose_landmarks:
-                        mp_drawing.draw_landmarks(frame, results.pose_landmarks, mp.solutions.pose.POSE_CONNECTIONS)
-                    
-                    # 在畫面上顯示時間
-                    cv2.putText(frame, f"Time: {current_sec:.1f}s", (10, 30), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                    
-                    cv2.imshow('Analysis Preview', cv2.resize(frame, (0, 0), fx=0.6, fy=0.6))
-                    if cv2.waitKey(1) & 0xFF == ord('q'): break
-
-                # 特徵計算與預測
-                if results.pose_landmarks:
-                    lm = extractor.get_landmarks(results)
-                    if lm:
-                        feats = extractor.extract_frame_features(lm)
-                        window.append(feats)
-
-                        # 每當累積滿 30 幀 (約1秒)，進行一次診斷
-                        if len(window) == 30:
-                            data = np.array(window)
-                            # 聚合特徵
-                            input_vec = np.concatenate([
-                                np.mean(data, axis=0), np.max(data, axis=0),
-                                np.min(data, axis=0), np.std(data, axis=0)
-                            ]).reshape(1, -1)
-                            
-                            # 預測
-                            pred = self.model.predict(input_vec)
-                            labels = self.mlb.inverse_transform(pred)[0]
-
-                            # 處理偵測結果
-                            for label in labels:
-                                if label != "正確動作":
-                                    # 檢查冷卻時間
-                                    last_time = last_error_time.get(label, -999)
-                                    if current_sec - last_time > COOLDOWN_SECONDS:
-                                        # 顯示在 GUI
-                                        self.root.after(0, self.add_log, current_sec, f"⚠️ {label}")
-                                        last_error_time[label] = current_sec
-
-            cap.release()
-            cv2.destroyAllWindows()
-            self.update_status("✅ 分析完成", "black")
+            download_done = threading.Event()
+            download_errors = []
+
+            def download():
+                try:
+                    ydl_opts = {'format': 'best[ext=mp4]/best', 'outtmpl': TEMP_VIDEO_PATH, 'quiet': True, 'nopart': True}
+                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                        ydl.download([url])
+                except Exception as e:
+                    download_errors.append(e)
+                finally:
+                    download_done.set()
+
+            threading.Thread(target=download, daemon=True).start()
+
+            # 2. 分段管線分析（追著下載中的檔案讀）
+            pipeline = AnalysisPipeline(
+                TEMP_VIDEO_PATH, self.model, self.mlb,
+                on_label=on_label,
+                show_preview=self.show_video_var.get(),
+                target_fps=target_fps, max_dim=max_dim,
+                download_done=download_done, hop=hop,
+                record_landmarks=cache is not None,
+            )
+            try:
+                pipeline.start()
+            except RuntimeError:
+                # 下載失敗時檔案打不開：回報下載的錯誤，而不是「無法開啟影片」
+                if download_errors:
+                    raise download_errors[0]
+                raise
+
+            # 狀態列每 0.5 秒更新各階段 fps
+            while pipeline.is_alive():
+                pipeline.join(0.5)
+                progress = pipeline.progress()
+                progress_text = f"{progress:.0%} " if progress is not None else ""
+                download_text = "" if download_done.is_set() else "下載中 "
+                self.root.after(0, self.update_status,
+                                f"👀 {download_text}分析中 {progress_text}（{pipeline.analysis_fps:.1f} fps）｜{pipeline.stats_text()}", "green")
+
+            if download_errors:
+                raise download_errors[0]
+            if pipeline.error:
+                raise pipeline.error
+            if not pipeline.completed:
+                # 預覽視窗按 q 中止：下載可能還在寫入，結果不完整，不寫入快取
+                self.root.after(0, self.update_status,
+                                f"⏹️ 已停止（分析到 {pipeline.last_sec:.1f}s，共 {len(pipeline.events)} 筆）", "black")
+                return
+            if cache is not None and download_done.is_set():
+                video_hash = file_digest(TEMP_VIDEO_PATH)
+                cache.remember_url(url, video_hash)
+                store_analysis(cache, video_hash, pipeline, options)
+            self.root.after(0, self.update_status,
+                            f"✅ 分析完成（分析 {pipeline.analysis_fps:.1f} fps，首幀 {pipeline.first_frame_latency or 0:.1f}s）｜{pipeline.stats_text()}", "black")
 
         except Exception as e:
             self.update_status(f"❌ 錯誤: {e}", "red")
@@ -259,6 +210,12 @@ class DeadliftApp:
         self.status_label.config(text=text, fg=color)
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = DeadliftApp(root)
-    root.mainloop()
\ No newline at end of file
+    import sys
+    # 帶影片參數或 --manifest：無介面批次模式（與 batch_analysis.py 相同）
+    if len(sys.argv) > 1:
+        from batch_analysis import main
+        main()
+    else:
+        root = tk.Tk()
+        app = DeadliftApp(root)
+        root.mainloop()
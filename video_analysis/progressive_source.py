@@ -0,0 +1,168 @@
+"""
+progressive_source.py
+
+邊下載邊分析：讓 AnalysisPipeline 在影片還沒下載完時就開始解碼。
+
+- GrowingVideoCapture：與 cv2.VideoCapture 相同介面 (isOpened / read / grab / get / release)。
+  讀到目前檔尾但下載尚未完成時，等檔案變大後重新開啟、跳到下一幀繼續讀。
+- 管線 (pipe)：先把資料邊收邊寫到暫存檔，再用 GrowingVideoCapture 追著讀。
+- HTTP(S) URL：OpenCV 的 FFmpeg 後端本身就能串流讀取 (含 chunked body)，直接開啟。
+
+MP4 必須是 faststart（moov 在檔頭）或 fragmented MP4 才能在下載途中開啟；
+moov 在檔尾的影片會等到下載完成才開始分析（結果相同，只是沒有提早）。
+WebM / MKV / MPEG-TS 沒有這個限制。
+"""
+import os
+import tempfile
+import threading
+import time
+import cv2
+
+POLL_INTERVAL = 0.3      # 等待檔案變大的輪詢間隔 (秒)
+SPOOL_CHUNK = 1 << 16
+
+
+def is_stream_url(source):
+    return isinstance(source, str) and source.lower().startswith(("http://", "https://"))
+
+
+class GrowingVideoCapture:
+    """
+    追著讀正在寫入的影片檔
+
+    done: threading.Event，寫入端 (下載) 結束時設定；未設定前讀到檔尾會等待而不是結束
+    owns_path: 檔案是自己建立的暫存檔（管線）時為 True，release() 會一併刪除
+    """
+
+    def __init__(self, path, done, poll_interval=POLL_INTERVAL, owns_path=False):
+        self.path = path
+        self.done = done
+        self.poll_interval = poll_interval
+        self.owns_path = owns_path
+        self.frame_idx = 0          # 下一個要讀的幀
+        self._cap = None
+        self._opened_size = -1
+        self._cancel = threading.Event()
+        self._open()
+
+    # ---------- cv2.VideoCapture 介面 ----------
+    def isOpened(self):
+        return self._cap is not None and self._cap.isOpened()
+
+    def grab(self):
+        return self._advance(lambda cap: cap.grab(), lambda ok: ok, False)
+
+    def read(self):
+        return self._advance(lambda cap: cap.read(), lambda r: r[0], (False, None))
+
+    def get(self, prop):
+        # 下載途中總幀數未知（部分檔案回報的數字不可靠）
+        if prop == cv2.CAP_PROP_FRAME_COUNT and not self.done.is_set():
+            return 0
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.frame_idx
+        return self._cap.get(prop) if self._cap is not None else 0
+
+    def release(self):
+        self._close()
+        if self.owns_path:
+            self.owns_path = False
+            # 管線可能還在寫入；POSIX 上刪除後寫入端照常結束，Windows 上檔案仍開著時刪不掉，留給系統暫存清理
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def cancel(self):
+        """中止等待（管線被停止時呼叫）"""
+        self._cancel.set()
+
+    # ---------- 內部 ----------
+    def _close(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+    def _size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return -1
+
+    def _open(self):
+        """等到檔案可以被開啟（有檔頭）為止；下載結束仍無法開啟則放棄"""
+        while not self._cancel.is_set():
+            finished = self.done.is_set()
+            size = self._size()
+            if size > 0:
+                cap = cv2.VideoCapture(self.path)
+                if cap.isOpened():
+                    if self.frame_idx:
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, self.frame_idx)
+                    self._close()
+                    self._cap, self._opened_size = cap, size
+                    return True
+                cap.release()
+            if finished:
+                return False
+            self._wait_for_growth(size)
+        return False
+
+    def _wait_for_growth(self, size):
+        while not self._cancel.is_set() and not self.done.is_set() and self._size() <= size:
+            time.sleep(self.poll_interval)
+
+    def _advance(self, op, ok, fail):
+        while self._cap is not None:
+            result = op(self._cap)
+            if ok(result):
+                self.frame_idx += 1
+                return result
+            # 讀不到：若下載已完成且開啟後檔案沒再變大，就是真正的結尾
+            if self._cancel.is_set() or (self.done.is_set() and self._size() == self._opened_size):
+                return result
+            self._wait_for_growth(self._opened_size)
+            if not self._open():
+                return result
+        return fail
+
+
+def spool_stream(stream, path, done, chunk=SPOOL_CHUNK):
+    """背景執行緒：把管線 / 檔案物件的資料邊收邊寫到 path，結束時設定 done"""
+    def _copy():
+        try:
+            with open(path, "wb") as out:
+                while True:
+                    data = stream.read(chunk)
+                    if not data:
+                        break
+                    out.write(data)
+                    out.flush()
+        finally:
+            done.set()
+
+    t = threading.Thread(target=_copy, daemon=True)
+    t.start()
+    return t
+
+
+def open_progressive_source(source, done=None):
+    """
+    source:
+        http(s) URL          → cv2.VideoCapture 直接串流
+        檔案路徑 + done       → GrowingVideoCapture（done 未設定前視為仍在寫入）
+        檔案路徑 (無 done)    → 一般 cv2.VideoCapture
+        "-" 或檔案物件 (管線) → 暫存檔 + GrowingVideoCapture（release() 時刪除暫存檔）
+    """
+    if is_stream_url(source):
+        return cv2.VideoCapture(source)
+    if source == "-" or hasattr(source, "read"):
+        stream = source if hasattr(source, "read") else os.fdopen(os.dup(0), "rb")
+        fd, path = tempfile.mkstemp(suffix=".video")
+        os.close(fd)
+        done = threading.Event()
+        spool_stream(stream, path, done)
+        return GrowingVideoCapture(path, done, owns_path=True)
+    if done is None:
+        return cv2.VideoCapture(source)
+    return GrowingVideoCapture(source, done)
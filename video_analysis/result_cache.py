@@ -0,0 +1,218 @@
+"""
+result_cache.py
+
+以內容雜湊定址的分析結果快取（predict_youtube.py GUI 與批次模式共用）：
+
+    results/   <影片 sha256>_<取樣參數>_<模型>_<分類參數>.json   → 完整命中：直接回傳標籤時間軸
+    landmarks/ <影片 sha256>_<取樣參數>.npz                      → 部分命中：模型或 hop 改變時略過 Pose，
+                                                                  只重跑特徵 + 分類器
+    url_index.json  URL → 影片 sha256，重複分析同一個 YouTube 連結時連下載都省略
+
+- 影片以內容 (sha256) 而非檔名識別，重新上傳或改名的同一部影片也會命中
+- 模型版本 = 模型檔與標籤編碼器檔的內容雜湊；重新訓練後結果自動失效，但 landmarks 仍可沿用
+- 容量上限 (max_bytes)：以檔案 mtime 做 LRU，讀取時會更新 mtime，超過上限時從最久未用的開始刪除
+- 寫入採「暫存檔 + os.replace」，多個批次 worker 程序同時寫入也不會讀到半份檔案
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+import numpy as np
+
+RESULT_CACHE_DIR = 'analysis_cache'
+RESULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+FEATURE_VERSION = 1            # 特徵 / 視窗邏輯改變時遞增，讓舊結果失效
+
+LANDMARK_KEYS = [
+    'left_ear', 'right_ear', 'left_shoulder', 'right_shoulder', 'left_hip', 'right_hip',
+    'left_knee', 'right_knee', 'left_ankle', 'right_ankle', 'left_wrist', 'right_wrist',
+]
+
+
+def file_digest(path, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(chunk)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+
+def params_digest(params):
+    text = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+def model_fingerprint(*paths):
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(file_digest(path).encode("ascii"))
+    return h.hexdigest()[:16]
+
+
+def _atomic_write(path, write):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _touch(path):
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+
+# ==========================================
+# landmarks ↔ 陣列
+# ==========================================
+def pack_landmarks(posed):
+    """[(秒數, lm dict 或 None)] → (secs (n,), points (n, 12, 2))，None 以 NaN 表示"""
+    secs = np.array([sec for sec, _ in posed], dtype=np.float64)
+    points = np.full((len(posed), len(LANDMARK_KEYS), 2), np.nan)
+    for i, (_, lm) in enumerate(posed):
+        if lm:
+            points[i] = [lm[key] for key in LANDMARK_KEYS]
+    return secs, points
+
+
+def unpack_landmarks(secs, points):
+    posed = []
+    for sec, p in zip(secs, points):
+        if np.isnan(p[0, 0]):
+            posed.append((float(sec), None))
+        else:
+            posed.append((float(sec), {key: p[k] for k, key in enumerate(LANDMARK_KEYS)}))
+    return posed
+
+
+# ==========================================
+# 快取
+# ==========================================
+class ResultCache:
+    def __init__(self, model_hash, cache_dir=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.model_hash = model_hash
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        for sub in ("results", "landmarks"):
+            os.makedirs(os.path.join(cache_dir, sub), exist_ok=True)
+
+    # ---------- 鍵 ----------
+    @staticmethod
+    def pose_params(options):
+        # landmarks 只受取樣與縮圖影響
+        return {"target_fps": options.get("target_fps"), "max_dim": options.get("max_dim")}
+
+    @staticmethod
+    def classify_params(options):
+        return {k: options.get(k) for k in ("hop", "recheck_margin", "window_size", "cooldown")}
+
+    def _landmarks_path(self, video_hash, options):
+        return os.path.join(self.cache_dir, "landmarks",
+                            f"{video_hash}_{params_digest(self.pose_params(options))}.npz")
+
+    def _result_path(self, video_hash, options):
+        key = params_digest(dict(self.classify_params(options), feature_version=FEATURE_VERSION))
+        return os.path.join(self.cache_dir, "results",
+                            f"{video_hash}_{params_digest(self.pose_params(options))}_{self.model_hash}_{key}.json")
+
+    # ---------- URL 索引 ----------
+    def _url_index_path(self):
+        return os.path.join(self.cache_dir, "url_index.json")
+
+    def lookup_url(self, url):
+        try:
+            with open(self._url_index_path(), encoding="utf-8") as f:
+                return json.load(f).get(url)
+        except (OSError, ValueError):
+            return None
+
+    def remember_url(self, url, video_hash):
+        try:
+            with open(self._url_index_path(), encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index[url] = video_hash
+        _atomic_write(self._url_index_path(),
+                      lambda f: f.write(json.dumps(index, ensure_ascii=False).encode("utf-8")))
+
+    # ---------- 結果 ----------
+    def load_result(self, video_hash, options):
+        path = self._result_path(video_hash, options)
+        try:
+            with open(path, encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        _touch(path)
+        return result
+
+    def save_result(self, video_hash, options, events, meta):
+        result = dict(meta, events=[[sec, label] for sec, label in events], created_at=time.time())
+        _atomic_write(self._result_path(video_hash, options),
+                      lambda f: f.write(json.dumps(result, ensure_ascii=False).encode("utf-8")))
+        self.evict()
+
+    # ---------- landmarks ----------
+    def load_landmarks(self, video_hash, options):
+        """回傳 ([(秒數, lm 或 None)], meta) 或 None"""
+        path = self._landmarks_path(video_hash, options)
+        try:
+            with np.load(path) as data:
+                posed = unpack_landmarks(data["secs"], data["points"])
+                meta = json.loads(str(data["meta"]))
+        except (OSError, ValueError, KeyError):
+            return None
+        _touch(path)
+        return posed, meta
+
+    def save_landmarks(self, video_hash, options, posed, meta):
+        secs, points = pack_landmarks(posed)
+        _atomic_write(self._landmarks_path(video_hash, options),
+                      lambda f: np.savez_compressed(f, secs=secs, points=points, meta=np.array(json.dumps(meta))))
+        self.evict()
+
+    # ---------- LRU 淘汰 ----------
+    def entries(self):
+        out = []
+        for sub in ("results", "landmarks"):
+            folder = os.path.join(self.cache_dir, sub)
+            for name in os.listdir(folder):
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(folder, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                out.append((st.st_mtime, st.st_size, path))
+        return out
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """超過 max_bytes 時刪除最久未使用的檔案，回傳刪除數"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
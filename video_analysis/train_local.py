@@ -1,13 +1,18 @@
 import os
+import sys
 import cv2
 import re
 import numpy as np
 import pandas as pd
 import mediapipe as mp
 import joblib
+import json
 from urllib.parse import urlparse, parse_qs
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import MultiLabelBinarizer
+# 取樣控制與後端共用（見 pose_backend/offline_analysis.py）
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pose_backend"))
+from offline_analysis import sampling_step, effective_fps, resize_for_inference, iter_sampled_frames
 
 # ==========================================
 # 設定
@@ -19,6 +24,17 @@ LABEL_COL = 'label'
 
 MIN_SUCCESS_RATIO = 0.20     # 至少 20% 幀成功才算有效影片
 
+# 取樣控制（None = 每幀、原始解析度）
+TARGET_FPS = None            # 目標分析幀率，例如 30；60fps 影片會每 2 幀分析 1 幀
+MAX_INFERENCE_DIM = None     # Pose 推論最大邊長，例如 640
+ANALYSIS_META_PATH = 'analysis_meta.json'  # 記錄訓練時的取樣設定，推論端沿用
+
+# 模型超參數（可用 --select 掃描後，以 model_selection.py --export 匯出更便宜的模型）
+RF_PARAMS = {
+    "n_estimators": 300,
+    "max_depth": 15,
+}
+
 
 # ==========================================
 # 判斷是否為 Bilibili 影片 ID（以 BV 開頭）
@@ -66,7 +82,9 @@ def find_video_by_id(video_id, folder):
 # 特徵萃取器（全影片）
 # ==========================================
 class DeadliftFeatureExtractor:
-    def __init__(self):
+    def __init__(self, target_fps=TARGET_FPS, max_dim=MAX_INFERENCE_DIM):
+        self.target_fps = target_fps
+        self.max_dim = max_dim
         self.pose = mp.solutions.pose.Pose(
             static_image_mode=False,
             model_complexity=2,
@@ -106,6 +124,61 @@ class DeadliftFeatureExtractor:
     # ==================================================
     # [修改重點] 優化後的特徵提取 (正規化 + 完整特徵)
     # ==================================================
+    def extract_frame_features(self, lm):
+        # 1. 計算中心點 (左右平均，增加穩定性)
+        shoulder_c = np.mean([lm['left_shoulder'], lm['right_shoulder']], axis=0)
+        hip_c = np.mean([lm['left_hip'], lm['right_hip']], axis=0)
+        knee_c = np.mean([lm['left_knee'], lm['right_knee']], axis=0)
+        ankle_c = np.mean([lm['left_ankle'], lm['right_ankle']], axis=0)
+        wrist_c = np.mean([lm['left_wrist'], lm['right_wrist']], axis=0)
+
+        # 2. [關鍵] 計算「軀幹長度」作為比例尺
+        torso_len = self.dist(shoulder_c, hip_c)
+        if torso_len == 0: torso_len = 1.0 # 避免除以 0
+
+        # 3. 角度計算 (這部分保持不變)
+        # spine_angle (耳-肩-髖): 這是最容易被"低頭"誤導的數值
+        spine_angle = self.calculate_angle(lm['left_ear'], shoulder_c, hip_c)
+        hip_angle = self.calculate_angle(shoulder_c, hip_c, knee_c)
+        knee_angle = self.calculate_angle(hip_c, knee_c, ankle_c)
+        # torso_angle (軀幹前傾角): 幫助模型判斷身體現在是站直還是彎腰
+        torso_angle = self.calculate_angle([hip_c[0], hip_c[1] - 0.5], hip_c, shoulder_c)
+
+        # 4. [修改] 距離特徵 -> 改為「比例 (Ratio)」
+        # 原本是絕對距離，現在除以 torso_len，變成相對比例
+        head_shoulder_ratio = self.dist(lm['left_ear'], shoulder_c) / torso_len
+
+        # 5. [修改] 向量特徵 -> 也要除以 torso_len
+        # 這樣不管人站遠站近，向量的大小都會一致
+        vec_sh_hip = (shoulder_c - hip_c) / torso_len
+        vec_hip_knee = (hip_c - knee_c) / torso_len
+        vec_ear_sh = (lm['left_ear'] - shoulder_c) / torso_len
+        vec_wrist_ankle = (wrist_c - ankle_c) / torso_len
+
+        # 組合特徵 (順序必須固定)
+        return [
+            spine_angle, hip_angle, knee_angle, torso_angle,
+            head_shoulder_ratio, # 這裡原本是 dist，現在是 ratio，數值意義變了，必須重新訓練模型
+            0.0, # 佔位符: 原本是 shoulder_hip_dist，但因為除以自己=1，無意義，填 0 即可
+            vec_sh_hip[0], vec_sh_hip[1],
+            vec_hip_knee[0], vec_hip_knee[1],
+            vec_ear_sh[0], vec_ear_sh[1],
+            vec_wrist_ankle[0], vec_wrist_ankle[1]
+        ]
+
+    # 單一幀：影像 → Pose → 特徵（偵測失敗回傳 None）
+    def process_frame(self, frame):
+        try:
+            rgb = cv2.cvtColor(resize_for_inference(frame, self.max_dim), cv2.COLOR_BGR2RGB)
+            results = self.pose.process(rgb)
+        except:
+            return None
+
+        lm = self.get_landmarks(results)
+        if not lm:
+            return None
+        return self.extract_frame_features(lm)
+
     def extract_features(self, video_path, start_sec=None, end_sec=None):
         if not os.path.exists(video_path):
             return None, "VideoNotFound"
@@ -137,73 +210,16 @@ class DeadliftFeatureExtractor:
             cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
         
         valid_frames = []
-        current_frame = start_frame
+        step = sampling_step(fps, self.target_fps)
+        self.last_effective_fps = effective_fps(fps, step)
         
-        print(f"   [Debug] FPS={fps:.2f}, 總幀數={total_frames}, 處理範圍={start_frame}~{end_frame}")
+        print(f"   [Debug] FPS={fps:.2f}, 分析 FPS={self.last_effective_fps:.2f}, 總幀數={total_frames}, 處理範圍={start_frame}~{end_frame}")
         
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # 檢查是否超過結束幀
-            if current_frame >= end_frame:
-                break
-            
-            current_frame += 1
-
-            # 影像處理
-            try:
-                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                results = self.pose.process(rgb)
-            except:
-                continue
-
-            lm = self.get_landmarks(results)
-            if not lm:
-                continue
-
-            # 1. 計算中心點 (左右平均，增加穩定性)
-            shoulder_c = np.mean([lm['left_shoulder'], lm['right_shoulder']], axis=0)
-            hip_c = np.mean([lm['left_hip'], lm['right_hip']], axis=0)
-            knee_c = np.mean([lm['left_knee'], lm['right_knee']], axis=0)
-            ankle_c = np.mean([lm['left_ankle'], lm['right_ankle']], axis=0)
-            wrist_c = np.mean([lm['left_wrist'], lm['right_wrist']], axis=0)
-
-            # 2. [關鍵] 計算「軀幹長度」作為比例尺
-            torso_len = self.dist(shoulder_c, hip_c)
-            if torso_len == 0: torso_len = 1.0 # 避免除以 0
-
-            # 3. 角度計算 (這部分保持不變)
-            # spine_angle (耳-肩-髖): 這是最容易被"低頭"誤導的數值
-            spine_angle = self.calculate_angle(lm['left_ear'], shoulder_c, hip_c)
-            hip_angle = self.calculate_angle(shoulder_c, hip_c, knee_c)
-            knee_angle = self.calculate_angle(hip_c, knee_c, ankle_c)
-            # torso_angle (軀幹前傾角): 幫助模型判斷身體現在是站直還是彎腰
-            torso_angle = self.calculate_angle([hip_c[0], hip_c[1] - 0.5], hip_c, shoulder_c)
-
-            # 4. [修改] 距離特徵 -> 改為「比例 (Ratio)」
-            # 原本是絕對距離，現在除以 torso_len，變成相對比例
-            head_shoulder_ratio = self.dist(lm['left_ear'], shoulder_c) / torso_len
-            
-            # 5. [修改] 向量特徵 -> 也要除以 torso_len
-            # 這樣不管人站遠站近，向量的大小都會一致
-            vec_sh_hip = (shoulder_c - hip_c) / torso_len
-            vec_hip_knee = (hip_c - knee_c) / torso_len
-            vec_ear_sh = (lm['left_ear'] - shoulder_c) / torso_len
-            vec_wrist_ankle = (wrist_c - ankle_c) / torso_len
-
-            # 組合特徵 (順序必須固定)
-            features = [
-                spine_angle, hip_angle, knee_angle, torso_angle,
-                head_shoulder_ratio, # 這裡原本是 dist，現在是 ratio，數值意義變了，必須重新訓練模型
-                0.0, # 佔位符: 原本是 shoulder_hip_dist，但因為除以自己=1，無意義，填 0 即可
-                vec_sh_hip[0], vec_sh_hip[1],
-                vec_hip_knee[0], vec_hip_knee[1],
-                vec_ear_sh[0], vec_ear_sh[1],
-                vec_wrist_ankle[0], vec_wrist_ankle[1]
-            ]
-            valid_frames.append(features)
+        # 非取樣幀只 grab()，不解碼後處理也不跑 Pose
+        for _, frame in iter_sampled_frames(cap, step, start_frame, end_frame):
+            features = self.process_frame(frame)
+            if features is not None:
+                valid_frames.append(features)
 
         cap.release()
 
@@ -211,74 +227,93 @@ class DeadliftFeatureExtractor:
             return None, "NoFeatures"
 
         # 聚合整部影片的數據
-        data = np.array(valid_frames)
-        return np.concatenate([
-            np.mean(data, axis=0),
-            np.max(data, axis=0),
-            np.min(data, axis=0),
-            np.std(data, axis=0)
-        ]), "Success"
+        return aggregate_features(valid_frames), "Success"
+
+
+# ==========================================
+# 聚合多幀特徵 → mean / max / min / std (56 維)
+# ==========================================
+def aggregate_features(frames):
+    data = np.array(frames)
+    return np.concatenate([
+        np.mean(data, axis=0),
+        np.max(data, axis=0),
+        np.min(data, axis=0),
+        np.std(data, axis=0)
+    ])
 
 
 # ==========================================
 # 訓練主程式
 # ==========================================
-if __name__ == "__main__":
+def extract_training_samples():
+    """讀取標註 → 規劃樣本 → 單次解碼萃取；回傳 (X, y_labels, fps_used)"""
+    from dataset_planner import plan_dataset, extract_planned_features
+    from window_dataset import FrameCacheWriter, FRAME_CACHE_DIR
+
     df = pd.read_csv(CSV_PATH)
     extractor = DeadliftFeatureExtractor()
 
-    X, y_raw = [], []
-
-    for idx, row in df.iterrows():
-        video_url = row[URL_COL]
-        
-        # 判斷是 Bilibili 還是 YouTube
-        if is_bilibili_id(video_url):
-            # Bilibili 格式：使用 start_seconds 和 end_seconds
-            vid = video_url
-            start_sec = row['start_seconds']
-            end_sec = row['end_seconds']
-            video_path = "dead lift data\\BV1z7411z7FK.mp4"
-            print(f"\n[{idx+1}/{len(df)}] [Bilibili] ID = {vid}, 時間範圍 = {start_sec}s ~ {end_sec}s")
-        else:
-            # YouTube 格式：video_url 是 URL，維持原本邏輯
-            vid = parse_youtube_id(video_url)
-            start_sec = None
-            end_sec = None
-            video_path = find_video_by_id(vid, VIDEO_FOLDER)
-            print(f"\n[{idx+1}/{len(df)}] [YouTube] ID = {vid}")
-
-        if not vid:
-            print(f" ✖ 無法解析影片 ID")
+    # 影片資料夾只索引一次，相同片段合併為多標籤樣本
+    plan, skipped = plan_dataset(df, VIDEO_FOLDER)
+    n_samples = sum(len(samples) for samples in plan.values())
+    print(f"📋 標註 {len(df)} 筆 → 樣本 {n_samples} 個，來源影片 {len(plan)} 部")
+    for idx, reason in skipped:
+        print(f" ✖ 第 {idx+1} 筆略過，原因 = {reason}")
+
+    X, y_labels, fps_used = [], [], []
+    # 逐幀特徵同步寫入快取，供 window_dataset.py 建立滑動視窗資料集
+    frame_cache = FrameCacheWriter(FRAME_CACHE_DIR)
+
+    for sample, frames, reason in extract_planned_features(extractor, plan):
+        desc = f"{sample['video_id']} {sample['start_sec']}s ~ {sample['end_sec']}s"
+        if frames is None:
+            print(f" ✖ 特徵提取失敗 [{desc}]，原因 = {reason}")
             continue
 
-        if not video_path:
-            print(f" ✖ 找不到影片：{vid}")
-            continue
+        X.append(aggregate_features(frames))
+        y_labels.append(sample["labels"])
+        fps_used.append(sample["effective_fps"])
+        frame_cache.append(frames, sample["labels"], video_id=sample["video_id"],
+                           start_sec=sample["start_sec"], end_sec=sample["end_sec"],
+                           effective_fps=sample["effective_fps"])
 
-        print(f" ➤ 使用影片：{video_path}")
+    frame_cache.close()
+    return X, y_labels, fps_used
 
-        feats, reason = extractor.extract_features(video_path, start_sec=start_sec, end_sec=end_sec)
-        if feats is None:
-            print(f" ✖ 特徵提取失敗，原因 = {reason}")
-            continue
 
-        X.append(feats)
-        y_raw.append(row[LABEL_COL])
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="硬舉姿勢模型訓練")
+    parser.add_argument("--from-cache", action="store_true", help="跳過影片解碼，使用 frame_cache/ 的逐幀特徵")
+    parser.add_argument("--select", action="store_true", help="掃描樹數量與深度，輸出準確率/延遲/大小報告")
+    parser.add_argument("--jobs", type=int, default=-1, help="--select 交叉驗證的平行工作數")
+    args = parser.parse_args()
+
+    if args.from_cache:
+        from model_selection import load_cached_samples
+        X, y_labels, fps_used = load_cached_samples()
+    else:
+        X, y_labels, fps_used = extract_training_samples()
 
     if len(X) == 0:
         print("\n❌ 無資料可訓練模型")
         exit()
 
     X = np.array(X)
-    labels_split = [str(l).split(';') for l in y_raw]
+
+    if args.select:
+        from model_selection import run_selection
+        run_selection(X, y_labels, n_jobs=args.jobs)
+        print("\n➡️ 選定後執行：python model_selection.py --export --candidate <id> 或 --min-f1 <門檻>")
+        exit()
 
     mlb = MultiLabelBinarizer()
-    y = mlb.fit_transform(labels_split)
+    y = mlb.fit_transform(y_labels)
 
     clf = RandomForestClassifier(
-        n_estimators=300,
-        max_depth=15,
+        n_estimators=RF_PARAMS["n_estimators"],
+        max_depth=RF_PARAMS["max_depth"],
         class_weight='balanced_subsample',
         random_state=42
     )
@@ -287,5 +322,15 @@ if __name__ == "__main__":
 
     joblib.dump(clf, "deadlift_rf_model.pkl")
     joblib.dump(mlb, "label_binarizer.pkl")
+
+    # 記錄取樣設定，讓推論端的 30 幀視窗與訓練時涵蓋相同秒數
+    with open(ANALYSIS_META_PATH, "w", encoding="utf-8") as f:
+        json.dump({
+            "target_fps": TARGET_FPS,
+            "max_dim": MAX_INFERENCE_DIM,
+            "effective_fps_median": float(np.median(fps_used)),
+            "effective_fps_min": float(np.min(fps_used)),
+            "effective_fps_max": float(np.max(fps_used)),
+        }, f, ensure_ascii=False, indent=2)
     print("\n成功提取資料筆數：", len(X))
     print("\n🎉 模型成功訓練完成！")
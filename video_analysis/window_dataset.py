@@ -0,0 +1,243 @@
+"""
+window_dataset.py
+
+滑動視窗訓練資料建構器：
+- 逐幀特徵快取 (frame cache)：train_local.py 萃取時邊做邊寫入磁碟，
+  frames.f8 為所有樣本逐幀特徵的連續 float64 陣列，可用 np.memmap 讀回；
+  samples.jsonl 為樣本索引（第一行 {"dim"}，之後每個樣本一行），每個樣本寫完就附加一行，
+  萃取中途中斷也能讀回已完成的樣本，寫入成本不隨樣本數成長
+- 視窗聚合：以 cumsum 計算 mean/std、sliding_window_view 計算 max/min，
+  一次向量化產生每個 (window, hop) 視窗的 56 維特徵，與 /predict 線上推論一致
+- 分塊寫出：每累積 chunk_rows 個視窗就寫成一組 X/Y/G .npy，大型語料不需整份放進記憶體；
+  開始寫出前清掉輸出目錄裡舊的分塊，manifest.json 每塊寫完就更新
+
+用法：
+    uv run python video_analysis/window_dataset.py --cache frame_cache --out window_dataset --window 30 --hop 5
+"""
+import os
+import re
+import json
+import tempfile
+import argparse
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from sklearn.preprocessing import MultiLabelBinarizer
+
+FRAME_FEATURE_DIM = 14
+FRAME_CACHE_DIR = 'frame_cache'
+WINDOW_DATASET_DIR = 'window_dataset'
+CHUNK_FILE = re.compile(r"^[XYG]_\d{5}\.npy$")
+
+
+def _write_json(path, obj, **kwargs):
+    """暫存檔 + os.replace：中斷時留下的是上一版完整的索引，而不是半份 JSON"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False, **kwargs)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+# ==========================================
+# 逐幀特徵快取
+# ==========================================
+class FrameCacheWriter:
+    """將每個樣本的 (n, 14) 逐幀特徵附加寫入 frames.f8，並在 samples.jsonl 附加一行樣本資訊"""
+
+    def __init__(self, cache_dir=FRAME_CACHE_DIR, dim=FRAME_FEATURE_DIM):
+        os.makedirs(cache_dir, exist_ok=True)
+        legacy = os.path.join(cache_dir, "samples.json")
+        if os.path.exists(legacy):
+            os.remove(legacy)
+        self.cache_dir = cache_dir
+        self.dim = dim
+        self.count = 0
+        self.rows = 0
+        self._fh = open(os.path.join(cache_dir, "frames.f8"), "wb")
+        self._index = open(os.path.join(cache_dir, "samples.jsonl"), "w", encoding="utf-8")
+        self._write_line({"dim": dim})
+
+    def append(self, frames, labels, **meta):
+        frames = np.ascontiguousarray(frames, dtype=np.float64)
+        self._fh.write(frames.tobytes())
+        self._fh.flush()        # 索引只指向已寫出的資料
+        self._write_line(dict(meta, labels=list(labels), offset=self.rows, length=len(frames)))
+        self.count += 1
+        self.rows += len(frames)
+
+    def _write_line(self, obj):
+        self._index.write(json.dumps(obj, ensure_ascii=False) + "\n")
+        self._index.flush()
+
+    def close(self):
+        self._fh.close()
+        self._index.close()
+
+
+def _read_index(cache_dir):
+    """回傳 (dim, samples)；中斷時最後一行可能只寫了一半，略過"""
+    path = os.path.join(cache_dir, "samples.jsonl")
+    if not os.path.exists(path):
+        # 舊版快取：單一 samples.json
+        with open(os.path.join(cache_dir, "samples.json"), encoding="utf-8") as f:
+            info = json.load(f)
+        return info["dim"], info["samples"]
+    dim, samples = FRAME_FEATURE_DIM, []
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                break
+            if i == 0:
+                dim = obj["dim"]
+            else:
+                samples.append(obj)
+    return dim, samples
+
+
+def open_frame_cache(cache_dir=FRAME_CACHE_DIR):
+    """回傳 (frames memmap (rows, dim), samples list)"""
+    dim, samples = _read_index(cache_dir)
+    rows = samples[-1]["offset"] + samples[-1]["length"] if samples else 0
+    if rows == 0:
+        return np.empty((0, dim)), samples
+    frames = np.memmap(os.path.join(cache_dir, "frames.f8"), dtype=np.float64, mode="r", shape=(rows, dim))
+    return frames, samples
+
+
+# ==========================================
+# 向量化視窗聚合
+# ==========================================
+def window_aggregates(frames, window=30, hop=1):
+    """
+    對 (n, d) 逐幀特徵產生所有視窗的 [mean, max, min, std] (n_windows, 4d)
+
+    第 i 個視窗涵蓋 frames[i*hop : i*hop + window]，與 np.std (ddof=0) 一致
+    """
+    frames = np.asarray(frames, dtype=np.float64)
+    n, d = frames.shape
+    if n < window:
+        return np.empty((0, 4 * d))
+
+    starts = np.arange(0, n - window + 1, hop)
+
+    # 先減去欄平均再累加，避免大數值 (角度 ~180°) 平方和相減的精度損失
+    offset = frames.mean(axis=0)
+    centered = frames - offset
+    csum = np.zeros((n + 1, d))
+    csum2 = np.zeros((n + 1, d))
+    np.cumsum(centered, axis=0, out=csum[1:])
+    np.cumsum(centered * centered, axis=0, out=csum2[1:])
+
+    s1 = csum[starts + window] - csum[starts]
+    s2 = csum2[starts + window] - csum2[starts]
+    mean_c = s1 / window
+    std = np.sqrt(np.clip(s2 / window - mean_c * mean_c, 0.0, None))
+
+    views = sliding_window_view(frames, window, axis=0)[::hop]   # (n_windows, d, window)
+    return np.concatenate([mean_c + offset, views.max(axis=-1), views.min(axis=-1), std], axis=1)
+
+
+# ==========================================
+# 分塊寫出視窗資料集
+# ==========================================
+class WindowDatasetWriter:
+    """累積 X (視窗特徵) / Y (多標籤) / G (來源樣本編號)，滿 chunk_rows 就寫成一組 .npy"""
+
+    def __init__(self, out_dir, classes, window, hop, chunk_rows=50000):
+        os.makedirs(out_dir, exist_ok=True)
+        # 上一次輸出的分塊可能比這次多，留著會和新的 manifest 混在一起
+        for name in os.listdir(out_dir):
+            if CHUNK_FILE.match(name) or name == "manifest.json":
+                os.remove(os.path.join(out_dir, name))
+        self.out_dir = out_dir
+        self.manifest = {"window": window, "hop": hop, "classes": list(classes), "chunks": [], "rows": 0}
+        self.chunk_rows = chunk_rows
+        self._buf = []
+        self._buf_rows = 0
+
+    def append(self, X, Y, group):
+        if len(X) == 0:
+            return
+        self._buf.append((X, Y, np.full(len(X), group, dtype=np.int32)))
+        self._buf_rows += len(X)
+        if self._buf_rows >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._buf:
+            return
+        X = np.concatenate([b[0] for b in self._buf]).astype(np.float32)
+        Y = np.concatenate([b[1] for b in self._buf]).astype(np.uint8)
+        G = np.concatenate([b[2] for b in self._buf])
+        idx = len(self.manifest["chunks"])
+        names = {k: f"{k}_{idx:05d}.npy" for k in ("X", "Y", "G")}
+        np.save(os.path.join(self.out_dir, names["X"]), X)
+        np.save(os.path.join(self.out_dir, names["Y"]), Y)
+        np.save(os.path.join(self.out_dir, names["G"]), G)
+        self.manifest["chunks"].append(dict(names, rows=len(X)))
+        self.manifest["rows"] += len(X)
+        self._buf, self._buf_rows = [], 0
+        self._write_manifest()
+
+    def _write_manifest(self):
+        _write_json(os.path.join(self.out_dir, "manifest.json"), self.manifest, indent=2)
+
+    def close(self):
+        self.flush()
+        self._write_manifest()
+        return self.manifest
+
+
+def iter_window_chunks(out_dir=WINDOW_DATASET_DIR):
+    """逐塊 yield (X, Y, G)，以 mmap 讀取"""
+    with open(os.path.join(out_dir, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    for chunk in manifest["chunks"]:
+        yield tuple(np.load(os.path.join(out_dir, chunk[k]), mmap_mode="r") for k in ("X", "Y", "G"))
+
+
+def load_window_dataset(out_dir=WINDOW_DATASET_DIR):
+    """整份載入：回傳 (X, Y, G, classes)"""
+    with open(os.path.join(out_dir, "manifest.json"), encoding="utf-8") as f:
+        classes = json.load(f)["classes"]
+    chunks = list(iter_window_chunks(out_dir))
+    if not chunks:
+        return np.empty((0, 4 * FRAME_FEATURE_DIM)), np.empty((0, len(classes))), np.empty(0), classes
+    X, Y, G = (np.concatenate([c[i] for c in chunks]) for i in range(3))
+    return X, Y, G, classes
+
+
+def build_window_dataset(cache_dir=FRAME_CACHE_DIR, out_dir=WINDOW_DATASET_DIR, window=30, hop=1, chunk_rows=50000):
+    """逐幀快取 → 視窗資料集；一次只把單一樣本的逐幀特徵讀進記憶體"""
+    frames, samples = open_frame_cache(cache_dir)
+    mlb = MultiLabelBinarizer()
+    mlb.fit([s["labels"] for s in samples])
+
+    writer = WindowDatasetWriter(out_dir, mlb.classes_, window, hop, chunk_rows)
+    for group, sample in enumerate(samples):
+        seq = np.asarray(frames[sample["offset"]:sample["offset"] + sample["length"]])
+        X = window_aggregates(seq, window, hop)
+        if len(X) == 0:
+            continue
+        Y = np.repeat(mlb.transform([sample["labels"]]), len(X), axis=0)
+        writer.append(X, Y, group)
+    return writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="逐幀特徵快取 → 滑動視窗訓練資料集")
+    parser.add_argument("--cache", default=FRAME_CACHE_DIR)
+    parser.add_argument("--out", default=WINDOW_DATASET_DIR)
+    parser.add_argument("--window", type=int, default=30)
+    parser.add_argument("--hop", type=int, default=1)
+    parser.add_argument("--chunk-rows", type=int, default=50000)
+    args = parser.parse_args()
+
+    manifest = build_window_dataset(args.cache, args.out, args.window, args.hop, args.chunk_rows)
+    print(f"✅ 視窗數 {manifest['rows']}，分塊 {len(manifest['chunks'])}，輸出至 {args.out}")